@@ -0,0 +1,230 @@
+"""
+Controle de admissão — protege a API de rotas caras sob carga.
+
+Dois mecanismos, configurados por rota ("MÉTODO /template"):
+
+  1. Portão de concorrência: no máximo N requests da rota executando ao
+     mesmo tempo, com fila limitada e tempo máximo de espera. Fila cheia
+     ou espera esgotada → 503 + Retry-After. Como cada request síncrono
+     ocupa uma thread do threadpool e uma conexão do pool do banco, limitar
+     as rotas pesadas mantém slots livres para as baratas (/health,
+     /v2/produtos/{id}), que não têm limite.
+
+  2. Token bucket por cliente (credencial ou IP): taxa sustentada + rajada.
+     Sem tokens → 429 + Retry-After.
+
+Limites padrão em LIMITES_PADRAO; sobrescreva com a variável de ambiente
+ADMISSAO_LIMITES (JSON), ex.:
+    {"GET /v1/notas": {"concorrencia": 1, "fila": 2, "taxa": 1, "rajada": 2}}
+
+O isolamento só vale se as rotas limitadas não esgotarem o pool do banco:
+a soma das concorrências, mais as threads de jobs, mais
+RESERVA_ROTAS_LIVRES conexões para as rotas sem limite, precisa caber em
+DB_POOL_SIZE + DB_MAX_OVERFLOW (app/database.py). A API registra um
+aviso na subida quando não cabe.
+
+O estado é por processo (cada worker do gunicorn tem o seu). O backend de
+buckets segue a interface de BackendMemoria para poder ser trocado por um
+armazenamento compartilhado.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.routing import compile_path
+
+
+@dataclass(frozen=True)
+class LimiteRota:
+    concorrencia: int
+    fila: int = 0
+    espera_max_s: float = 2.0
+    taxa: Optional[float] = None     # tokens por segundo, por cliente
+    rajada: Optional[int] = None     # capacidade do bucket
+    retry_after_s: int = 1
+
+
+# Soma das concorrências: 22 — cabe no pool padrão (20 + 10) com 2 threads
+# de jobs e RESERVA_ROTAS_LIVRES
+LIMITES_PADRAO: dict[str, LimiteRota] = {
+    "GET /v1/notas": LimiteRota(concorrencia=2, fila=4, taxa=2, rajada=10),
+    "GET /v2/notas": LimiteRota(concorrencia=8, fila=32),
+    "GET /v2/notas/busca": LimiteRota(concorrencia=4, fila=16, taxa=50, rajada=100),
+    "POST /v2/notas/lookup": LimiteRota(concorrencia=4, fila=16, taxa=20, rajada=40),
+    "POST /v2/notas/lote": LimiteRota(concorrencia=1, fila=4, taxa=1, rajada=5),
+    "POST /v2/jobs/export": LimiteRota(concorrencia=2, fila=8, taxa=0.2, rajada=5),
+    "POST /v2/jobs/conciliacao": LimiteRota(concorrencia=1, fila=4, taxa=0.1, rajada=2),
+}
+
+# Conexões do pool que as rotas limitadas nunca alcançam
+RESERVA_ROTAS_LIVRES = int(os.getenv("ADMISSAO_RESERVA_CONEXOES", "6"))
+
+
+class Rejeitado(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Portao:
+    """Semáforo com fila limitada; a vaga é repassada direto a quem espera."""
+
+    def __init__(self, limite: LimiteRota):
+        self.limite = limite
+        self.ativos = 0
+        self._espera: deque[asyncio.Future] = deque()
+
+    @property
+    def na_fila(self) -> int:
+        return len(self._espera)
+
+    async def entrar(self) -> bool:
+        if self.ativos < self.limite.concorrencia and not self._espera:
+            self.ativos += 1
+            return True
+        if len(self._espera) >= self.limite.fila:
+            return False
+
+        vaga = asyncio.get_running_loop().create_future()
+        self._espera.append(vaga)
+        try:
+            # asyncio.wait (e não wait_for): o cancelamento do request sempre
+            # chega aqui, mesmo que a vaga já tenha sido repassada
+            await asyncio.wait((vaga,), timeout=self.limite.espera_max_s)
+        except asyncio.CancelledError:
+            if vaga.done():
+                self.sair()  # vaga já repassada a este request: devolve
+            else:
+                vaga.cancel()
+            raise
+        finally:
+            if vaga in self._espera:
+                self._espera.remove(vaga)
+        if vaga.done():
+            return True  # `sair` repassou a vaga; `ativos` não mudou
+        vaga.cancel()  # espera esgotada; `sair` pula futures já encerrados
+        return False
+
+    def sair(self):
+        while self._espera:
+            vaga = self._espera.popleft()
+            if not vaga.done():
+                vaga.set_result(None)
+                return
+        self.ativos -= 1
+
+
+class BaldeTokens:
+    def __init__(self, capacidade: int, taxa: float, agora: float):
+        self.capacidade = capacidade
+        self.taxa = taxa
+        self.tokens = float(capacidade)
+        self.atualizado = agora
+
+    def consumir(self, agora: float) -> float:
+        """0 se consumiu um token; senão, segundos até haver um."""
+        self.tokens = min(
+            self.capacidade, self.tokens + (agora - self.atualizado) * self.taxa
+        )
+        self.atualizado = agora
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.taxa
+
+
+class BackendMemoria:
+    """Buckets em memória, com descarte LRU para limitar o número de clientes."""
+
+    def __init__(self, max_clientes: int = 10_000):
+        self.max_clientes = max_clientes
+        self._baldes: OrderedDict[str, BaldeTokens] = OrderedDict()
+        self._trava = threading.Lock()
+
+    def consumir(self, chave: str, capacidade: int, taxa: float) -> float:
+        agora = time.monotonic()
+        with self._trava:
+            balde = self._baldes.get(chave)
+            if balde is None:
+                balde = BaldeTokens(capacidade, taxa, agora)
+                self._baldes[chave] = balde
+                if len(self._baldes) > self.max_clientes:
+                    self._baldes.popitem(last=False)
+            else:
+                self._baldes.move_to_end(chave)
+            return balde.consumir(agora)
+
+
+def identificar_cliente(request: Request) -> str:
+    """Credencial quando houver (hash, nunca o token em si); senão o IP."""
+    auth = request.headers.get("Authorization")
+    if auth:
+        return "cred:" + hashlib.sha256(auth.encode()).hexdigest()[:16]
+    return "ip:" + (request.client.host if request.client else "desconhecido")
+
+
+class ControleAdmissao:
+    def __init__(self, limites: dict[str, LimiteRota], backend=None):
+        self.backend = backend or BackendMemoria()
+        self.rotas = []
+        for chave, limite in limites.items():
+            metodo, template = chave.split(" ", 1)
+            regex, _, _ = compile_path(template)
+            self.rotas.append((metodo, regex, chave, limite, Portao(limite)))
+
+    @classmethod
+    def do_ambiente(cls) -> "ControleAdmissao":
+        limites = dict(LIMITES_PADRAO)
+        for chave, valores in json.loads(os.getenv("ADMISSAO_LIMITES", "{}")).items():
+            limites[chave] = LimiteRota(**valores)
+        return cls(limites)
+
+    def conexoes_maximas(self) -> int:
+        """Conexões do banco que as rotas limitadas podem ocupar ao mesmo tempo."""
+        return sum(limite.concorrencia for _, _, _, limite, _ in self.rotas)
+
+    def _rota(self, request: Request):
+        for metodo, regex, chave, limite, portao in self.rotas:
+            if metodo == request.method and regex.match(request.url.path):
+                return chave, limite, portao
+        return None
+
+    async def admitir(self, request: Request) -> Optional[Portao]:
+        """
+        Portão ocupado pelo request (liberar com `portao.sair()`), ou None
+        se a rota não tem limite. Levanta Rejeitado quando não admitido.
+        """
+        rota = self._rota(request)
+        if rota is None:
+            return None
+        chave, limite, portao = rota
+
+        if limite.taxa:
+            espera = self.backend.consumir(
+                f"{chave}|{identificar_cliente(request)}",
+                limite.rajada or math.ceil(limite.taxa),
+                limite.taxa,
+            )
+            if espera:
+                raise Rejeitado(
+                    429,
+                    "Limite de requisições excedido para este cliente",
+                    max(1, math.ceil(espera)),
+                )
+
+        if not await portao.entrar():
+            raise Rejeitado(
+                503,
+                "Serviço sobrecarregado — tente novamente em instantes",
+                limite.retry_after_s,
+            )
+        return portao
@@ -0,0 +1,77 @@
+"""
+Verificação dos agregados de itens em notas_fiscais.
+
+Os agregados (qtd_itens, quantidade_total, produtos_distintos) são
+mantidos pelos eventos de sessão em models.py. Escritas que não passam
+pelo ORM (SQL manual, restore parcial, scripts) podem deixá-los
+divergentes; este módulo encontra e corrige a divergência:
+
+    python -m app.cli verificar-agregados            # só relata (exit 1 se divergir)
+    python -m app.cli verificar-agregados --reparar  # recalcula as divergentes
+"""
+from dataclasses import dataclass
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.engine import Engine
+
+from app.models import ItemNota, NotaFiscal, recalcular_agregados_stmt
+
+LOTE_REPARO = 1000
+
+
+@dataclass(frozen=True)
+class Divergencia:
+    nota_id: int
+    gravado: tuple[int, int, int]   # (qtd_itens, quantidade_total, produtos_distintos)
+    real: tuple[int, int, int]
+
+
+def _consulta_divergencias(limite=None):
+    itens = ItemNota.__table__
+    reais = (
+        select(
+            itens.c.nota_id,
+            func.count().label("qtd"),
+            func.sum(itens.c.quantidade).label("quantidade"),
+            func.count(func.distinct(itens.c.produto_id)).label("produtos"),
+        )
+        .group_by(itens.c.nota_id)
+        .subquery()
+    )
+    notas = NotaFiscal.__table__
+    qtd = func.coalesce(reais.c.qtd, 0)
+    quantidade = func.coalesce(reais.c.quantidade, 0)
+    produtos = func.coalesce(reais.c.produtos, 0)
+    stmt = (
+        select(
+            notas.c.id, notas.c.qtd_itens, notas.c.quantidade_total,
+            notas.c.produtos_distintos, qtd, quantidade, produtos,
+        )
+        .outerjoin(reais, reais.c.nota_id == notas.c.id)
+        .where(or_(
+            notas.c.qtd_itens != qtd,
+            notas.c.quantidade_total != quantidade,
+            notas.c.produtos_distintos != produtos,
+        ))
+        .order_by(notas.c.id)
+    )
+    return stmt.limit(limite) if limite else stmt
+
+
+def verificar_agregados(engine: Engine, reparar: bool = False,
+                        limite: int = None) -> list[Divergencia]:
+    """
+    Notas cujo resumo gravado difere de itens_nota. Com `reparar`, as
+    divergentes são recalculadas em lotes de LOTE_REPARO, um commit por lote.
+    """
+    with engine.connect() as conn:
+        divergencias = [
+            Divergencia(r[0], tuple(r[1:4]), tuple(r[4:7]))
+            for r in conn.execute(_consulta_divergencias(limite))
+        ]
+    if reparar:
+        ids = [d.nota_id for d in divergencias]
+        for i in range(0, len(ids), LOTE_REPARO):
+            with engine.begin() as conn:
+                conn.execute(recalcular_agregados_stmt(ids[i:i + LOTE_REPARO]))
+    return divergencias
@@ -0,0 +1,112 @@
+"""
+Feed de alterações — sincronização incremental de notas e produtos.
+
+Cada insert/update/delete de NotaFiscal e cada mudança de estoque/versão
+de Produto grava uma linha em `alteracoes` (ver models.py) na mesma
+transação. Consumidores guardam o último `seq` visto e pedem só o que
+mudou depois dele:
+
+    GET /v2/changes?since=0&limit=500        → página + proximo_since
+    GET /v2/changes/stream?since=<seq>       → Server-Sent Events
+
+Cada alteração traz o estado atual da entidade (`dados`, None em delete),
+carregado em lote — uma query por tipo de entidade por página.
+
+Custo na escrita: no PostgreSQL, `seq` seguir a ordem de commit sai de um
+advisory lock global (LOCK_ALTERACOES, models.py) mantido até o COMMIT.
+Escritas de nota e produto deixam de ser paralelas entre si, mesmo em
+linhas diferentes: com N workers, o throughput de escrita é o de um só.
+Medir com `python -m bench --url <api com PostgreSQL> --cenarios
+estoque_v2_paralelo --concorrencia 16` antes e depois do feed.
+"""
+import asyncio
+import json
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.models import Alteracao, NotaFiscal, Produto
+from app.schemas import NotaFiscalResponse, ProdutoResponse
+
+ENTIDADES = {
+    "nota": (NotaFiscal, NotaFiscalResponse),
+    "produto": (Produto, ProdutoResponse),
+}
+
+SSE_INTERVALO_S = 1.0
+SSE_HEARTBEAT_S = 15.0
+SSE_DURACAO_MAX_S = 300.0  # o cliente reconecta com Last-Event-ID
+
+
+def listar_alteracoes(db: Session, since: int, limit: int,
+                      entidade: Optional[str] = None) -> tuple[list[dict], int, bool]:
+    """(alterações com `dados`, proximo_since, tem_mais)."""
+    query = select(Alteracao).where(Alteracao.seq > since)
+    if entidade:
+        query = query.where(Alteracao.entidade == entidade)
+    linhas = db.scalars(query.order_by(Alteracao.seq).limit(limit + 1)).all()
+    tem_mais = len(linhas) > limit
+    linhas = linhas[:limit]
+
+    atuais = {}
+    for nome, (modelo, schema) in ENTIDADES.items():
+        ids = {a.entidade_id for a in linhas if a.entidade == nome and a.operacao != "delete"}
+        if ids:
+            for obj in db.scalars(select(modelo).where(modelo.id.in_(ids))):
+                atuais[nome, obj.id] = schema.model_validate(obj).model_dump(mode="json")
+
+    alteracoes = [
+        {
+            "seq": a.seq,
+            "entidade": a.entidade,
+            "entidade_id": a.entidade_id,
+            "operacao": a.operacao,
+            "versao": a.versao,
+            "registrado_em": a.registrado_em,
+            # None também se a entidade foi removida depois desta alteração
+            "dados": atuais.get((a.entidade, a.entidade_id)),
+        }
+        for a in linhas
+    ]
+    return alteracoes, (linhas[-1].seq if linhas else since), tem_mais
+
+
+def _consultar(db: Session, since: int, entidade: Optional[str]):
+    try:
+        return listar_alteracoes(db, since, 500, entidade)
+    finally:
+        db.rollback()  # só leitura: devolve a conexão ao pool entre polls
+
+
+async def eventos_sse(abrir_sessao: Callable[[], Session], since: int,
+                      entidade: Optional[str] = None):
+    """
+    Gerador de Server-Sent Events: `id` = seq (o navegador reenvia como
+    Last-Event-ID ao reconectar). Consulta a cada SSE_INTERVALO_S enquanto
+    não há novidades e encerra após SSE_DURACAO_MAX_S.
+
+    A sessão é do gerador (`abrir_sessao`), não da dependency do endpoint:
+    esta já foi fechada quando o corpo começa a ser enviado.
+    """
+    fim = time.monotonic() + SSE_DURACAO_MAX_S
+    ultimo_envio = time.monotonic()
+    db = abrir_sessao()
+    try:
+        yield "retry: 2000\n\n"
+        while time.monotonic() < fim:
+            alteracoes, since, tem_mais = await run_in_threadpool(_consultar, db, since, entidade)
+            for a in alteracoes:
+                dados = json.dumps(a, default=str, ensure_ascii=False)
+                yield f"id: {a['seq']}\nevent: alteracao\ndata: {dados}\n\n"
+            if alteracoes:
+                ultimo_envio = time.monotonic()
+            elif time.monotonic() - ultimo_envio >= SSE_HEARTBEAT_S:
+                yield ": ping\n\n"  # mantém proxies/LB sem fechar a conexão ociosa
+                ultimo_envio = time.monotonic()
+            if not tem_mais:
+                await asyncio.sleep(SSE_INTERVALO_S)
+    finally:
+        db.close()
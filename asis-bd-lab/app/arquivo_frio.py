@@ -0,0 +1,346 @@
+"""
+Arquivo frio de notas em Parquet — tira do banco OLTP o que só é consultado
+em relatórios e buscas históricas.
+
+    python -m app.cli arquivar-notas --reter-meses 24 [--dry-run]
+
+Notas com data_emissao anterior ao corte (com os itens, aninhados na
+própria linha) são gravadas em ARQUIVO_DIR/notas, particionadas no estilo
+hive por mês e emitente, comprimidas com zstd:
+
+    notas/ano_mes=2023-04/emitente_cnpj=11222333000181/notas-<ids>-0.parquet
+
+e só então removidas de notas_fiscais/itens_nota — com um `delete` por nota
+no feed de alterações, na mesma transação. Cada lote fica anotado em
+ARQUIVO_DIR/pendente.json de antes de gravar até o DELETE confirmar. Se o
+processo cair no meio, a próxima execução resolve esse lote antes de
+qualquer outro: com as notas ainda no banco, descarta os arquivos dele (a
+nota vale a do banco); já apagadas, só tira a anotação. Assim um novo
+corte (ou um banco que mudou desde a queda) não grava as mesmas notas
+de novo em outros arquivos.
+
+Leitura: `buscar` e `totais_por_emitente` varrem o dataset com os arquivos
+mapeados em memória. Meses e emitentes fora do filtro nem são abertos
+(poda de partição); nos demais, os filtros descem até os row groups
+(estatísticas min/max do Parquet). /v2/notas/busca e
+/v2/relatorios/emitentes mesclam esse resultado com o banco; o export
+(app/jobs.py) e a conciliação (app/conciliacao.py) cobrem só o banco.
+
+pyarrow só é importado quando o arquivo é usado.
+"""
+import contextlib
+import glob
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional, Sequence
+
+from sqlalchemy import delete, select
+from sqlalchemy.engine import Engine
+
+from app.models import ItemNota, NotaFiscal, registrar_alteracoes
+
+ARQUIVO_LOTE = 50_000
+COLUNAS_NOTA = [
+    "id", "numero", "serie", "emitente_cnpj", "destinatario_cnpj", "valor_total",
+    "status", "data_emissao", "observacao", "qtd_itens", "quantidade_total",
+    "produtos_distintos",
+]
+COLUNAS_ITEM = ["id", "produto_id", "quantidade", "valor_unitario", "valor_total"]
+
+
+@dataclass(frozen=True)
+class ResumoArquivamento:
+    notas: int
+    itens: int
+    arquivos: int
+
+
+def _schema():
+    import pyarrow as pa
+
+    item = pa.struct([
+        ("id", pa.int64()), ("produto_id", pa.int64()), ("quantidade", pa.int64()),
+        ("valor_unitario", pa.float64()), ("valor_total", pa.float64()),
+    ])
+    return pa.schema([
+        ("id", pa.int64()), ("numero", pa.string()), ("serie", pa.string()),
+        ("emitente_cnpj", pa.string()), ("destinatario_cnpj", pa.string()),
+        ("valor_total", pa.float64()), ("status", pa.string()),
+        ("data_emissao", pa.timestamp("us")), ("observacao", pa.string()),
+        ("qtd_itens", pa.int64()), ("quantidade_total", pa.int64()),
+        ("produtos_distintos", pa.int64()), ("itens", pa.list_(item)),
+        ("ano_mes", pa.string()),
+    ])
+
+
+def _nome_lote(ids: list[int]) -> str:
+    return f"notas-{ids[0]}-{ids[-1]}"
+
+
+def _particionamento(*campos: str):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    # Explícito: inferido, o CNPJ viraria inteiro e perderia zeros à esquerda
+    return ds.partitioning(pa.schema([(c, pa.string()) for c in campos]), flavor="hive")
+
+
+class ArquivoFrio:
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        self.raiz = os.path.join(diretorio, "notas")
+
+    @classmethod
+    def do_ambiente(cls) -> "ArquivoFrio":
+        return cls(os.getenv("ARQUIVO_DIR", "./arquivo_frio"))
+
+    @property
+    def ativo(self) -> bool:
+        return bool(self._meses())
+
+    def _meses(self) -> list[str]:
+        """Partições de mês existentes, da mais recente para a mais antiga."""
+        if not os.path.isdir(self.raiz):
+            return []
+        return sorted(
+            (d.split("=", 1)[1] for d in os.listdir(self.raiz) if d.startswith("ano_mes=")),
+            reverse=True,
+        )
+
+    # ─── Escrita ────────────────────────────────────────
+
+    @property
+    def _pendente(self) -> str:
+        return os.path.join(self.diretorio, "pendente.json")
+
+    def ids_pendentes(self) -> list[int]:
+        """Ids do lote gravado (ou sendo gravado) e ainda não apagado do banco."""
+        try:
+            with open(self._pendente) as f:
+                return json.load(f)["ids"]
+        except FileNotFoundError:
+            return []
+
+    def _marcar_pendente(self, ids: list[int]):
+        os.makedirs(self.diretorio, exist_ok=True)
+        temporario = self._pendente + ".tmp"
+        with open(temporario, "w") as f:
+            json.dump({"ids": ids}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self._pendente)
+
+    def _concluir_pendente(self, engine: Engine):
+        """Resolve o lote de uma execução que caiu entre gravar e apagar."""
+        ids = self.ids_pendentes()
+        if not ids:
+            return
+        notas_t = NotaFiscal.__table__
+        with engine.connect() as conn:
+            no_banco = conn.scalar(select(notas_t.c.id).where(notas_t.c.id.in_(ids)).limit(1))
+        if no_banco is not None:  # o DELETE é atômico: não confirmou, o banco vale
+            for caminho in glob.glob(os.path.join(self.raiz, "*", "*", f"{_nome_lote(ids)}-*")):
+                os.remove(caminho)
+                with contextlib.suppress(OSError):  # só sai a partição que ficou vazia
+                    os.removedirs(os.path.dirname(caminho))
+        os.remove(self._pendente)
+
+    def arquivar(self, engine: Engine, corte: datetime, executar: bool = True) -> ResumoArquivamento:
+        """Move notas com data_emissao < corte para o arquivo, em lotes de ARQUIVO_LOTE."""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        if executar:
+            self._concluir_pendente(engine)
+        notas_t, itens_t = NotaFiscal.__table__, ItemNota.__table__
+        total_notas = total_itens = arquivos = 0
+        ultimo_id = 0
+        while True:
+            with engine.connect() as conn:
+                notas = conn.execute(
+                    select(*(notas_t.c[c] for c in COLUNAS_NOTA))
+                    .where(notas_t.c.data_emissao < corte, notas_t.c.id > ultimo_id)
+                    .order_by(notas_t.c.id)
+                    .limit(ARQUIVO_LOTE)
+                ).mappings().all()
+                if not notas:
+                    break
+                ids = [n["id"] for n in notas]
+                itens_por_nota: dict[int, list] = {}
+                for item in conn.execute(
+                    select(itens_t.c.nota_id, *(itens_t.c[c] for c in COLUNAS_ITEM))
+                    .where(itens_t.c.nota_id.in_(ids))
+                    .order_by(itens_t.c.nota_id, itens_t.c.id)
+                ).mappings():
+                    itens_por_nota.setdefault(item["nota_id"], []).append(
+                        {c: item[c] for c in COLUNAS_ITEM}
+                    )
+            ultimo_id = ids[-1]
+            total_notas += len(ids)
+            total_itens += sum(len(v) for v in itens_por_nota.values())
+            if not executar:
+                continue
+
+            tabela = pa.Table.from_pylist([
+                {**n, "itens": itens_por_nota.get(n["id"], []),
+                 "ano_mes": n["data_emissao"].strftime("%Y-%m")}
+                for n in notas
+            ], schema=_schema())
+            escritos = []
+            self._marcar_pendente(ids)
+            ds.write_dataset(
+                tabela, self.raiz, format="parquet",
+                partitioning=_particionamento("ano_mes", "emitente_cnpj"),
+                basename_template=f"{_nome_lote(ids)}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+                file_visitor=lambda f: escritos.append(f.path),
+            )
+            for caminho in escritos:  # durável antes de apagar do banco
+                with open(caminho, "rb") as f:
+                    os.fsync(f.fileno())
+            arquivos += len(escritos)
+
+            with engine.begin() as conn:
+                conn.execute(delete(itens_t).where(itens_t.c.nota_id.in_(ids)))
+                conn.execute(delete(notas_t).where(notas_t.c.id.in_(ids)))
+                # Core não passa pelo after_flush: o feed fica sabendo daqui
+                registrar_alteracoes(conn, [
+                    {"entidade": "nota", "entidade_id": i, "operacao": "delete"} for i in ids
+                ])
+            os.remove(self._pendente)
+        return ResumoArquivamento(total_notas, total_itens, arquivos)
+
+    # ─── Leitura ────────────────────────────────────────
+
+    def _dataset(self, mes: str):
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        return ds.dataset(
+            os.path.join(self.raiz, f"ano_mes={mes}"), format="parquet",
+            partitioning=_particionamento("emitente_cnpj"),
+            filesystem=fs.LocalFileSystem(use_mmap=True),
+        )
+
+    @staticmethod
+    def _filtro(cnpj=None, emitente_cnpj=None, destinatario_cnpj=None, status=None,
+                data_inicio=None, data_fim=None, valor_min=None, valor_max=None,
+                apos: Optional[tuple[datetime, int]] = None):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        campo = ds.field
+
+        def data(d):
+            return pa.scalar(d, pa.timestamp("us"))
+
+        condicoes = []
+        if cnpj:
+            condicoes.append((campo("emitente_cnpj") == cnpj) | (campo("destinatario_cnpj") == cnpj))
+        if emitente_cnpj:
+            condicoes.append(campo("emitente_cnpj") == emitente_cnpj)
+        if destinatario_cnpj:
+            condicoes.append(campo("destinatario_cnpj") == destinatario_cnpj)
+        if status:
+            condicoes.append(campo("status") == status)
+        if data_inicio:
+            condicoes.append(campo("data_emissao") >= data(data_inicio))
+        if data_fim:
+            condicoes.append(campo("data_emissao") < data(data_fim))
+        if valor_min is not None:
+            condicoes.append(campo("valor_total") >= valor_min)
+        if valor_max is not None:
+            condicoes.append(campo("valor_total") <= valor_max)
+        if apos:  # cursor keyset: (data_emissao, id) < apos
+            condicoes.append(
+                (campo("data_emissao") < data(apos[0]))
+                | ((campo("data_emissao") == data(apos[0])) & (campo("id") < apos[1]))
+            )
+        filtro = None
+        for c in condicoes:
+            filtro = c if filtro is None else filtro & c
+        return filtro
+
+    def _meses_no_intervalo(self, data_inicio=None, data_fim=None, apos=None) -> list[str]:
+        limite_sup = min(
+            (d for d in (data_fim, apos[0] if apos else None) if d), default=None
+        )
+        return [
+            m for m in self._meses()
+            if (not data_inicio or m >= data_inicio.strftime("%Y-%m"))
+            and (not limite_sup or m <= limite_sup.strftime("%Y-%m"))
+        ]
+
+    def buscar(self, *, limit: int, apos: Optional[tuple[datetime, int]] = None,
+               colunas: Optional[list[str]] = None, **filtros) -> list[SimpleNamespace]:
+        """
+        Até `limit` notas arquivadas na ordem da busca (data_emissao, id)
+        decrescente, após o cursor `apos`. Varre um mês por vez, do mais
+        recente, e para assim que o mês completa a página.
+        """
+        import pyarrow as pa
+
+        colunas = colunas or [c for c in COLUNAS_NOTA if c != "observacao"]
+        colunas = list(dict.fromkeys(["id", "data_emissao", *colunas]))  # chave de ordenação
+        filtro = self._filtro(apos=apos, **filtros)
+        partes, encontradas = [], 0
+        for mes in self._meses_no_intervalo(filtros.get("data_inicio"), filtros.get("data_fim"), apos):
+            tabela = self._dataset(mes).to_table(columns=colunas, filter=filtro)
+            if tabela.num_rows:
+                partes.append(tabela)
+                encontradas += tabela.num_rows
+            if encontradas >= limit:
+                break  # meses seguintes são todos mais antigos
+        if not partes:
+            return []
+        tabela = pa.concat_tables(partes).sort_by(
+            [("data_emissao", "descending"), ("id", "descending")]
+        ).slice(0, limit)
+        return [SimpleNamespace(**linha) for linha in tabela.to_pylist()]
+
+    def totais_por_emitente(self, data_inicio=None, data_fim=None,
+                            excluir_ids: Sequence[int] = ()) -> dict[str, tuple[int, float]]:
+        """
+        {emitente_cnpj: (notas, soma de valor_total)} no arquivo, sem as
+        notas de `excluir_ids` — as que ainda estão no banco, que valem mais.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        filtro = self._filtro(data_inicio=data_inicio, data_fim=data_fim)
+        if excluir_ids:
+            fora = ~ds.field("id").isin(list(excluir_ids))
+            filtro = fora if filtro is None else filtro & fora
+        partes = [
+            self._dataset(mes).to_table(columns=["emitente_cnpj", "valor_total"], filter=filtro)
+            for mes in self._meses_no_intervalo(data_inicio, data_fim)
+        ]
+        if not partes:
+            return {}
+        agregado = pa.concat_tables(partes).group_by("emitente_cnpj").aggregate(
+            [("valor_total", "count"), ("valor_total", "sum")]
+        ).to_pydict()
+        return {
+            cnpj: (qtd, soma) for cnpj, qtd, soma in zip(
+                agregado["emitente_cnpj"], agregado["valor_total_count"], agregado["valor_total_sum"],
+            )
+        }
+
+
+def mesclar_pagina(vivas: list, proximo_vivo: Optional[str], arquivadas: list,
+                   limit: int) -> tuple[list, bool]:
+    """
+    Intercala a página do banco com a do arquivo na ordem da busca.
+    Uma nota nos dois lados (queda entre gravar e apagar) vale a do banco.
+    Retorna (página, há mais páginas).
+    """
+    por_id = {n.id: n for n in arquivadas}
+    por_id.update({n.id: n for n in vivas})
+    todas = sorted(por_id.values(), key=lambda n: (n.data_emissao, n.id), reverse=True)
+    mais = proximo_vivo is not None or len(arquivadas) > limit or len(todas) > limit
+    return todas[:limit], mais
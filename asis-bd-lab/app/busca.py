@@ -0,0 +1,222 @@
+"""
+Busca de notas fiscais — filtros combinados com paginação keyset.
+
+Substitui o antigo `buscar_notas_v2` (só CNPJ do emitente, sem limite).
+A paginação é por cursor sobre (data_emissao, id) em ordem decrescente:
+cada página é um range scan no índice composto, sem OFFSET — o custo da
+página 1000 é o mesmo da página 1. `data_emissao` é anulável no modelo
+(a API sempre preenche); notas sem data ficam fora dessa busca — NULL não
+tem lugar na ordem da chave e cada banco o ordena de um jeito.
+
+Com `q`, a busca é textual sobre `observacao` e ordenada por relevância:
+PostgreSQL usa o índice GIN de tsvector, SQLite (testes) a tabela FTS5.
+"""
+import base64
+import binascii
+import re
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import tuple_, func, literal_column, table, column
+from sqlalchemy.orm import Session
+
+from app.models import NotaFiscal, TS_CONFIG, TSVECTOR_OBSERVACAO, NOTAS_FTS
+
+
+class CursorInvalido(ValueError):
+    """Cursor de paginação malformado ou adulterado."""
+
+
+def codificar_cursor(nota: NotaFiscal) -> str:
+    """Cursor opaco com a chave de ordenação da última nota da página."""
+    bruto = f"{nota.data_emissao.isoformat()}|{nota.id}"
+    return base64.urlsafe_b64encode(bruto.encode()).decode()
+
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor.encode()).decode()
+        data, nota_id = bruto.split("|")
+        return datetime.fromisoformat(data), int(nota_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise CursorInvalido("Cursor de paginação inválido") from e
+
+
+def codificar_cursor_ranking(offset: int) -> str:
+    """Cursor da busca textual: posição no ranking de relevância."""
+    return base64.urlsafe_b64encode(f"rank|{offset}".encode()).decode()
+
+
+def decodificar_cursor_ranking(cursor: str) -> int:
+    try:
+        tipo, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        if tipo != "rank" or int(offset) < 0:
+            raise ValueError(tipo)
+        return int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise CursorInvalido("Cursor de paginação inválido") from e
+
+
+def termos_busca(q: str) -> list[str]:
+    """Palavras da consulta; pontuação e operadores são descartados."""
+    return re.findall(r"\w+", q)
+
+
+def _chave(nota: NotaFiscal):
+    return (nota.data_emissao, nota.id)
+
+
+def filtros_notas(
+    *,
+    cnpj: Optional[str] = None,
+    emitente_cnpj: Optional[str] = None,
+    destinatario_cnpj: Optional[str] = None,
+    status: Optional[str] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    valor_min: Optional[float] = None,
+    valor_max: Optional[float] = None,
+) -> list:
+    """Condições WHERE dos filtros da busca; o export (app/jobs.py) usa as mesmas."""
+    filtros = []
+    if cnpj:
+        filtros.append(
+            (NotaFiscal.emitente_cnpj == cnpj)
+            | (NotaFiscal.destinatario_cnpj == cnpj)
+        )
+    if emitente_cnpj:
+        filtros.append(NotaFiscal.emitente_cnpj == emitente_cnpj)
+    if destinatario_cnpj:
+        filtros.append(NotaFiscal.destinatario_cnpj == destinatario_cnpj)
+    if status:
+        filtros.append(NotaFiscal.status == status)
+    if data_inicio:
+        filtros.append(NotaFiscal.data_emissao >= data_inicio)
+    if data_fim:
+        filtros.append(NotaFiscal.data_emissao < data_fim)
+    if valor_min is not None:
+        filtros.append(NotaFiscal.valor_total >= valor_min)
+    if valor_max is not None:
+        filtros.append(NotaFiscal.valor_total <= valor_max)
+    return filtros
+
+
+def buscar_notas(
+    db: Session,
+    *,
+    cnpj: Optional[str] = None,
+    emitente_cnpj: Optional[str] = None,
+    destinatario_cnpj: Optional[str] = None,
+    status: Optional[str] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    valor_min: Optional[float] = None,
+    valor_max: Optional[float] = None,
+    q: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> tuple[list[NotaFiscal], Optional[str]]:
+    """
+    Retorna (notas da página, cursor da próxima página ou None).
+
+    `cnpj` casa com emitente OU destinatário. Um `OR` entre duas colunas
+    impede o uso de um único índice, então a busca é planejada como dois
+    ramos — um por índice (emitente_cnpj, data_emissao, id) e
+    (destinatario_cnpj, data_emissao, id) — cada um limitado a `limit + 1`
+    linhas, intercalados em memória. Nunca lê mais que 2 × (limit + 1)
+    linhas, independente do volume do CNPJ.
+
+    Com `q`, todas as palavras precisam aparecer em `observacao`; o
+    resultado vem do mais relevante para o menos relevante.
+    """
+    comuns = dict(
+        emitente_cnpj=emitente_cnpj,
+        destinatario_cnpj=destinatario_cnpj,
+        status=status,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+        valor_min=valor_min,
+        valor_max=valor_max,
+    )
+    if q is not None:
+        return _buscar_por_texto(db, q, filtros_notas(cnpj=cnpj, **comuns), limit, cursor)
+
+    filtros = filtros_notas(**comuns)  # cnpj vira ramos, abaixo
+    # Chave do cursor sempre completa: mesma ordem no SQLite e no PostgreSQL
+    filtros.append(NotaFiscal.data_emissao.isnot(None))
+    if cursor:
+        filtros.append(
+            tuple_(NotaFiscal.data_emissao, NotaFiscal.id)
+            < decodificar_cursor(cursor)
+        )
+
+    if cnpj:
+        ramos = [
+            NotaFiscal.emitente_cnpj == cnpj,
+            NotaFiscal.destinatario_cnpj == cnpj,
+        ]
+    else:
+        ramos = [None]
+
+    candidatas: dict[int, NotaFiscal] = {}
+    for ramo in ramos:
+        query = db.query(NotaFiscal).filter(*filtros)
+        if ramo is not None:
+            query = query.filter(ramo)
+        for nota in (
+            query
+            .order_by(NotaFiscal.data_emissao.desc(), NotaFiscal.id.desc())
+            .limit(limit + 1)
+        ):
+            candidatas[nota.id] = nota
+
+    notas = sorted(candidatas.values(), key=_chave, reverse=True)[: limit + 1]
+
+    if len(notas) > limit:
+        notas = notas[:limit]
+        return notas, codificar_cursor(notas[-1])
+    return notas, None
+
+
+def _buscar_por_texto(
+    db: Session,
+    q: str,
+    filtros: list,
+    limit: int,
+    cursor: Optional[str],
+) -> tuple[list[NotaFiscal], Optional[str]]:
+    """Busca textual ranqueada; o índice textual restringe, os filtros refinam."""
+    offset = decodificar_cursor_ranking(cursor) if cursor else 0
+    termos = termos_busca(q)
+    if not termos:
+        return [], None
+
+    query = db.query(NotaFiscal).filter(*filtros)
+    if db.get_bind().dialect.name == "postgresql":
+        consulta = func.plainto_tsquery(TS_CONFIG, " ".join(termos))
+        query = (
+            query
+            .filter(TSVECTOR_OBSERVACAO.op("@@")(consulta))
+            .order_by(func.ts_rank(TSVECTOR_OBSERVACAO, consulta).desc())
+        )
+    else:
+        fts = table(NOTAS_FTS, column("rowid"), column("rank"))
+        # Cada termo entre aspas: operadores do FTS5 viram texto literal
+        consulta = " ".join('"%s"' % t for t in termos)
+        query = (
+            query
+            .join(fts, fts.c.rowid == NotaFiscal.id)
+            .filter(literal_column(NOTAS_FTS).match(consulta))
+            .order_by(fts.c.rank)  # bm25: menor = mais relevante
+        )
+
+    notas = (
+        query
+        .order_by(NotaFiscal.id.desc())
+        .offset(offset)
+        .limit(limit + 1)
+        .all()
+    )
+    if len(notas) > limit:
+        return notas[:limit], codificar_cursor_ranking(offset + limit)
+    return notas, None
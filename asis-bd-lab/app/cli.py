@@ -0,0 +1,194 @@
+"""
+Comandos de manutenção do lab ASIS TaxTech.
+
+Uso (a partir de asis-bd-lab/):
+    python -m app.cli migrar
+    python -m app.cli seed
+    python -m app.cli particoes converter [--meses-futuros 3]
+    python -m app.cli particoes criar [--meses-futuros 3]
+    python -m app.cli particoes arquivar --reter-meses 24 [--dry-run]
+    python -m app.cli jobs [--uma-vez]
+    python -m app.cli verificar-agregados [--reparar]
+    python -m app.cli limpar-idempotencia
+    python -m app.cli conciliar-totais [--relatorio conciliacao.csv] [--recomecar]
+    python -m app.cli arquivar-notas --reter-meses 24 [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+
+from app.database import engine
+
+
+def cmd_migrar(args) -> int:
+    from app.migracoes import migrar
+
+    executados = migrar(engine)
+    print("\n".join(executados) or "Schema já está atualizado")
+    return 0
+
+
+def cmd_seed(args) -> int:
+    from app.seed import seed_database
+
+    seed_database()
+    return 0
+
+
+def cmd_particoes(args) -> int:
+    from app import particionamento as part
+
+    try:
+        if args.acao == "converter":
+            criadas = part.converter_para_particionada(engine, args.meses_futuros)
+            print(f"notas_fiscais particionada: {len(criadas)} partições criadas")
+        elif args.acao == "criar":
+            criadas = part.criar_particoes_futuras(engine, args.meses_futuros)
+            print("\n".join(criadas) or "Nenhuma partição nova necessária")
+        elif args.acao == "arquivar":
+            alvo = part.arquivar_particoes(
+                engine, args.reter_meses, executar=not args.dry_run
+            )
+            prefixo = "Seriam desanexadas" if args.dry_run else "Desanexadas"
+            print(f"{prefixo}: {', '.join(p.nome for p in alvo) or 'nenhuma'}")
+    except part.ParticionamentoIndisponivel as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_jobs(args) -> int:
+    from app.database import SessionLocal
+    from app.jobs import GerenciadorJobs
+
+    gerenciador = GerenciadorJobs.do_ambiente(SessionLocal)
+    if args.uma_vez:
+        print(f"{gerenciador.executar_pendentes()} jobs executados")
+        return 0
+    gerenciador.workers = max(gerenciador.workers, 1)
+    gerenciador.iniciar()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        gerenciador.parar()
+    return 0
+
+
+def cmd_verificar_agregados(args) -> int:
+    from app.agregados import verificar_agregados
+
+    divergencias = verificar_agregados(engine, reparar=args.reparar)
+    for d in divergencias[:20]:
+        print(f"nota {d.nota_id}: gravado {d.gravado}, real {d.real}")
+    if len(divergencias) > 20:
+        print(f"... e mais {len(divergencias) - 20}")
+    if not divergencias:
+        print("Agregados consistentes")
+        return 0
+    if args.reparar:
+        print(f"{len(divergencias)} notas recalculadas")
+        return 0
+    print(f"{len(divergencias)} notas divergentes (use --reparar)")
+    return 1
+
+
+def cmd_limpar_idempotencia(args) -> int:
+    from app.idempotencia import limpar_expiradas
+
+    print(f"{limpar_expiradas(engine)} chaves de idempotência expiradas removidas")
+    return 0
+
+
+def cmd_conciliar_totais(args) -> int:
+    from app.conciliacao import conciliar_totais, gravar_checkpoint, ler_checkpoint
+    from app.database import SessionLocal
+
+    caminho_ck = args.relatorio + ".checkpoint.json"
+    checkpoint = None if args.recomecar else ler_checkpoint(caminho_ck)
+    if checkpoint:
+        print(f"Retomando após a nota {checkpoint['ultimo_id']} ({checkpoint['notas']} já conciliadas)")
+
+    def ao_concluir_lote(ck, total):
+        gravar_checkpoint(caminho_ck, ck)
+        print(f"{ck['notas']}/{total} notas, {ck['divergentes']} divergentes", flush=True)
+
+    ck = conciliar_totais(SessionLocal, args.relatorio, checkpoint, ao_concluir_lote)
+    if os.path.exists(caminho_ck):
+        os.remove(caminho_ck)  # concluída: a próxima execução começa do zero
+    print(f"{ck['notas']} notas e {ck['itens']} itens conciliados; "
+          f"{ck['divergentes']} divergentes em {args.relatorio}")
+    if ck["itens_orfaos"]:
+        print(f"{ck['itens_orfaos']} itens sem nota correspondente")
+    return 1 if ck["divergentes"] else 0
+
+
+def cmd_arquivar_notas(args) -> int:
+    from datetime import date, datetime
+
+    from app.arquivo_frio import ArquivoFrio
+    from app.particionamento import primeiro_dia, somar_meses
+
+    corte = somar_meses(primeiro_dia(date.today()), -args.reter_meses)
+    arquivo = ArquivoFrio.do_ambiente()
+    resumo = arquivo.arquivar(engine, datetime.combine(corte, datetime.min.time()),
+                              executar=not args.dry_run)
+    prefixo = "Seriam arquivadas" if args.dry_run else "Arquivadas"
+    print(f"{prefixo}: {resumo.notas} notas e {resumo.itens} itens anteriores a {corte}"
+          + ("" if args.dry_run else f" ({resumo.arquivos} arquivos em {arquivo.raiz})"))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("migrar", help="Cria/atualiza tabelas, índices e passos de migração")
+    p.set_defaults(func=cmd_migrar)
+
+    p = sub.add_parser("seed", help="Popula dados fictícios (se o banco estiver vazio)")
+    p.set_defaults(func=cmd_seed)
+
+    p = sub.add_parser("particoes", help="Particionamento mensal de notas_fiscais")
+    p.add_argument("acao", choices=["converter", "criar", "arquivar"])
+    p.add_argument("--meses-futuros", type=int, default=3)
+    p.add_argument("--reter-meses", type=int, default=24)
+    p.add_argument("--dry-run", action="store_true",
+                   help="arquivar: apenas lista as partições que seriam desanexadas")
+    p.set_defaults(func=cmd_particoes)
+
+    p = sub.add_parser("jobs", help="Processa a fila de jobs fora da API")
+    p.add_argument("--uma-vez", action="store_true",
+                   help="Esvazia a fila e sai (em vez de ficar escutando)")
+    p.set_defaults(func=cmd_jobs)
+
+    p = sub.add_parser("verificar-agregados",
+                       help="Compara o resumo de itens das notas com itens_nota")
+    p.add_argument("--reparar", action="store_true", help="Recalcula as notas divergentes")
+    p.set_defaults(func=cmd_verificar_agregados)
+
+    p = sub.add_parser("limpar-idempotencia",
+                       help="Remove respostas de Idempotency-Key além do TTL (agendar diariamente)")
+    p.set_defaults(func=cmd_limpar_idempotencia)
+
+    p = sub.add_parser("conciliar-totais",
+                       help="Relata notas cujo valor_total difere da soma dos itens (exit 1 se houver)")
+    p.add_argument("--relatorio", default="conciliacao.csv")
+    p.add_argument("--recomecar", action="store_true",
+                   help="Ignora o checkpoint e começa do zero")
+    p.set_defaults(func=cmd_conciliar_totais)
+
+    p = sub.add_parser("arquivar-notas",
+                       help="Move notas antigas para o arquivo frio em Parquet (ARQUIVO_DIR)")
+    p.add_argument("--reter-meses", type=int, default=24)
+    p.add_argument("--dry-run", action="store_true",
+                   help="Apenas conta as notas que seriam arquivadas")
+    p.set_defaults(func=cmd_arquivar_notas)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
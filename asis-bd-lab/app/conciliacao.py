@@ -0,0 +1,134 @@
+"""
+Conciliação de totais: notas_fiscais.valor_total x soma de itens_nota.
+
+    python -m app.cli conciliar-totais --relatorio conciliacao.csv
+    POST /v2/jobs/conciliacao   (mesmo processamento, como job)
+
+Nada de `for nota in notas: sum(nota.itens)` — esse é o N+1 do
+/v1/notas. As duas tabelas são lidas em faixas de id crescente:
+
+  1. LOTE_CONCILIACAO notas (id, valor_total) a partir do último id visto
+  2. os itens (nota_id, valor_total) da mesma faixa de nota_id — range
+     scan no índice ix_itens_nota_valor, sem tocar a tabela
+  3. soma por nota com NumPy (searchsorted + bincount) e comparação com
+     o total, com tolerância de um centavo
+
+A memória é limitada pelo lote, não pelo tamanho das tabelas. Cada lote
+acrescenta as divergências ao relatório CSV e devolve um checkpoint
+(último id + bytes do relatório): a retomada trunca o arquivo nesse ponto
+e continua da nota seguinte.
+
+Só o banco: notas movidas para o arquivo frio (app/arquivo_frio.py) ficam
+de fora — o arquivo é somente leitura, concilie antes de arquivar.
+"""
+import json
+import os
+from typing import Callable, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.importacao import TOLERANCIA
+from app.models import ItemNota, NotaFiscal
+
+LOTE_CONCILIACAO = 50_000
+COLUNAS_RELATORIO = ["nota_id", "valor_total", "soma_itens", "diferenca", "qtd_itens"]
+
+
+def conciliar_faixa(ids: np.ndarray, totais: np.ndarray,
+                    item_notas: np.ndarray, item_valores: np.ndarray):
+    """
+    Soma dos itens por nota para uma faixa de notas ordenada por id.
+    Retorna (soma, qtd_itens, máscara de divergentes, itens sem nota na faixa).
+    """
+    posicoes = np.searchsorted(ids, item_notas)
+    casados = posicoes < len(ids)
+    casados[casados] = ids[posicoes[casados]] == item_notas[casados]
+    soma = np.bincount(posicoes[casados], weights=item_valores[casados], minlength=len(ids))
+    qtd = np.bincount(posicoes[casados], minlength=len(ids))
+    divergentes = np.abs(soma - totais) > TOLERANCIA
+    return soma, qtd, divergentes, int((~casados).sum())
+
+
+def conciliar_totais(fabrica_sessao: Callable[[], Session], relatorio: str,
+                     checkpoint: Optional[dict] = None,
+                     ao_concluir_lote: Optional[Callable[[dict, int], None]] = None) -> dict:
+    """
+    Percorre todas as notas e grava as divergentes em `relatorio` (CSV).
+    `ao_concluir_lote(checkpoint, total_notas)` é chamado após cada lote
+    persistido. Retorna o checkpoint final (contadores da execução).
+    """
+    ck = checkpoint
+    if ck is None or not os.path.exists(relatorio):
+        ck = {"ultimo_id": 0, "bytes": 0, "notas": 0, "itens": 0,
+              "divergentes": 0, "itens_orfaos": 0}
+    notas, itens = NotaFiscal.__table__, ItemNota.__table__
+
+    with fabrica_sessao() as db:
+        total = db.scalar(select(func.count()).select_from(notas))
+
+    with open(relatorio, "r+b" if ck["bytes"] else "wb") as f:
+        f.truncate(ck["bytes"])
+        f.seek(ck["bytes"])
+        if not ck["bytes"]:
+            f.write((",".join(COLUNAS_RELATORIO) + "\n").encode())
+
+        while True:
+            with fabrica_sessao() as db:
+                faixa = db.execute(
+                    select(notas.c.id, notas.c.valor_total)
+                    .where(notas.c.id > ck["ultimo_id"])
+                    .order_by(notas.c.id)
+                    .limit(LOTE_CONCILIACAO)
+                ).all()
+                if not faixa:
+                    break
+                ids, totais = (np.array(c) for c in zip(*faixa))
+                linhas_itens = db.execute(
+                    select(itens.c.nota_id, itens.c.valor_total)
+                    .where(itens.c.nota_id.between(int(ids[0]), int(ids[-1])))
+                ).all()
+            item_notas, item_valores = (
+                (np.array(c) for c in zip(*linhas_itens)) if linhas_itens
+                else (np.zeros(0, dtype=np.int64), np.zeros(0))
+            )
+
+            soma, qtd, divergentes, orfaos = conciliar_faixa(
+                ids.astype(np.int64), totais.astype(np.float64),
+                item_notas.astype(np.int64), item_valores.astype(np.float64),
+            )
+            f.write("".join(
+                f"{ids[k]},{totais[k]:.2f},{soma[k]:.2f},{totais[k] - soma[k]:.2f},{qtd[k]}\n"
+                for k in np.flatnonzero(divergentes)
+            ).encode())
+            f.flush()
+            os.fsync(f.fileno())
+            ck = {
+                "ultimo_id": int(ids[-1]),
+                "bytes": f.tell(),
+                "notas": ck["notas"] + len(ids),
+                "itens": ck["itens"] + len(item_notas),
+                "divergentes": ck["divergentes"] + int(divergentes.sum()),
+                "itens_orfaos": ck["itens_orfaos"] + orfaos,
+            }
+            if ao_concluir_lote:
+                ao_concluir_lote(ck, total)
+    return ck
+
+
+def ler_checkpoint(caminho: str) -> Optional[dict]:
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho) as f:
+        return json.load(f)
+
+
+def gravar_checkpoint(caminho: str, checkpoint: dict):
+    """Escrita atômica (arquivo temporário + rename)."""
+    temporario = caminho + ".tmp"
+    with open(temporario, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
@@ -0,0 +1,120 @@
+"""
+Caminho quente — consultas de formato fixo executadas a cada request.
+
+`db.query(Modelo).filter(...)` monta o objeto Query, gera a chave do cache
+de compilação e hidrata entidades ORM em toda chamada. Para as leituras por
+id e a baixa de estoque, os statements são Core, montados UMA vez no
+import, com bindparam — a compilação fica no cache do engine e cada chamada
+só executa. O UPDATE de estoque usa RETURNING: uma ida ao banco em vez de
+UPDATE + SELECT.
+
+No PostgreSQL, cada conexão nova também recebe PREPARE desses statements
+(plano no servidor, sem parse/plan por chamada) e o caminho quente usa
+EXECUTE. Desligue com PG_PREPARED_STATEMENTS=0 atrás de um pgbouncer em
+modo transaction, onde a conexão do servidor muda a cada transação.
+
+Benchmark: `python -m bench.consultas`.
+"""
+import os
+from typing import Optional
+
+from sqlalchemy import bindparam, event, select, text, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.database import engine, read_engines
+from app.models import NotaFiscal, Produto
+
+USAR_PREPARADAS = os.getenv("PG_PREPARED_STATEMENTS", "1") != "0"
+
+_notas = NotaFiscal.__table__
+_produtos = Produto.__table__
+
+NOTA_RESUMO = (
+    select(_notas.c.id, _notas.c.numero, _notas.c.valor_total, _notas.c.status)
+    .where(_notas.c.id == bindparam("id"))
+)
+PRODUTO = (
+    select(
+        _produtos.c.id, _produtos.c.codigo, _produtos.c.descricao, _produtos.c.ncm,
+        _produtos.c.preco_unitario, _produtos.c.estoque, _produtos.c.version,
+    )
+    .where(_produtos.c.id == bindparam("id"))
+)
+ATUALIZAR_ESTOQUE = (
+    update(_produtos)
+    .where(_produtos.c.id == bindparam("b_id"), _produtos.c.version == bindparam("b_version"))
+    .values(estoque=_produtos.c.estoque + bindparam("b_quantidade"),
+            version=_produtos.c.version + 1)
+    .returning(_produtos.c.id, _produtos.c.estoque, _produtos.c.version)
+)
+
+# Mesmas consultas, para PREPARE no PostgreSQL. Prefixo `ler_` = leitura
+# (SessaoRoteada manda EXECUTE ler_* para a réplica).
+PREPARADAS = {
+    "ler_nota_resumo": (
+        "integer",
+        "SELECT id, numero, valor_total, status FROM notas_fiscais WHERE id = $1",
+        ":id",
+    ),
+    "ler_produto": (
+        "integer",
+        "SELECT id, codigo, descricao, ncm, preco_unitario, estoque, version "
+        "FROM produtos WHERE id = $1",
+        ":id",
+    ),
+    "atualizar_estoque": (
+        "integer, integer, integer",
+        "UPDATE produtos SET estoque = estoque + $3, version = version + 1 "
+        "WHERE id = $1 AND version = $2 RETURNING id, estoque, version",
+        ":b_id, :b_version, :b_quantidade",
+    ),
+}
+
+
+def _preparar(conexao_dbapi, registro, somente_leitura: bool):
+    cursor = conexao_dbapi.cursor()
+    try:
+        for nome, (tipos, sql, _) in PREPARADAS.items():
+            if somente_leitura and not nome.startswith("ler_"):
+                continue
+            cursor.execute(f"PREPARE {nome} ({tipos}) AS {sql}")
+    finally:
+        cursor.close()
+    conexao_dbapi.commit()  # psycopg2 abre transação implícita
+    registro.info["preparadas"] = True
+
+
+if USAR_PREPARADAS:
+    for _eng, _leitura in [(engine, False), *((e, True) for e in read_engines)]:
+        if _eng.dialect.name == "postgresql":
+            event.listen(
+                _eng, "connect",
+                lambda conn, reg, _leitura=_leitura: _preparar(conn, reg, _leitura),
+            )
+
+
+def _executar(db: Session, nome: str, stmt, params: dict):
+    if USAR_PREPARADAS and db.bind.dialect.name == "postgresql":
+        return db.execute(text(f"EXECUTE {nome}({PREPARADAS[nome][2]})"), params)
+    return db.execute(stmt, params)
+
+
+def nota_resumo(db: Session, nota_id: int) -> Optional[Row]:
+    """(id, numero, valor_total, status) da nota, ou None."""
+    return _executar(db, "ler_nota_resumo", NOTA_RESUMO, {"id": nota_id}).first()
+
+
+def produto(db: Session, produto_id: int) -> Optional[Row]:
+    return _executar(db, "ler_produto", PRODUTO, {"id": produto_id}).first()
+
+
+def atualizar_estoque(db: Session, produto_id: int, version: int,
+                      quantidade: int) -> Optional[Row]:
+    """
+    Soma `quantidade` ao estoque se a versão ainda for `version`.
+    Retorna (id, estoque, version) novos, ou None em conflito/inexistente.
+    """
+    return _executar(db, "atualizar_estoque", ATUALIZAR_ESTOQUE, {
+        "b_id": produto_id, "b_version": version, "b_quantidade": quantidade,
+    }).first()
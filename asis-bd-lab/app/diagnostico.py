@@ -0,0 +1,194 @@
+"""
+Diagnóstico de memória do processo — só para administradores.
+
+    GET    /v2/admin/memoria?coletar=true                RSS, gc, identity maps, tracemalloc
+    POST   /v2/admin/memoria/tracemalloc?frames=10       liga o rastreamento
+    DELETE /v2/admin/memoria/tracemalloc                 desliga e descarta snapshots
+    POST   /v2/admin/memoria/snapshots                   snapshot + maiores locais de alocação
+    GET    /v2/admin/memoria/snapshots/{id}/diff?base=   o que cresceu entre dois snapshots
+
+Fluxo para achar um vazamento: liga o tracemalloc, tira um snapshot, gera
+carga (ou `python -m bench --soak`), tira outro e compara. Os locais que
+só crescem entre snapshots são o suspeito.
+
+Tudo é por processo: com vários workers, cada request cai em um deles — a
+resposta traz `pid`. O tracemalloc custa CPU e memória enquanto ligado;
+desligue ao terminar. Guarda no máximo MAX_SNAPSHOTS snapshots.
+"""
+import gc
+import os
+import resource
+import threading
+import tracemalloc
+import weakref
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+MAX_SNAPSHOTS = 4
+MAX_SESSOES = 20  # maiores identity maps listados
+AGRUPAMENTOS = ("lineno", "filename", "traceback")
+
+_IGNORAR = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class TracemallocInativo(RuntimeError):
+    pass
+
+
+# ─── Sessões vivas ──────────────────────────────────────
+
+_sessoes: "weakref.WeakSet[Session]" = weakref.WeakSet()
+_trava_sessoes = threading.Lock()
+
+
+@event.listens_for(Session, "after_begin")
+def _rastrear_sessao(session, transaction, connection):
+    with _trava_sessoes:
+        _sessoes.add(session)
+
+
+def identity_maps() -> dict:
+    """Sessões vivas no processo e os objetos ORM que cada uma retém."""
+    with _trava_sessoes:
+        sessoes = list(_sessoes)
+    detalhes = []
+    for s in sessoes:
+        try:
+            por_classe = Counter(type(o).__name__ for o in list(s.identity_map.values()))
+        except RuntimeError:  # identity map alterado por outra thread durante a contagem
+            por_classe = None
+        detalhes.append({
+            "sessao": f"{id(s):x}",
+            "objetos": len(s.identity_map),
+            "em_transacao": s.in_transaction(),
+            "por_classe": dict(por_classe) if por_classe is not None else None,
+        })
+    detalhes.sort(key=lambda d: d["objetos"], reverse=True)
+    return {
+        "sessoes_vivas": len(detalhes),
+        "objetos_total": sum(d["objetos"] for d in detalhes),
+        "maiores": detalhes[:MAX_SESSOES],
+    }
+
+
+# ─── Processo ───────────────────────────────────────────
+
+def rss_bytes() -> dict:
+    """RSS atual e pico (Linux: /proc; fora dele só o pico, via getrusage)."""
+    valores = {}
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith(("VmRSS:", "VmHWM:")):
+                    chave, kb, _ = linha.split()
+                    valores[chave] = int(kb) * 1024
+    except OSError:
+        pass
+    return {
+        "rss_bytes": valores.get("VmRSS:"),
+        "rss_pico_bytes": valores.get(
+            "VmHWM:", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        ),
+    }
+
+
+def estatisticas_gc(coletar: bool = False) -> dict:
+    coletados = gc.collect() if coletar else None
+    return {
+        "coletados": coletados,
+        "contagens": gc.get_count(),
+        "limiares": gc.get_threshold(),
+        "geracoes": gc.get_stats(),
+        "nao_coletaveis": len(gc.garbage),
+        "objetos_rastreados": len(gc.get_objects()),
+    }
+
+
+# ─── tracemalloc ────────────────────────────────────────
+
+def _local(stat, agrupar: str) -> dict:
+    quadro = stat.traceback[0]
+    local = {"local": f"{quadro.filename}:{quadro.lineno}"}
+    if agrupar == "traceback":
+        local["pilha"] = [f"{q.filename}:{q.lineno}" for q in stat.traceback]
+    return local
+
+
+class DiagnosticoMemoria:
+
+    def __init__(self, max_snapshots: int = MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self.snapshots: "OrderedDict[int, tuple[datetime, tracemalloc.Snapshot]]" = OrderedDict()
+        self._proximo = 1
+        self._trava = threading.Lock()
+
+    def iniciar(self, frames: int = 1):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()  # para trocar o número de frames
+        tracemalloc.start(frames)
+
+    def parar(self):
+        tracemalloc.stop()
+        with self._trava:
+            self.snapshots.clear()
+
+    def capturar(self) -> int:
+        """Tira um snapshot e devolve o id; descarta o mais antigo além do limite."""
+        if not tracemalloc.is_tracing():
+            raise TracemallocInativo("tracemalloc desligado — POST /v2/admin/memoria/tracemalloc")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORAR)
+        with self._trava:
+            numero = self._proximo
+            self._proximo += 1
+            self.snapshots[numero] = (datetime.utcnow(), snapshot)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return numero
+
+    def _snapshot(self, numero: int) -> tracemalloc.Snapshot:
+        with self._trava:
+            return self.snapshots[numero][1]  # KeyError: inexistente ou descartado
+
+    def top(self, numero: int, agrupar: str = "lineno", limite: int = 20) -> list[dict]:
+        """Maiores locais de alocação ainda vivos no snapshot."""
+        return [
+            {**_local(s, agrupar), "tamanho_bytes": s.size, "blocos": s.count}
+            for s in self._snapshot(numero).statistics(agrupar)[:limite]
+        ]
+
+    def diff(self, numero: int, base: int, agrupar: str = "lineno", limite: int = 20) -> list[dict]:
+        """Locais que mais cresceram (ou encolheram) de `base` para `numero`."""
+        return [
+            {**_local(s, agrupar), "diferenca_bytes": s.size_diff, "tamanho_bytes": s.size,
+             "diferenca_blocos": s.count_diff}
+            for s in self._snapshot(numero).compare_to(self._snapshot(base), agrupar)[:limite]
+        ]
+
+    def resumo(self, coletar: bool = False) -> dict:
+        atual, pico = tracemalloc.get_traced_memory()
+        with self._trava:
+            snapshots = [
+                {"id": n, "capturado_em": quando.isoformat()}
+                for n, (quando, _) in self.snapshots.items()
+            ]
+        return {
+            "pid": os.getpid(),
+            **rss_bytes(),
+            "gc": estatisticas_gc(coletar),
+            "identity_maps": identity_maps(),
+            "tracemalloc": {
+                "ativo": tracemalloc.is_tracing(),
+                "frames": tracemalloc.get_traceback_limit(),
+                "rastreado_bytes": atual,
+                "rastreado_pico_bytes": pico,
+                "snapshots": snapshots,
+            },
+        }
@@ -0,0 +1,82 @@
+"""
+Formatos compactos para leitura em massa (tráfego serviço-a-serviço).
+
+Um array JSON de objetos repete o nome de cada campo em todas as linhas.
+Para consumidores internos, os endpoints de listagem/busca negociam pelo
+header Accept:
+
+  application/json                      lista de objetos (padrão, inalterado)
+  application/vnd.asis.colunar+json     {"columns": [...], "rows": [[...], ...]}
+  application/msgpack                   o mesmo layout colunar, em MessagePack
+
+Datas viajam como string ISO 8601 nos três formatos. A ordem das colunas
+segue os campos do schema de resposta do endpoint.
+"""
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Response
+from pydantic import BaseModel
+
+MIDIA_JSON = "application/json"
+MIDIA_COLUNAR = "application/vnd.asis.colunar+json"
+MIDIA_MSGPACK = "application/msgpack"
+_SINONIMOS = {"application/x-msgpack": MIDIA_MSGPACK}
+_SUPORTADAS = (MIDIA_JSON, MIDIA_COLUNAR, MIDIA_MSGPACK)
+
+# Para o OpenAPI: tipos alternativos da resposta 200
+RESPOSTAS_TABULARES = {200: {"content": {MIDIA_COLUNAR: {}, MIDIA_MSGPACK: {}}}}
+
+
+def negociar(accept: Optional[str]) -> str:
+    """Mídia suportada de maior `q` no Accept; JSON se nenhuma for pedida."""
+    melhor, melhor_q = MIDIA_JSON, 0.0
+    for parte in (accept or "").split(","):
+        tipo, *params = [p.strip() for p in parte.split(";")]
+        tipo = _SINONIMOS.get(tipo.lower(), tipo.lower())
+        if tipo not in _SUPORTADAS:
+            continue
+        q = 1.0
+        for p in params:
+            if p.startswith("q="):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        if q > melhor_q:
+            melhor, melhor_q = tipo, q
+    return melhor
+
+
+def _valor(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+def tabela(linhas, modelo: type[BaseModel]) -> dict:
+    """Layout colunar direto dos objetos ORM (sem instanciar o schema por linha)."""
+    colunas = list(modelo.model_fields)
+    return {
+        "columns": colunas,
+        "rows": [[_valor(getattr(l, c)) for c in colunas] for l in linhas],
+    }
+
+
+def empacotar_msgpack(obj) -> bytes:
+    import msgpack  # dependência só deste formato
+
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def resposta_compacta(midia: str, linhas, modelo: type[BaseModel],
+                      headers: Optional[dict] = None) -> Response:
+    return responder_tabela(midia, tabela(linhas, modelo), headers)
+
+
+def responder_tabela(midia: str, corpo: dict, headers: Optional[dict] = None) -> Response:
+    """Serializa um corpo {"columns", "rows"} já montado no formato negociado."""
+    if midia == MIDIA_MSGPACK:
+        conteudo = empacotar_msgpack(corpo)
+    else:
+        conteudo = json.dumps(corpo, ensure_ascii=False, separators=(",", ":")).encode()
+    return Response(conteudo, media_type=midia, headers={"Vary": "Accept", **(headers or {})})
@@ -0,0 +1,149 @@
+"""
+Idempotency-Key para escritas (`PUT /v2/produtos/{id}/estoque`,
+`POST /v2/produtos`).
+
+Com rede instável o cliente reenvia a mesma escrita sem saber se a primeira
+chegou. Com o header `Idempotency-Key`, a primeira resposta de sucesso é
+gravada em `respostas_idempotentes` NA MESMA TRANSAÇÃO da escrita — ou as
+duas ficam, ou nenhuma. Repetições com a mesma chave devolvem a resposta
+gravada (header `Idempotent-Replayed: true`) sem executar nada de novo.
+
+  - a chave é reservada (INSERT) antes da escrita: uma duplicata concorrente
+    espera no índice único até a primeira terminar e então repete a resposta
+  - mesma chave com outra rota/query/corpo → 422
+  - erros (404, 409, 5xx) não são gravados: a transação desfaz a reserva e
+    o cliente pode tentar de novo com a mesma chave
+  - chaves valem IDEMPOTENCIA_TTL_S (padrão 24h), por cliente
+    (`identificar_cliente`); expiradas são removidas por
+    `python -m app.cli limpar-idempotencia`
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlencode
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.admissao import identificar_cliente
+from app.database import get_db
+from app.models import RespostaIdempotente
+
+HEADER_CHAVE = "Idempotency-Key"
+HEADER_REPETIDA = "Idempotent-Replayed"
+TAMANHO_MAXIMO_CHAVE = 128
+TTL_S = int(os.getenv("IDEMPOTENCIA_TTL_S", str(24 * 3600)))
+LOTE_LIMPEZA = 1000
+
+
+class Idempotencia:
+    """Estado da chave de um request; sem header, todos os métodos são neutros."""
+
+    def __init__(self, db: Session, chave: Optional[str] = None, cliente: str = "",
+                 rota: str = "", impressao: str = ""):
+        self.db = db
+        self.chave = chave
+        self.cliente = cliente
+        self.rota = rota
+        self.impressao = impressao
+        self.registro: Optional[RespostaIdempotente] = None
+
+    def anterior(self) -> Optional[JSONResponse]:
+        """
+        Resposta já gravada para a chave (o endpoint a devolve como está) ou
+        None — nesse caso a chave fica reservada na transação corrente.
+        """
+        if self.chave is None:
+            return None
+        agora = datetime.utcnow()
+        registro = self.db.get(RespostaIdempotente, (self.cliente, self.chave))
+        if registro is not None and registro.expira_em <= agora:
+            self.db.delete(registro)
+            self.db.flush()
+            registro = None
+        if registro is not None:
+            return self._repetir(registro)
+
+        self.registro = RespostaIdempotente(
+            cliente=self.cliente, chave=self.chave, rota=self.rota,
+            impressao=self.impressao, criado_em=agora,
+            expira_em=agora + timedelta(seconds=TTL_S),
+        )
+        self.db.add(self.registro)
+        try:
+            self.db.flush()  # duplicata concorrente bloqueia aqui até o commit da primeira
+        except IntegrityError:
+            self.db.rollback()
+            self.registro = None
+            return self.anterior()
+        return None
+
+    def _repetir(self, registro: RespostaIdempotente) -> JSONResponse:
+        if registro.rota != self.rota or registro.impressao != self.impressao:
+            raise HTTPException(
+                status_code=422,
+                detail=f"{HEADER_CHAVE} já usada com outra requisição",
+            )
+        if registro.status_code is None:  # só visível sem isolamento de transação
+            raise HTTPException(status_code=409, detail="Requisição original ainda em andamento")
+        return JSONResponse(
+            content=json.loads(registro.corpo),
+            status_code=registro.status_code,
+            headers={HEADER_REPETIDA: "true"},
+        )
+
+    def concluir(self, status_code: int, corpo: dict) -> JSONResponse:
+        """Grava a resposta junto com a escrita e faz o commit."""
+        if self.registro is not None:
+            self.registro.status_code = status_code
+            self.registro.corpo = json.dumps(corpo, ensure_ascii=False)
+        self.db.commit()
+        return JSONResponse(content=corpo, status_code=status_code)
+
+
+async def idempotencia(request: Request, db: Session = Depends(get_db)) -> Idempotencia:
+    """Dependency: lê o header e calcula a impressão digital do request."""
+    chave = request.headers.get(HEADER_CHAVE)
+    if chave is None:
+        return Idempotencia(db)
+    chave = chave.strip()
+    if not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{HEADER_CHAVE} deve ter de 1 a {TAMANHO_MAXIMO_CHAVE} caracteres",
+        )
+    query = urlencode(sorted(request.query_params.multi_items()))
+    impressao = hashlib.sha256(query.encode() + b"\n" + await request.body()).hexdigest()
+    return Idempotencia(
+        db, chave, identificar_cliente(request),
+        f"{request.method} {request.url.path}", impressao,
+    )
+
+
+def limpar_expiradas(engine: Engine) -> int:
+    """Remove chaves vencidas em lotes de LOTE_LIMPEZA; retorna o total removido."""
+    tabela = RespostaIdempotente.__table__
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            chaves = conn.execute(
+                select(tabela.c.cliente, tabela.c.chave)
+                .where(tabela.c.expira_em < datetime.utcnow())
+                .limit(LOTE_LIMPEZA)
+            ).all()
+            if chaves:
+                conn.execute(
+                    delete(tabela).where(
+                        tabela.c.cliente == bindparam("c"), tabela.c.chave == bindparam("k")
+                    ),
+                    [{"c": c, "k": k} for c, k in chaves],
+                )
+        total += len(chaves)
+        if len(chaves) < LOTE_LIMPEZA:
+            return total
@@ -0,0 +1,316 @@
+"""
+Importação de notas em lote com validação vetorizada (NumPy).
+
+    POST /v2/notas/lote   {"notas": [{..., "itens": [...]}, ...]}
+
+Validar 100k notas objeto a objeto (um modelo Pydantic e um regex por
+campo) custa segundos. Aqui o lote inteiro vira arrays — uma matriz
+N x 14 de dígitos para os CNPJs, vetores de valores para notas e itens — e
+cada regra é uma operação sobre o array todo:
+
+  - CNPJ: 14 dígitos, dígitos verificadores (módulo 11) e rejeição de
+    sequências repetidas ("00000000000000" passa no módulo 11)
+  - valores: numéricos, finitos e > 0; quantidade inteira > 0
+  - item: valor_total = quantidade x valor_unitario (± TOLERANCIA)
+  - nota: valor_total = soma dos valor_total dos itens (± TOLERANCIA)
+  - produto_id existente (um SELECT ... IN com os ids distintos)
+  - numero único: sem repetição dentro do lote nem já gravado no banco
+    (um SELECT ... IN com os números do lote)
+  - observacao: texto ou ausente
+
+O lote é tudo-ou-nada: com qualquer erro nada é gravado e a resposta lista
+os erros por índice. Válido, é inserido via Core (executemany) com os
+agregados de itens já calculados e as alterações registradas para o feed.
+"""
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.models import ItemNota, NotaFiscal, Produto, registrar_alteracoes
+
+LOTE_MAX_NOTAS = 100_000
+TOLERANCIA = 0.01  # um centavo
+MAX_ERROS_RESPOSTA = 100
+
+_PESOS_DV1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+_PESOS_DV2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+
+@dataclass(frozen=True)
+class ErroLote:
+    indice: int      # posição da nota no lote
+    campo: str       # "emitente_cnpj", "itens[2].valor_total", ...
+    mensagem: str
+
+
+@dataclass
+class LoteValidado:
+    """Arrays extraídos do lote — reaproveitados na inserção."""
+    notas: Sequence[dict]
+    erros: list[ErroLote] = field(default_factory=list)
+    valor_total: np.ndarray = None
+    data_emissao: list = None
+    item_nota: np.ndarray = None       # índice da nota de cada item
+    item_produto: np.ndarray = None
+    item_quantidade: np.ndarray = None
+    item_valor_unitario: np.ndarray = None
+    item_valor_total: np.ndarray = None
+
+    @property
+    def valido(self) -> bool:
+        return not self.erros
+
+
+# ─── Regras vetorizadas ─────────────────────────────────
+
+def _digitos_verificadores(base: np.ndarray, pesos: np.ndarray) -> np.ndarray:
+    resto = (base @ pesos) % 11
+    return np.where(resto < 2, 0, 11 - resto)
+
+
+def validar_cnpjs(cnpjs: Sequence) -> np.ndarray:
+    """Máscara booleana: True onde o CNPJ é válido (formato + DVs)."""
+    n = len(cnpjs)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    if set(map(type, cnpjs)) != {str}:
+        cnpjs = [c if isinstance(c, str) else "" for c in cnpjs]
+    # U15: um code point por posição; a 15ª preenchida = comprimento > 14
+    codigos = np.array(cnpjs, dtype="U15").view(np.uint32).reshape(n, 15)
+    ok = (codigos[:, 14] == 0) & (codigos[:, 13] != 0)
+    digitos = codigos[:, :14].astype(np.int64) - 48
+    ok &= ((digitos >= 0) & (digitos <= 9)).all(axis=1)
+    digitos = np.where(ok[:, None], digitos, 0)
+    ok &= digitos[:, 12] == _digitos_verificadores(digitos[:, :12], _PESOS_DV1)
+    ok &= digitos[:, 13] == _digitos_verificadores(digitos[:, :13], _PESOS_DV2)
+    ok &= ~(digitos == digitos[:, :1]).all(axis=1)
+    return ok
+
+
+def _numeros(valores: list) -> np.ndarray:
+    """float64; NaN onde o valor não é número (bool e string não contam)."""
+    if set(map(type, valores)) <= {int, float}:
+        return np.asarray(valores, dtype=np.float64)
+    return np.fromiter(
+        (float(v) if type(v) in (int, float) else math.nan for v in valores),
+        dtype=np.float64, count=len(valores),
+    )
+
+
+def _textos_ok(valores: list, minimo: int, maximo: int) -> np.ndarray:
+    if set(map(type, valores)) == {str}:
+        tamanhos = np.fromiter(map(len, valores), dtype=np.int64, count=len(valores))
+        return (tamanhos >= minimo) & (tamanhos <= maximo)
+    return np.fromiter(
+        (isinstance(v, str) and minimo <= len(v) <= maximo for v in valores),
+        dtype=bool, count=len(valores),
+    )
+
+
+def _erros(mascara_invalida: np.ndarray, indices: np.ndarray, campo, mensagem: str):
+    posicoes = np.flatnonzero(mascara_invalida)
+    if callable(campo):
+        return [ErroLote(int(indices[p]), campo(p), mensagem) for p in posicoes]
+    return [ErroLote(int(indices[p]), campo, mensagem) for p in posicoes]
+
+
+def _datas(notas: Sequence[dict]) -> tuple[list, np.ndarray]:
+    datas, invalidas = [], np.zeros(len(notas), dtype=bool)
+    for i, n in enumerate(notas):
+        valor = n.get("data_emissao")
+        if valor is None:
+            datas.append(None)
+            continue
+        try:
+            datas.append(datetime.fromisoformat(valor))
+        except (TypeError, ValueError):
+            datas.append(None)
+            invalidas[i] = True
+    return datas, invalidas
+
+
+def _numeros_repetidos(texto: np.ndarray, validos: np.ndarray) -> np.ndarray:
+    """True nas ocorrências de um número já visto antes no lote (a 1ª passa)."""
+    _, primeiras = np.unique(texto, return_index=True)
+    repetidos = validos.copy()
+    repetidos[primeiras] = False
+    return repetidos
+
+
+def validar_lote(notas: Sequence[dict],
+                 produtos_existentes: Optional[np.ndarray] = None,
+                 numeros_existentes: Optional[np.ndarray] = None) -> LoteValidado:
+    """
+    Valida o lote inteiro de uma vez. `produtos_existentes` (ids) habilita
+    a checagem de produto_id e `numeros_existentes` a de numero já gravado;
+    sem eles, só formato e consistência interna do lote.
+    """
+    n = len(notas)
+    indices = np.arange(n)
+    lote = LoteValidado(notas=notas)
+    erros = lote.erros
+
+    notas = [x if isinstance(x, dict) else {} for x in notas]
+    numeros = [x.get("numero") for x in notas]
+    numero_ok = _textos_ok(numeros, 1, 20)
+    erros += _erros(~numero_ok, indices, "numero", "numero deve ter de 1 a 20 caracteres")
+    texto = np.array([v if ok else "" for v, ok in zip(numeros, numero_ok)], dtype="U20")
+    erros += _erros(_numeros_repetidos(texto, numero_ok), indices,
+                    "numero", "numero repetido no lote")
+    if numeros_existentes is not None and len(numeros_existentes):
+        ja_gravado = numero_ok & np.isin(texto, numeros_existentes)
+        erros += _erros(ja_gravado, indices, "numero", "numero já existe")
+    observacao_ok = np.fromiter(
+        (x.get("observacao") is None or isinstance(x["observacao"], str) for x in notas),
+        dtype=bool, count=n,
+    )
+    erros += _erros(~observacao_ok, indices, "observacao", "observacao deve ser texto")
+    serie = [x.get("serie", "001") for x in notas]
+    erros += _erros(~_textos_ok(serie, 1, 5), indices, "serie", "serie deve ter de 1 a 5 caracteres")
+    for campo in ("emitente_cnpj", "destinatario_cnpj"):
+        erros += _erros(~validar_cnpjs([x.get(campo) for x in notas]), indices,
+                        campo, "CNPJ inválido (14 dígitos com DV correto)")
+
+    lote.valor_total = _numeros([x.get("valor_total") for x in notas])
+    erros += _erros(~(np.isfinite(lote.valor_total) & (lote.valor_total > 0)), indices,
+                    "valor_total", "valor_total deve ser número maior que zero")
+    lote.data_emissao, datas_invalidas = _datas(notas)
+    erros += _erros(datas_invalidas, indices, "data_emissao", "data_emissao deve estar em ISO 8601")
+
+    # Itens achatados: item k pertence à nota item_nota[k], posição posicao[k]
+    listas = [x.get("itens") if isinstance(x.get("itens"), list) else [] for x in notas]
+    contagem = np.fromiter((len(l) for l in listas), dtype=np.int64, count=n)
+    erros += _erros(contagem == 0, indices, "itens", "a nota deve ter ao menos um item")
+    itens = [i if isinstance(i, dict) else {} for l in listas for i in l]
+    lote.item_nota = np.repeat(indices, contagem)
+    posicao = np.arange(len(itens)) - np.repeat(np.cumsum(contagem) - contagem, contagem)
+
+    def campo_item(nome):
+        return lambda k: f"itens[{posicao[k]}].{nome}"
+
+    produto = _numeros([i.get("produto_id") for i in itens])
+    quantidade = _numeros([i.get("quantidade") for i in itens])
+    unitario = _numeros([i.get("valor_unitario") for i in itens])
+    total_item = _numeros([i.get("valor_total") for i in itens])
+
+    produto_ok = np.isfinite(produto) & (produto > 0) & (produto == np.floor(produto))
+    if produtos_existentes is not None:
+        produto_ok &= np.isin(produto, produtos_existentes)
+    erros += _erros(~produto_ok, lote.item_nota, campo_item("produto_id"), "produto_id inexistente")
+    quantidade_ok = np.isfinite(quantidade) & (quantidade > 0) & (quantidade == np.floor(quantidade))
+    erros += _erros(~quantidade_ok, lote.item_nota, campo_item("quantidade"),
+                    "quantidade deve ser inteiro maior que zero")
+    for nome, valores in (("valor_unitario", unitario), ("valor_total", total_item)):
+        erros += _erros(~(np.isfinite(valores) & (valores > 0)), lote.item_nota,
+                        campo_item(nome), f"{nome} deve ser número maior que zero")
+    com_valores = quantidade_ok & np.isfinite(unitario) & np.isfinite(total_item)
+    erros += _erros(com_valores & (np.abs(quantidade * unitario - total_item) > TOLERANCIA),
+                    lote.item_nota, campo_item("valor_total"),
+                    "valor_total do item difere de quantidade x valor_unitario")
+
+    soma = np.bincount(lote.item_nota, weights=np.nan_to_num(total_item), minlength=n)
+    soma_ok = np.abs(soma - lote.valor_total) <= TOLERANCIA
+    erros += _erros((contagem > 0) & np.isfinite(lote.valor_total) & ~soma_ok, indices,
+                    "valor_total", "valor_total difere da soma dos itens")
+
+    lote.item_produto = np.nan_to_num(produto).astype(np.int64)
+    lote.item_quantidade = np.nan_to_num(quantidade).astype(np.int64)
+    lote.item_valor_unitario = unitario
+    lote.item_valor_total = total_item
+    erros.sort(key=lambda e: e.indice)
+    return lote
+
+
+# ─── Inserção ───────────────────────────────────────────
+
+def _agregados(lote: LoteValidado, n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(qtd_itens, quantidade_total, produtos_distintos) por nota, sem ir ao banco."""
+    qtd = np.bincount(lote.item_nota, minlength=n)
+    quantidade = np.bincount(lote.item_nota, weights=lote.item_quantidade, minlength=n)
+    pares = np.unique(np.stack([lote.item_nota, lote.item_produto]), axis=1)
+    distintos = np.bincount(pares[0], minlength=n)
+    return qtd, quantidade.astype(np.int64), distintos
+
+
+def produtos_existentes(db: Session, notas: Sequence[dict],
+                        conhecidos: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Ids de produto citados nos itens que existem no banco. `conhecidos`
+    (ids do catálogo em memória) dispensa a consulta para os que já estão lá.
+    """
+    ids = {
+        i.get("produto_id") for x in notas if isinstance(x, dict)
+        for i in (x.get("itens") or []) if isinstance(i, dict) and type(i.get("produto_id")) is int
+    }
+    if not ids:
+        return np.zeros(0, dtype=np.int64)
+    pedidos = np.fromiter(ids, dtype=np.int64, count=len(ids))
+    encontrados = np.zeros(0, dtype=np.int64)
+    if conhecidos is not None:
+        no_catalogo = np.isin(pedidos, conhecidos)
+        encontrados, pedidos = pedidos[no_catalogo], pedidos[~no_catalogo]
+        if not len(pedidos):
+            return encontrados
+    do_banco = np.fromiter(
+        db.scalars(select(Produto.id).where(Produto.id.in_(pedidos.tolist()))), dtype=np.int64
+    )
+    return np.concatenate([encontrados, do_banco])
+
+
+def numeros_existentes(db: Session, notas: Sequence[dict]) -> np.ndarray:
+    """Números do lote que já estão gravados (um SELECT ... IN)."""
+    numeros = {
+        x.get("numero") for x in notas
+        if isinstance(x, dict) and isinstance(x.get("numero"), str)
+    }
+    if not numeros:
+        return np.zeros(0, dtype="U20")
+    gravados = db.scalars(select(NotaFiscal.numero).where(NotaFiscal.numero.in_(numeros))).all()
+    return np.array(gravados, dtype="U20")
+
+
+def importar_lote(db: Session, lote: LoteValidado) -> list[int]:
+    """Insere notas e itens de um lote válido na transação de `db` (sem commit)."""
+    n = len(lote.notas)
+    qtd, quantidade, distintos = _agregados(lote, n)
+    agora = datetime.utcnow()
+    notas_tabela = NotaFiscal.__table__
+    ids = db.execute(
+        insert(notas_tabela).returning(notas_tabela.c.id, sort_by_parameter_order=True),
+        [
+            {
+                "numero": x["numero"],
+                "serie": x.get("serie", "001"),
+                "emitente_cnpj": x["emitente_cnpj"],
+                "destinatario_cnpj": x["destinatario_cnpj"],
+                "valor_total": float(lote.valor_total[k]),
+                "status": "emitida",
+                "data_emissao": lote.data_emissao[k] or agora,
+                "observacao": x.get("observacao"),
+                "qtd_itens": int(qtd[k]),
+                "quantidade_total": int(quantidade[k]),
+                "produtos_distintos": int(distintos[k]),
+            }
+            for k, x in enumerate(lote.notas)
+        ],
+    ).scalars().all()
+
+    nota_ids = np.asarray(ids, dtype=np.int64)[lote.item_nota]
+    db.execute(insert(ItemNota.__table__), [
+        {"nota_id": int(a), "produto_id": int(b), "quantidade": int(c),
+         "valor_unitario": float(d), "valor_total": float(e)}
+        for a, b, c, d, e in zip(
+            nota_ids, lote.item_produto, lote.item_quantidade,
+            lote.item_valor_unitario, lote.item_valor_total,
+        )
+    ])
+    # Core não passa pelos eventos do ORM: agregados vieram do lote; o feed, daqui
+    registrar_alteracoes(db.connection(), [
+        {"entidade": "nota", "entidade_id": i, "operacao": "insert"} for i in ids
+    ])
+    return ids
@@ -0,0 +1,387 @@
+"""
+Jobs em segundo plano — exportações e recálculos fora do request.
+
+Sem broker externo: a fila é a própria tabela `jobs` e cada processo da
+API roda um pool de threads (JOBS_WORKERS, padrão 2; 0 desliga) que:
+
+  1. reserva o job pendente mais antigo com um UPDATE condicional
+     (`WHERE status = 'pendente'`) — seguro com vários workers do gunicorn
+  2. executa o handler do tipo, que reporta progresso e um checkpoint
+     (ex.: último id exportado + bytes já gravados no arquivo)
+  3. grava o resultado em JOBS_DIR/<id>.<formato>
+
+Reinício: num desligamento limpo o job volta a `pendente` no próximo
+checkpoint; se o processo morreu, o job fica `executando` sem heartbeat e
+é devolvido à fila após JOBS_HEARTBEAT_EXPIRA_S. Nos dois casos a execução
+seguinte retoma do checkpoint.
+
+Enquanto o handler roda, uma thread renova o heartbeat a cada
+JOBS_HEARTBEAT_EXPIRA_S/4 — um passo longo (o count do export, um lote
+lento) não faz o job parecer órfão. Cada reserva incrementa `tentativas`,
+que serve de ficha da execução: heartbeat, progresso e status final só são
+gravados com a ficha ainda válida. Se outro worker recuperou o job, a
+execução antiga para (JobPerdido) sem gravar mais nada.
+
+Para processar jobs fora da API: `python -m app.cli jobs`.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.busca import filtros_notas
+from app.formatos import empacotar_msgpack
+from app.models import Job, NotaFiscal
+
+logger = logging.getLogger("asis_taxtech")
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+FALHOU = "falhou"
+
+
+class JobInterrompido(Exception):
+    """O processo está parando; o job volta à fila a partir do checkpoint."""
+
+
+class JobPerdido(Exception):
+    """Outro worker reservou o job: esta execução para sem gravar nada."""
+
+
+class TipoJobDesconhecido(ValueError):
+    pass
+
+
+class ContextoJob:
+    """O que o handler enxerga do job em execução."""
+
+    def __init__(self, gerenciador: "GerenciadorJobs", job: Job):
+        self._gerenciador = gerenciador
+        self.id = job.id
+        self.tentativa = job.tentativas  # ficha desta execução
+        self._perdido = threading.Event()
+        self.parametros: dict = json.loads(job.parametros or "{}")
+        self.checkpoint: Optional[dict] = json.loads(job.checkpoint) if job.checkpoint else None
+        self.arquivo = os.path.join(
+            gerenciador.diretorio, f"{job.id}.{self.parametros.get('formato', 'dat')}"
+        )
+
+    def sessao(self) -> Session:
+        return self._gerenciador.fabrica_sessao()
+
+    def _atualizar(self, **valores) -> bool:
+        """UPDATE só se o job ainda é desta execução; senão marca como perdido."""
+        with self.sessao() as db:
+            atualizado = db.execute(
+                update(Job)
+                .where(Job.id == self.id, Job.status == EXECUTANDO, Job.tentativas == self.tentativa)
+                .values(**valores)
+            ).rowcount
+            db.commit()
+        if not atualizado:
+            self._perdido.set()
+        return bool(atualizado)
+
+    def renovar_heartbeat(self) -> bool:
+        return self._atualizar(heartbeat_em=datetime.utcnow())
+
+    def verificar(self):
+        """JobPerdido se outro worker assumiu o job — chamar antes de gravar."""
+        if self._perdido.is_set():
+            raise JobPerdido()
+
+    def progresso(self, processados: int, total: Optional[int] = None,
+                  checkpoint: Optional[dict] = None):
+        """Persiste progresso + checkpoint e renova o heartbeat."""
+        self.verificar()
+        self.checkpoint = checkpoint
+        if not self._atualizar(
+            processados=processados,
+            total=total,
+            checkpoint=json.dumps(checkpoint) if checkpoint is not None else None,
+            heartbeat_em=datetime.utcnow(),
+        ):
+            raise JobPerdido()
+        if self._gerenciador.parando:
+            raise JobInterrompido()
+
+
+TIPOS: dict[str, Callable[[ContextoJob], None]] = {}
+
+
+def tipo_job(nome: str):
+    """Registra um handler: `@tipo_job("exportar_notas")`."""
+    def registrar(handler):
+        TIPOS[nome] = handler
+        return handler
+    return registrar
+
+
+class GerenciadorJobs:
+
+    def __init__(self, fabrica_sessao: Callable[[], Session], diretorio: str,
+                 workers: int = 2, intervalo_s: float = 1.0,
+                 heartbeat_expira_s: float = 60.0, max_tentativas: int = 3):
+        self.fabrica_sessao = fabrica_sessao
+        self.diretorio = diretorio
+        self.workers = workers
+        self.intervalo_s = intervalo_s
+        self.heartbeat_expira_s = heartbeat_expira_s
+        self.max_tentativas = max_tentativas
+        self._parar = threading.Event()
+        self._acordar = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._ultima_recuperacao = float("-inf")
+
+    @classmethod
+    def do_ambiente(cls, fabrica_sessao) -> "GerenciadorJobs":
+        return cls(
+            fabrica_sessao,
+            diretorio=os.getenv("JOBS_DIR", "./jobs_resultados"),
+            workers=int(os.getenv("JOBS_WORKERS", "2")),
+            heartbeat_expira_s=float(os.getenv("JOBS_HEARTBEAT_EXPIRA_S", "60")),
+        )
+
+    @property
+    def parando(self) -> bool:
+        return self._parar.is_set()
+
+    # ─── API ────────────────────────────────────────────
+
+    def submeter(self, db: Session, tipo: str, parametros: dict) -> Job:
+        if tipo not in TIPOS:
+            raise TipoJobDesconhecido(tipo)
+        job = Job(id=uuid.uuid4().hex, tipo=tipo, status=PENDENTE,
+                  parametros=json.dumps(parametros), processados=0, tentativas=0)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._acordar.set()
+        return job
+
+    def iniciar(self):
+        if self.workers <= 0 or self._threads:
+            return
+        self._parar.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._laco, name=f"jobs-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def parar(self, timeout: float = 10.0):
+        self._parar.set()
+        self._acordar.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def executar_pendentes(self) -> int:
+        """Processa a fila até esvaziar, na thread atual (CLI e testes)."""
+        executados = 0
+        while self.executar_proximo():
+            executados += 1
+        return executados
+
+    # ─── Execução ───────────────────────────────────────
+
+    def _laco(self):
+        while not self._parar.is_set():
+            try:
+                if self.executar_proximo():
+                    continue
+            except Exception:
+                logger.exception("jobs_erro_no_laco")
+            self._acordar.wait(self.intervalo_s)
+            self._acordar.clear()
+
+    def recuperar_orfaos(self) -> int:
+        """Jobs `executando` sem heartbeat recente (processo morreu) voltam à fila."""
+        limite = datetime.utcnow() - timedelta(seconds=self.heartbeat_expira_s)
+        with self.fabrica_sessao() as db:
+            n = db.execute(
+                update(Job)
+                .where(Job.status == EXECUTANDO, Job.heartbeat_em < limite)
+                .values(status=PENDENTE)
+            ).rowcount
+            db.commit()
+        if n:
+            logger.warning("jobs_orfaos_recuperados", extra={"quantidade": n})
+        return n
+
+    def _reservar(self) -> Optional[str]:
+        with self.fabrica_sessao() as db:
+            candidatos = db.scalars(
+                select(Job.id).where(Job.status == PENDENTE)
+                .order_by(Job.criado_em).limit(5)
+            ).all()
+            agora = datetime.utcnow()
+            for job_id in candidatos:
+                reservado = db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == PENDENTE)
+                    .values(status=EXECUTANDO, tentativas=Job.tentativas + 1,
+                            iniciado_em=func.coalesce(Job.iniciado_em, agora),
+                            heartbeat_em=agora)
+                ).rowcount
+                db.commit()
+                if reservado:
+                    return job_id
+        return None
+
+    def _manter_heartbeat(self, ctx: ContextoJob, fim: threading.Event):
+        while not fim.wait(self.heartbeat_expira_s / 4):
+            try:
+                if not ctx.renovar_heartbeat():
+                    return  # job perdido: o handler para no próximo verificar()
+            except Exception:
+                logger.exception("jobs_erro_no_heartbeat", extra={"job_id": ctx.id})
+
+    def executar_proximo(self) -> bool:
+        if time.monotonic() - self._ultima_recuperacao >= self.heartbeat_expira_s / 2:
+            self._ultima_recuperacao = time.monotonic()
+            self.recuperar_orfaos()
+
+        job_id = self._reservar()
+        if job_id is None:
+            return False
+
+        with self.fabrica_sessao() as db:
+            job = db.get(Job, job_id)
+            ctx = ContextoJob(self, job)
+            handler = TIPOS.get(job.tipo)
+            tentativas = job.tentativas
+
+        valores = {}
+        fim = threading.Event()
+        batimento = threading.Thread(target=self._manter_heartbeat, args=(ctx, fim),
+                                     name=f"jobs-heartbeat-{job_id[:8]}", daemon=True)
+        batimento.start()
+        try:
+            if handler is None:
+                raise TipoJobDesconhecido(job.tipo)
+            logger.info("job_iniciado", extra={"job_id": job_id, "tentativa": tentativas})
+            os.makedirs(self.diretorio, exist_ok=True)
+            handler(ctx)
+            valores = {"status": CONCLUIDO, "arquivo": ctx.arquivo,
+                       "concluido_em": datetime.utcnow(), "erro": None}
+        except JobPerdido:
+            logger.warning("job_perdido", extra={"job_id": job_id, "tentativa": tentativas})
+            return True
+        except JobInterrompido:
+            valores = {"status": PENDENTE}
+            logger.info("job_interrompido", extra={"job_id": job_id})
+        except Exception as e:
+            logger.exception("job_falhou", extra={"job_id": job_id})
+            definitivo = tentativas >= self.max_tentativas or isinstance(e, TipoJobDesconhecido)
+            valores = {"status": FALHOU if definitivo else PENDENTE, "erro": str(e)}
+        finally:
+            fim.set()
+            batimento.join()
+        if not ctx._atualizar(**valores):
+            logger.warning("job_perdido", extra={"job_id": job_id, "tentativa": tentativas})
+        return True
+
+
+# ═══════════════════════════════════════════════════════════
+# TIPOS DE JOB
+# ═══════════════════════════════════════════════════════════
+
+LOTE_EXPORT = 1000
+COLUNAS_EXPORT = [
+    "id", "numero", "serie", "emitente_cnpj", "destinatario_cnpj",
+    "valor_total", "status", "data_emissao", "observacao",
+]
+
+
+FILTROS_EXPORT = ("cnpj", "emitente_cnpj", "destinatario_cnpj", "status", "valor_min", "valor_max")
+
+
+def _filtros_export(p: dict) -> list:
+    """Os filtros da busca (app/busca.py), a partir dos parâmetros em JSON."""
+    datas = {c: datetime.fromisoformat(p[c]) for c in ("data_inicio", "data_fim") if p.get(c)}
+    return filtros_notas(**{c: p.get(c) for c in FILTROS_EXPORT}, **datas)
+
+
+def _linhas(notas: list[NotaFiscal], formato: str) -> bytes:
+    registros = [
+        {c: getattr(n, c) for c in COLUNAS_EXPORT} | {"data_emissao": n.data_emissao.isoformat()}
+        for n in notas
+    ]
+    if formato == "jsonl":
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros).encode()
+    if formato == "msgpack":
+        return b"".join(empacotar_msgpack(list(r.values())) for r in registros)
+    buf = io.StringIO()
+    csv.DictWriter(buf, COLUNAS_EXPORT, lineterminator="\n").writerows(registros)
+    return buf.getvalue().encode()
+
+
+@tipo_job("exportar_notas")
+def exportar_notas(ctx: ContextoJob):
+    """
+    Exporta notas em lotes por id crescente. Checkpoint = último id e
+    tamanho do arquivo: na retomada o arquivo é truncado nesse ponto, então
+    um lote gravado pela metade antes da queda não se repete.
+
+    Só o banco: notas já movidas para o arquivo frio (app/arquivo_frio.py)
+    não entram — o Parquet em ARQUIVO_DIR já é o export delas.
+    """
+    formato = ctx.parametros.get("formato", "csv")
+    filtros = _filtros_export(ctx.parametros)
+    ck = ctx.checkpoint
+    if ck is None or not os.path.exists(ctx.arquivo):
+        ck = {"ultimo_id": 0, "bytes": 0, "processados": 0}
+
+    with ctx.sessao() as db:
+        total = db.scalar(select(func.count()).select_from(NotaFiscal).where(*filtros))
+
+    with open(ctx.arquivo, "r+b" if ck["bytes"] else "wb") as f:
+        f.truncate(ck["bytes"])
+        f.seek(ck["bytes"])
+        if not ck["bytes"] and formato == "csv":
+            f.write((",".join(COLUNAS_EXPORT) + "\n").encode())
+        elif not ck["bytes"] and formato == "msgpack":
+            # Stream de objetos: a lista de colunas, depois um array por nota
+            f.write(empacotar_msgpack(COLUNAS_EXPORT))
+
+        while True:
+            with ctx.sessao() as db:
+                lote = db.scalars(
+                    select(NotaFiscal)
+                    .where(*filtros, NotaFiscal.id > ck["ultimo_id"])
+                    .order_by(NotaFiscal.id)
+                    .limit(LOTE_EXPORT)
+                ).all()
+                if not lote:
+                    break
+                ctx.verificar()  # outro worker assumiu: não escreve no arquivo dele
+                f.write(_linhas(lote, formato))
+            f.flush()
+            os.fsync(f.fileno())
+            ck = {
+                "ultimo_id": lote[-1].id,
+                "bytes": f.tell(),
+                "processados": ck["processados"] + len(lote),
+            }
+            ctx.progresso(ck["processados"], total, ck)
+
+
+@tipo_job("conciliar_totais")
+def conciliar_totais(ctx: ContextoJob):
+    """Relatório CSV de notas cujo valor_total difere da soma dos itens."""
+    from app.conciliacao import conciliar_totais as conciliar  # NumPy só neste job
+
+    conciliar(
+        ctx.sessao, ctx.arquivo, ctx.checkpoint,
+        ao_concluir_lote=lambda ck, total: ctx.progresso(ck["notas"], total, ck),
+    )
@@ -20,17 +20,41 @@ from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi import Body, FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import text
-from jose import jwt
-
-from app.database import engine, get_db, Base
-from app.models import Produto, NotaFiscal, ItemNota
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+
+from app.admissao import RESERVA_ROTAS_LIVRES, ControleAdmissao, Rejeitado
+from app import consultas
+from app.alteracoes import eventos_sse, listar_alteracoes
+from app.prazos import MiddlewarePrazo, PrazoEsgotado, foi_cancelamento
+from app.database import (
+    POOL_MAX_OVERFLOW, POOL_SIZE, SessionLocal, fabrica_leitura, get_db, get_db_leitura,
+)
+from app.jobs import CONCLUIDO, FALHOU, GerenciadorJobs
+from app.busca import buscar_notas, codificar_cursor, decodificar_cursor, CursorInvalido
+from app.arquivo_frio import ArquivoFrio, mesclar_pagina
+from app.catalogo import Catalogo
+from app.diagnostico import DiagnosticoMemoria, TracemallocInativo
+from app.idempotencia import Idempotencia, idempotencia
+from app.importacao import (
+    LOTE_MAX_NOTAS, MAX_ERROS_RESPOSTA, importar_lote, numeros_existentes, produtos_existentes,
+    validar_lote,
+)
+from app.formatos import (
+    MIDIA_JSON, RESPOSTAS_TABULARES, negociar, responder_tabela, resposta_compacta,
+)
+from app.projecao import CamposInvalidos, Projecao
+from app.models import Job, Produto, NotaFiscal, registrar_alteracoes
 from app.schemas import (
     ProdutoResponse, ProdutoCreate, ProdutoUpdate,
-    NotaFiscalResponse, NotaFiscalCreate,
+    NotaFiscalResponse, NotaFiscalCreate, ItemNotaResponse,
+    NotaLookupRequest, NotaLookupResponse, NotaResumoResponse, NotaLoteResponse,
+    TotalEmitenteResponse,
+    JobExportRequest, JobResponse, AlteracoesResponse,
     Token, LoginRequest,
 )
 
@@ -42,13 +66,17 @@ logger = logging.getLogger("asis_taxtech")
 logging.basicConfig(level=logging.INFO)
 
 
-# ─── Lifespan: seed do banco ────────────────────────────
+# ─── Lifespan ───────────────────────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Cria tabelas e popula dados de exemplo no startup."""
-    Base.metadata.create_all(bind=engine)
-    seed_database()
+    """
+    Startup sem acesso ao banco: schema e seed são passos explícitos
+    (`python -m app.cli migrar` / `seed`), executados antes de subir a API.
+    O pool de jobs só cria as threads; elas consultam a fila depois.
+    """
+    app.state.jobs.iniciar()
     yield
+    app.state.jobs.parar()
 
 
 app = FastAPI(
@@ -57,6 +85,10 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan,
 )
+app.state.jobs = GerenciadorJobs.do_ambiente(SessionLocal)
+app.state.arquivo = ArquivoFrio.do_ambiente()
+app.state.catalogo = Catalogo.do_ambiente()
+app.state.diagnostico = DiagnosticoMemoria()
 
 app.add_middleware(
     CORSMiddleware,
@@ -66,6 +98,82 @@ app.add_middleware(
 )
 
 
+# ═══════════════════════════════════════════════════════════
+# MIDDLEWARE — CONTROLE DE ADMISSÃO
+# ═══════════════════════════════════════════════════════════
+# Declarado ANTES do middleware de correlation ID: o último registrado é o
+# mais externo, então requests rejeitados também recebem X-Correlation-ID.
+
+app.state.admissao = ControleAdmissao.do_ambiente()
+if (app.state.admissao.conexoes_maximas() + app.state.jobs.workers + RESERVA_ROTAS_LIVRES
+        > POOL_SIZE + POOL_MAX_OVERFLOW):
+    logger.warning(
+        "admissao_excede_pool",
+        extra={
+            "conexoes_rotas_limitadas": app.state.admissao.conexoes_maximas(),
+            "jobs_workers": app.state.jobs.workers,
+            "pool": POOL_SIZE + POOL_MAX_OVERFLOW,
+        },
+    )
+
+
+@app.middleware("http")
+async def admissao_middleware(request: Request, call_next):
+    """
+    Limita concorrência/fila por rota (503) e taxa por cliente (429).
+    Rotas sem limite configurado passam direto. Ver app/admissao.py.
+    """
+    try:
+        portao = await request.app.state.admissao.admitir(request)
+    except Rejeitado as r:
+        logger.warning(
+            "request_rejeitado",
+            extra={
+                "path": request.url.path,
+                "status_code": r.status_code,
+                "retry_after": r.retry_after,
+            }
+        )
+        return JSONResponse(
+            status_code=r.status_code,
+            content={"detail": r.detail},
+            headers={"Retry-After": str(r.retry_after)},
+        )
+
+    if portao is None:
+        return await call_next(request)
+    try:
+        return await call_next(request)
+    finally:
+        portao.sair()
+
+
+# ═══════════════════════════════════════════════════════════
+# MIDDLEWARE — PRAZOS DE REQUEST
+# ═══════════════════════════════════════════════════════════
+# Entre a admissão e o correlation ID: o tempo na fila da admissão conta
+# no prazo, e o 504 também recebe X-Correlation-ID. Ver app/prazos.py.
+
+app.add_middleware(MiddlewarePrazo)
+
+
+@app.exception_handler(PrazoEsgotado)
+async def prazo_esgotado_handler(request: Request, exc: PrazoEsgotado):
+    return JSONResponse(status_code=504, content={"detail": "Tempo limite do request excedido"})
+
+
+@app.exception_handler(OperationalError)
+async def erro_operacional_handler(request: Request, exc: OperationalError):
+    """Query cancelada pelo prazo (statement_timeout / interrupt) → 504."""
+    if not foi_cancelamento(exc):
+        raise exc
+    logger.warning(
+        "query_cancelada",
+        extra={"path": request.url.path, "erro": str(exc.orig)},
+    )
+    return JSONResponse(status_code=504, content={"detail": "Tempo limite do request excedido"})
+
+
 # ═══════════════════════════════════════════════════════════
 # MIDDLEWARE — RASTREABILIDADE (Driver 2)
 # ═══════════════════════════════════════════════════════════
@@ -142,26 +250,167 @@ def listar_notas_v1(db: Session = Depends(get_db)):
     return notas
 
 
-@app.get("/v2/notas", response_model=list[NotaFiscalResponse])
+@app.get("/v2/notas", response_model=list[NotaFiscalResponse], responses=RESPOSTAS_TABULARES)
 def listar_notas_v2(
+    request: Request,
+    response: Response,
     limit: int = Query(default=20, le=100, ge=1),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula (ex.: id,numero,status); `itens` inclui os itens"),
+    db: Session = Depends(get_db_leitura),
 ):
     """
     VERSÃO CORRIGIDA:
       - Paginação com limit/offset
-      - Eager loading com joinedload (elimina N+1)
+      - Resumo dos itens vem das colunas agregadas da nota (sem N+1 e
+        sem JOIN em itens_nota)
       - Limite máximo de 100 registros por página
+      - Accept colunar/msgpack para consumo serviço-a-serviço (app/formatos.py)
+      - fields= projeta só as colunas pedidas no SELECT (app/projecao.py)
+    """
+    query = db.query(NotaFiscal).order_by(NotaFiscal.id).offset(offset).limit(limit)
+    midia = negociar(request.headers.get("Accept"))
+    if fields is not None:
+        return _listar_projetado(PROJECAO_NOTAS, query, fields, midia)
+
+    notas = query.all()
+    if midia != MIDIA_JSON:
+        return resposta_compacta(midia, notas, NotaFiscalResponse)
+    response.headers["Vary"] = "Accept"
+    return notas
+
+
+PROJECAO_NOTAS = Projecao(NotaFiscal, NotaFiscalResponse, relacoes={"itens": ItemNotaResponse})
+PROJECAO_PRODUTOS = Projecao(Produto, ProdutoResponse)
+
+
+def _listar_projetado(projecao: Projecao, query, fields: str, midia: str) -> Response:
+    try:
+        campos = projecao.campos(fields)
+    except CamposInvalidos as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    linhas = projecao.serializar(projecao.aplicar(query, campos).all(), campos)
+    return _responder_projetado(campos, linhas, midia)
+
+
+def _responder_projetado(campos: list[str], linhas: list[dict], midia: str) -> Response:
+    if midia == MIDIA_JSON:
+        return JSONResponse(linhas, headers={"Vary": "Accept"})
+    return responder_tabela(midia, {"columns": campos, "rows": [list(l.values()) for l in linhas]})
+
+
+@app.post("/v2/notas/lookup", response_model=NotaLookupResponse)
+def lookup_notas_v2(payload: NotaLookupRequest, db: Session = Depends(get_db_leitura)):
+    """
+    Resolve uma lista de ids em UMA query (WHERE id IN (...)).
+    Substitui N chamadas a /v2/notas/{id} — uma sessão, um SELECT,
+    itens carregados via joinedload. Ids inexistentes são reportados
+    em `nao_encontrados`, na ordem em que foram pedidos.
     """
+    ids = list(dict.fromkeys(payload.ids))  # remove duplicados, preserva ordem
     notas = (
         db.query(NotaFiscal)
         .options(joinedload(NotaFiscal.itens))
-        .order_by(NotaFiscal.id)
-        .offset(offset)
-        .limit(limit)
+        .filter(NotaFiscal.id.in_(ids))
         .all()
     )
+    por_id = {n.id: n for n in notas}
+    return {
+        "notas": [por_id[i] for i in ids if i in por_id],
+        "nao_encontrados": [i for i in ids if i not in por_id],
+    }
+
+
+@app.post("/v2/notas/lote", response_model=NotaLoteResponse, status_code=201)
+def importar_notas_lote(
+    notas: list = Body(..., embed=True, min_length=1, max_length=LOTE_MAX_NOTAS),
+    db: Session = Depends(get_db),
+):
+    """
+    Importa até LOTE_MAX_NOTAS notas (com itens) em uma transação.
+    Validação vetorizada do lote inteiro (app/importacao.py): CNPJ com DV,
+    valores, soma dos itens = valor_total e numero único (no lote e no
+    banco). Qualquer erro → 422 com a lista de erros por índice, e nada é
+    gravado.
+    """
+    # Ids já no catalogo em memória não vão ao banco (produtos não são removidos pela API)
+    conhecidos = app.state.catalogo.obter(db).ids
+    lote = validar_lote(notas, produtos_existentes(db, notas, conhecidos),
+                        numeros_existentes(db, notas))
+    if not lote.valido:
+        raise HTTPException(status_code=422, detail={
+            "mensagem": "Lote rejeitado: nenhuma nota foi gravada",
+            "total_erros": len(lote.erros),
+            "erros": [vars(e) for e in lote.erros[:MAX_ERROS_RESPOSTA]],
+        })
+    ids = importar_lote(db, lote)
+    db.commit()
+    return {"inseridas": len(ids), "ids": ids}
+
+
+# ═══════════════════════════════════════════════════════════
+# BUSCA DE NOTAS (v2) — filtros combinados + paginação keyset
+# ═══════════════════════════════════════════════════════════
+
+CNPJ_PATTERN = r"^\d{14}$"
+
+
+@app.get("/v2/notas/busca", response_model=list[NotaResumoResponse], responses=RESPOSTAS_TABULARES)
+def buscar_notas_v2(
+    request: Request,
+    response: Response,
+    cnpj: Optional[str] = Query(None, pattern=CNPJ_PATTERN, description="Emitente OU destinatário"),
+    emitente_cnpj: Optional[str] = Query(None, pattern=CNPJ_PATTERN),
+    destinatario_cnpj: Optional[str] = Query(None, pattern=CNPJ_PATTERN),
+    status: Optional[str] = Query(None, pattern=r"^(emitida|autorizada|cancelada)$"),
+    data_inicio: Optional[datetime] = Query(None, description="Inclusivo"),
+    data_fim: Optional[datetime] = Query(None, description="Exclusivo"),
+    valor_min: Optional[float] = Query(None, ge=0),
+    valor_max: Optional[float] = Query(None, ge=0),
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Busca textual em observacao"),
+    limit: int = Query(default=20, le=100, ge=1),
+    cursor: Optional[str] = Query(None, description="Valor de X-Proximo-Cursor"),
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    VERSÃO CORRIGIDA:
+      1. Validação de input via Query params (regex CNPJ, status, faixas)
+      2. Query parametrizada via ORM (sem f-string)
+      3. Paginação keyset: a próxima página vem no header X-Proximo-Cursor
+         (ausente na última página)
+      4. Limite máximo de 100 registros por página
+      5. `q`: busca textual em observacao, ordenada por relevância
+      6. Accept colunar/msgpack para consumo serviço-a-serviço
+      7. Notas já movidas para o arquivo frio entram na mesma página
+         (exceto na busca textual `q`, que só consulta o banco)
+    """
+    filtros = dict(
+        cnpj=cnpj,
+        emitente_cnpj=emitente_cnpj,
+        destinatario_cnpj=destinatario_cnpj,
+        status=status,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+        valor_min=valor_min,
+        valor_max=valor_max,
+    )
+    try:
+        notas, proximo = buscar_notas(db, **filtros, q=q, limit=limit, cursor=cursor)
+        arquivo = request.app.state.arquivo
+        if q is None and arquivo.ativo:
+            arquivadas = arquivo.buscar(
+                limit=limit + 1, apos=decodificar_cursor(cursor) if cursor else None, **filtros
+            )
+            notas, mais = mesclar_pagina(notas, proximo, arquivadas, limit)
+            proximo = codificar_cursor(notas[-1]) if mais and notas else None
+    except CursorInvalido as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    headers = {"X-Proximo-Cursor": proximo} if proximo else {}
+    midia = negociar(request.headers.get("Accept"))
+    if midia != MIDIA_JSON:
+        return resposta_compacta(midia, notas, NotaResumoResponse, headers)
+    response.headers.update({"Vary": "Accept", **headers})
     return notas
 
 
@@ -192,7 +441,7 @@ def obter_nota_v1(nota_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/v2/notas/{nota_id}")
-def obter_nota_v2(nota_id: int, request: Request, db: Session = Depends(get_db)):
+def obter_nota_v2(nota_id: int, request: Request, db: Session = Depends(get_db_leitura)):
     """
     VERSÃO CORRIGIDA: Log estruturado COM correlation ID.
     Cada log entry pode ser rastreada até o request original.
@@ -204,7 +453,7 @@ def obter_nota_v2(nota_id: int, request: Request, db: Session = Depends(get_db))
         extra={"correlation_id": cid, "nota_id": nota_id}
     )
 
-    nota = db.query(NotaFiscal).filter(NotaFiscal.id == nota_id).first()
+    nota = consultas.nota_resumo(db, nota_id)
     if not nota:
         logger.warning(
             "nota_nao_encontrada",
@@ -258,6 +507,7 @@ def atualizar_estoque_v1(
     # Atualização SEM lock — vulnerável a lost update
     produto.estoque = produto.estoque + quantidade
     db.commit()
+    app.state.catalogo.invalidar()
     db.refresh(produto)
 
     return {"id": produto.id, "estoque": produto.estoque}
@@ -269,6 +519,7 @@ def atualizar_estoque_v2(
     quantidade: int = Query(...),
     version: int = Query(..., description="Versão atual do produto"),
     db: Session = Depends(get_db),
+    idem: Idempotencia = Depends(idempotencia),
 ):
     """
     VERSÃO CORRIGIDA: Optimistic locking.
@@ -276,26 +527,29 @@ def atualizar_estoque_v2(
       1. Client envia version que ele leu
       2. UPDATE só executa WHERE version = version_enviada
       3. Se outro request já atualizou, rows_affected = 0 → 409 Conflict
+    Com Idempotency-Key, o retry recebe a primeira resposta (ver app/idempotencia.py).
     """
-    result = db.execute(
-        text("""
-            UPDATE produtos
-            SET estoque = estoque + :quantidade,
-                version = version + 1
-            WHERE id = :id AND version = :version
-        """),
-        {"quantidade": quantidade, "id": produto_id, "version": version}
-    )
-    db.commit()
+    anterior = idem.anterior()
+    if anterior is not None:
+        return anterior  # retry com a mesma Idempotency-Key: não reaplica o delta
 
-    if result.rowcount == 0:
+    # UPDATE ... RETURNING pré-compilado: sem SELECT depois (ver app/consultas.py)
+    produto = consultas.atualizar_estoque(db, produto_id, version, quantidade)
+    if produto is None:
+        db.rollback()
         raise HTTPException(
             status_code=409,
             detail="Conflito de concorrência — o registro foi alterado por outro usuário. Recarregue e tente novamente."
         )
 
-    produto = db.query(Produto).filter(Produto.id == produto_id).first()
-    return {"id": produto.id, "estoque": produto.estoque, "version": produto.version}
+    # UPDATE em SQL puro não passa pelos eventos do ORM
+    registrar_alteracoes(db.connection(), [{
+        "entidade": "produto", "entidade_id": produto_id,
+        "operacao": "update", "versao": version + 1,
+    }])
+    resposta = idem.concluir(200, dict(produto._mapping))
+    app.state.catalogo.invalidar()
+    return resposta
 
 
 # ═══════════════════════════════════════════════════════════
@@ -322,34 +576,8 @@ def buscar_notas_v1(
     return []
 
 
-@app.get("/v2/notas/busca")
-def buscar_notas_v2(
-    cnpj: Optional[str] = Query(None, min_length=14, max_length=14, pattern=r"^\d{14}$"),
-    db: Session = Depends(get_db),
-):
-    """
-    VERSÃO CORRIGIDA:
-      1. Validação de input via Query params (regex CNPJ)
-      2. Query parametrizada (sem f-string)
-      3. Usa ORM em vez de raw SQL
-    """
-    if cnpj:
-        notas = (
-            db.query(NotaFiscal)
-            .filter(NotaFiscal.emitente_cnpj == cnpj)
-            .all()
-        )
-        return [
-            {
-                "id": n.id,
-                "numero": n.numero,
-                "emitente_cnpj": n.emitente_cnpj,
-                "valor_total": n.valor_total,
-                "status": n.status,
-            }
-            for n in notas
-        ]
-    return []
+# A versão corrigida (v2) da busca fica na seção "BUSCA DE NOTAS", declarada
+# antes de /v2/notas/{nota_id} para não ser capturada pela rota com path param.
 
 
 # ─── Autenticação simples (para demonstrar o driver) ────
@@ -362,6 +590,7 @@ USERS_DB = {
 @app.post("/v2/auth/token", response_model=Token)
 def login(credentials: LoginRequest):
     """Gera JWT token para endpoints protegidos."""
+    from jose import jwt
     from passlib.context import CryptContext
     pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -385,6 +614,7 @@ def endpoint_protegido(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Token não fornecido")
 
     token = auth.replace("Bearer ", "")
+    from jose import jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except Exception:
@@ -397,95 +627,287 @@ def endpoint_protegido(request: Request, db: Session = Depends(get_db)):
     }
 
 
+ADMINS = set(os.getenv("DIAGNOSTICO_ADMINS", "admin").split(","))
+
+
+def exigir_admin(request: Request) -> str:
+    """Dependência: JWT válido (401) cujo `sub` está em DIAGNOSTICO_ADMINS (403)."""
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Token não fornecido")
+
+    from jose import jwt
+    try:
+        payload = jwt.decode(auth.replace("Bearer ", ""), SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception:
+        raise HTTPException(status_code=401, detail="Token inválido ou expirado")
+    if payload.get("sub") not in ADMINS:
+        raise HTTPException(status_code=403, detail="Restrito a administradores")
+    return payload["sub"]
+
+
+# ═══════════════════════════════════════════════════════════
+# DIAGNÓSTICO DE MEMÓRIA (admin)
+# ═══════════════════════════════════════════════════════════
+# Por processo (app/diagnostico.py): com vários workers, `pid` diz qual respondeu.
+
+@app.get("/v2/admin/memoria", dependencies=[Depends(exigir_admin)])
+def diagnostico_memoria(
+    request: Request,
+    coletar: bool = Query(False, description="Roda gc.collect() antes de medir"),
+):
+    """RSS, estatísticas do gc, identity maps das sessões vivas e estado do tracemalloc."""
+    return request.app.state.diagnostico.resumo(coletar)
+
+
+@app.post("/v2/admin/memoria/tracemalloc", dependencies=[Depends(exigir_admin)])
+def iniciar_tracemalloc(request: Request, frames: int = Query(1, ge=1, le=50)):
+    """Liga o tracemalloc (reinicia se já ligado). Mais frames = pilhas maiores, mais custo."""
+    diagnostico = request.app.state.diagnostico
+    diagnostico.iniciar(frames)
+    return diagnostico.resumo()["tracemalloc"]
+
+
+@app.delete("/v2/admin/memoria/tracemalloc", status_code=204, dependencies=[Depends(exigir_admin)])
+def parar_tracemalloc(request: Request):
+    request.app.state.diagnostico.parar()
+    return Response(status_code=204)
+
+
+@app.post("/v2/admin/memoria/snapshots", status_code=201, dependencies=[Depends(exigir_admin)])
+def capturar_snapshot(
+    request: Request,
+    agrupar: str = Query("lineno", pattern=r"^(lineno|filename|traceback)$"),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """Snapshot do tracemalloc e os maiores locais de alocação ainda vivos."""
+    diagnostico = request.app.state.diagnostico
+    try:
+        numero = diagnostico.capturar()
+    except TracemallocInativo as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"id": numero, "pid": os.getpid(), "top": diagnostico.top(numero, agrupar, limit)}
+
+
+@app.get("/v2/admin/memoria/snapshots/{snapshot_id}/diff", dependencies=[Depends(exigir_admin)])
+def diff_snapshots(
+    request: Request,
+    snapshot_id: int,
+    base: int = Query(..., description="Snapshot anterior"),
+    agrupar: str = Query("lineno", pattern=r"^(lineno|filename|traceback)$"),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """Locais cuja memória retida mais mudou de `base` para `snapshot_id`."""
+    try:
+        diferencas = request.app.state.diagnostico.diff(snapshot_id, base, agrupar, limit)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Snapshot não encontrado (ou já descartado)")
+    return {"id": snapshot_id, "base": base, "pid": os.getpid(), "diferencas": diferencas}
+
+
+# ═══════════════════════════════════════════════════════════
+# RELATÓRIOS (banco + arquivo frio)
+# ═══════════════════════════════════════════════════════════
+
+@app.get("/v2/relatorios/emitentes", response_model=list[TotalEmitenteResponse])
+def relatorio_emitentes(
+    request: Request,
+    data_inicio: Optional[datetime] = Query(None, description="Inclusivo"),
+    data_fim: Optional[datetime] = Query(None, description="Exclusivo"),
+    limit: int = Query(default=20, le=1000, ge=1),
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Quantidade e valor de notas por emitente no período, maiores primeiro.
+    Soma o GROUP BY do banco com o group-by do arquivo frio (app/arquivo_frio.py);
+    nota nos dois lados (lote pendente) conta uma vez só.
+    """
+    query = select(
+        NotaFiscal.emitente_cnpj, func.count(NotaFiscal.id), func.sum(NotaFiscal.valor_total)
+    ).group_by(NotaFiscal.emitente_cnpj)
+    if data_inicio:
+        query = query.where(NotaFiscal.data_emissao >= data_inicio)
+    if data_fim:
+        query = query.where(NotaFiscal.data_emissao < data_fim)
+    totais = {cnpj: (qtd, valor) for cnpj, qtd, valor in db.execute(query)}
+
+    arquivo = request.app.state.arquivo
+    if arquivo.ativo:
+        # Lote gravado e ainda não apagado do banco: a nota vale a do banco
+        pendentes = arquivo.ids_pendentes()
+        no_banco = db.scalars(
+            select(NotaFiscal.id).where(NotaFiscal.id.in_(pendentes))
+        ).all() if pendentes else []
+        for cnpj, (qtd, valor) in arquivo.totais_por_emitente(data_inicio, data_fim, no_banco).items():
+            atual = totais.get(cnpj, (0, 0.0))
+            totais[cnpj] = (atual[0] + qtd, atual[1] + valor)
+
+    ordenados = sorted(totais.items(), key=lambda t: t[1][1], reverse=True)[:limit]
+    return [
+        {"emitente_cnpj": cnpj, "notas": qtd, "valor_total": round(valor, 2)}
+        for cnpj, (qtd, valor) in ordenados
+    ]
+
+
+# ═══════════════════════════════════════════════════════════
+# FEED DE ALTERAÇÕES (sincronização incremental)
+# ═══════════════════════════════════════════════════════════
+
+@app.get("/v2/changes", response_model=AlteracoesResponse)
+def listar_alteracoes_v2(
+    since: int = Query(default=0, ge=0, description="Último seq já processado"),
+    limit: int = Query(default=100, ge=1, le=1000),
+    entidade: Optional[str] = Query(None, pattern=r"^(nota|produto)$"),
+    db: Session = Depends(get_db_leitura),
+):
+    """
+    Alterações com seq > since, em ordem. O consumidor guarda
+    `proximo_since` e repete enquanto `tem_mais`. since=0 desde o início.
+    """
+    alteracoes, proximo, tem_mais = listar_alteracoes(db, since, limit, entidade)
+    return {"alteracoes": alteracoes, "proximo_since": proximo, "tem_mais": tem_mais}
+
+
+@app.get("/v2/changes/stream")
+def stream_alteracoes_v2(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    entidade: Optional[str] = Query(None, pattern=r"^(nota|produto)$"),
+    abrir_sessao=Depends(fabrica_leitura),
+):
+    """Server-Sent Events; na reconexão, Last-Event-ID tem precedência sobre since."""
+    ultimo = request.headers.get("Last-Event-ID")
+    inicio = int(ultimo) if ultimo and ultimo.isdigit() else (since or 0)
+    return StreamingResponse(
+        eventos_sse(abrir_sessao, inicio, entidade),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ═══════════════════════════════════════════════════════════
+# JOBS EM SEGUNDO PLANO
+# ═══════════════════════════════════════════════════════════
+# Exportações grandes não rodam no request: o POST só enfileira (202) e o
+# cliente acompanha pelo GET. Status e resultado leem do primário — o
+# progresso muda a cada lote e uma réplica atrasada mostraria estado velho.
+
+MIDIA_RESULTADO = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "msgpack": "application/msgpack",
+}
+
+
+@app.post("/v2/jobs/export", response_model=JobResponse, status_code=202)
+def submeter_export(
+    payload: JobExportRequest,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    job = request.app.state.jobs.submeter(
+        db, "exportar_notas", payload.model_dump(mode="json", exclude_none=True)
+    )
+    response.headers["Location"] = f"/v2/jobs/{job.id}"
+    return job
+
+
+@app.post("/v2/jobs/conciliacao", response_model=JobResponse, status_code=202)
+def submeter_conciliacao(request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Enfileira a conciliação valor_total x soma dos itens de todas as notas.
+    O resultado é um CSV só com as divergentes (app/conciliacao.py).
+    """
+    job = request.app.state.jobs.submeter(db, "conciliar_totais", {"formato": "csv"})
+    response.headers["Location"] = f"/v2/jobs/{job.id}"
+    return job
+
+
+def _obter_job(db: Session, job_id: str) -> Job:
+    job = db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@app.get("/v2/jobs/{job_id}", response_model=JobResponse)
+def obter_job(job_id: str, db: Session = Depends(get_db)):
+    return _obter_job(db, job_id)
+
+
+@app.get("/v2/jobs/{job_id}/resultado")
+def baixar_resultado_job(job_id: str, db: Session = Depends(get_db)):
+    job = _obter_job(db, job_id)
+    if job.status == FALHOU:
+        raise HTTPException(status_code=409, detail=f"Job falhou: {job.erro}")
+    if job.status != CONCLUIDO:
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído ({job.status})")
+    if not job.arquivo or not os.path.exists(job.arquivo):
+        raise HTTPException(status_code=410, detail="Arquivo de resultado não está mais disponível")
+    extensao = job.arquivo.rsplit(".", 1)[-1]
+    return FileResponse(
+        job.arquivo,
+        media_type=MIDIA_RESULTADO.get(extensao, "application/octet-stream"),
+        filename=f"{job.tipo}_{job.id}.{extensao}",
+    )
+
+
 # ═══════════════════════════════════════════════════════════
 # CRUD Básico de Produtos (auxiliar)
 # ═══════════════════════════════════════════════════════════
 
-@app.get("/v2/produtos", response_model=list[ProdutoResponse])
+@app.get("/v2/produtos", response_model=list[ProdutoResponse], responses=RESPOSTAS_TABULARES)
 def listar_produtos(
+    request: Request,
+    response: Response,
     limit: int = Query(default=20, le=100, ge=1),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula (ex.: id,codigo,estoque)"),
+    ncm_prefix: Optional[str] = Query(None, pattern=r"^\d{1,8}$", description="Prefixo do NCM (ex.: 22 capítulo, 2203 posição)"),
+    db: Session = Depends(get_db_leitura),
 ):
-    return db.query(Produto).offset(offset).limit(limit).all()
+    midia = negociar(request.headers.get("Accept"))
+    if ncm_prefix is not None:
+        # Servido do catálogo em memória (app/catalogo.py), ordenado por (ncm, id)
+        produtos = request.app.state.catalogo.obter(db).por_prefixo_ncm(ncm_prefix, limit, offset)
+        try:
+            campos = list(ProdutoResponse.model_fields) if fields is None \
+                else PROJECAO_PRODUTOS.campos(fields)
+        except CamposInvalidos as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return _responder_projetado(campos, [{c: p[c] for c in campos} for p in produtos], midia)
+    if fields is not None:
+        query = db.query(Produto).order_by(Produto.id).offset(offset).limit(limit)
+        return _listar_projetado(PROJECAO_PRODUTOS, query, fields, midia)
+    produtos = db.query(Produto).offset(offset).limit(limit).all()
+    if midia != MIDIA_JSON:
+        return resposta_compacta(midia, produtos, ProdutoResponse)
+    response.headers["Vary"] = "Accept"
+    return produtos
 
 
 @app.get("/v2/produtos/{produto_id}", response_model=ProdutoResponse)
-def obter_produto(produto_id: int, db: Session = Depends(get_db)):
-    produto = db.query(Produto).filter(Produto.id == produto_id).first()
+def obter_produto(produto_id: int, db: Session = Depends(get_db_leitura)):
+    produto = consultas.produto(db, produto_id)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    return produto
+    return produto._mapping
 
 
 @app.post("/v2/produtos", response_model=ProdutoResponse, status_code=201)
-def criar_produto(produto: ProdutoCreate, db: Session = Depends(get_db)):
+def criar_produto(
+    produto: ProdutoCreate,
+    db: Session = Depends(get_db),
+    idem: Idempotencia = Depends(idempotencia),
+):
+    anterior = idem.anterior()
+    if anterior is not None:
+        return anterior
+
     db_produto = Produto(**produto.model_dump())
     db.add(db_produto)
-    db.commit()
-    db.refresh(db_produto)
-    return db_produto
-
-
-# ═══════════════════════════════════════════════════════════
-# SEED — Dados iniciais
-# ═══════════════════════════════════════════════════════════
-
-def seed_database():
-    """Popula o banco com dados fictícios para os exercícios."""
-    from app.database import SessionLocal
-
-    db = SessionLocal()
-    try:
-        if db.query(Produto).count() > 0:
-            return  # Já populado
-
-        # Criar produtos
-        produtos = []
-        for i in range(1, 11):
-            p = Produto(
-                codigo=f"PROD-{i:04d}",
-                descricao=f"Produto Fiscal {i}",
-                ncm=f"{10000000 + i}",
-                preco_unitario=round(50.0 + i * 12.5, 2),
-                estoque=100 + i * 10,
-            )
-            db.add(p)
-            produtos.append(p)
-        db.flush()
-
-        # Criar 200 notas fiscais (para testar volumetria)
-        for i in range(1, 201):
-            cnpj_emit = f"{11222333000100 + (i % 5):014d}"
-            cnpj_dest = f"{44555666000100 + (i % 8):014d}"
-            nf = NotaFiscal(
-                numero=f"NF-{i:06d}",
-                emitente_cnpj=cnpj_emit,
-                destinatario_cnpj=cnpj_dest,
-                valor_total=round(100.0 + i * 7.5, 2),
-                status=["emitida", "autorizada", "cancelada"][i % 3],
-                data_emissao=datetime(2026, 1, 1) + timedelta(hours=i),
-            )
-            db.add(nf)
-            db.flush()
-
-            # Adicionar 2-3 itens por nota
-            for j in range(1, (i % 3) + 2):
-                prod = produtos[(i + j) % len(produtos)]
-                item = ItemNota(
-                    nota_id=nf.id,
-                    produto_id=prod.id,
-                    quantidade=j * 2,
-                    valor_unitario=prod.preco_unitario,
-                    valor_total=prod.preco_unitario * j * 2,
-                )
-                db.add(item)
-
-        db.commit()
-        logger.info(f"Seed concluído: 10 produtos, 200 notas fiscais")
-
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Erro no seed: {e}")
-    finally:
-        db.close()
+    db.flush()
+    resposta = idem.concluir(201, ProdutoResponse.model_validate(db_produto).model_dump(mode="json"))
+    app.state.catalogo.invalidar()
+    return resposta
@@ -0,0 +1,112 @@
+"""
+Migrações de schema — passo explícito, fora do lifespan da API.
+
+    python -m app.cli migrar
+
+1. `create_all` cria tabelas novas (as existentes não são alteradas)
+2. índices declarados em models.py que ainda não existem são criados —
+   `create_all` só cria índices junto com a própria tabela
+3. passos versionados em MIGRACOES rodam uma única vez, na ordem, e
+   ficam registrados em `schema_migracoes`
+
+Para evoluir o schema de uma tabela existente (ex.: nova coluna), acrescente
+um passo ao FINAL de MIGRACOES; nunca reordene nem renomeie passos aplicados.
+"""
+import logging
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import (
+    Column, DateTime, MetaData, String, Table, inspect, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+from app.database import Base
+from app import models
+
+logger = logging.getLogger("asis_taxtech")
+
+_controle = MetaData()
+schema_migracoes = Table(
+    "schema_migracoes",
+    _controle,
+    Column("nome", String(100), primary_key=True),
+    Column("aplicada_em", DateTime, nullable=False),
+)
+
+
+def _fts_observacao(conn: Connection):
+    """Bancos SQLite criados antes da busca textual: cria e indexa a FTS5."""
+    if conn.dialect.name != "sqlite":
+        return  # PostgreSQL: o índice GIN é criado no passo de índices
+    for ddl in models.NOTAS_FTS_DDL:
+        conn.execute(text(ddl))
+    conn.execute(text(
+        f"INSERT INTO {models.NOTAS_FTS}({models.NOTAS_FTS}) VALUES ('rebuild')"
+    ))
+
+
+def _agregados_itens(conn: Connection):
+    """Colunas de resumo dos itens em notas_fiscais + carga inicial."""
+    existentes = {c["name"] for c in inspect(conn).get_columns("notas_fiscais")}
+    for coluna in ("qtd_itens", "quantidade_total", "produtos_distintos"):
+        if coluna not in existentes:  # bancos novos já nascem com elas
+            conn.execute(text(
+                f"ALTER TABLE notas_fiscais ADD COLUMN {coluna} INTEGER NOT NULL DEFAULT 0"
+            ))
+    conn.execute(models.recalcular_agregados_stmt())
+
+
+def _alteracoes_inicial(conn: Connection):
+    """Bancos com dados anteriores ao feed: um `insert` por nota e produto."""
+    if conn.execute(select(models.Alteracao.seq).limit(1)).first():
+        return
+    for entidade, tabela in (("produto", "produtos"), ("nota", "notas_fiscais")):
+        conn.execute(text(
+            "INSERT INTO alteracoes (entidade, entidade_id, operacao, registrado_em) "
+            f"SELECT '{entidade}', id, 'insert', CURRENT_TIMESTAMP FROM {tabela} ORDER BY id"
+        ))
+
+
+MIGRACOES: list[tuple[str, Callable[[Connection], None]]] = [
+    ("0001_fts_observacao", _fts_observacao),
+    ("0002_agregados_itens", _agregados_itens),
+    ("0003_alteracoes_inicial", _alteracoes_inicial),
+]
+
+
+def _criar_indices_faltantes(conn: Connection) -> list[str]:
+    criados = []
+    for tabela in Base.metadata.sorted_tables:
+        antes = {i["name"] for i in inspect(conn).get_indexes(tabela.name)}
+        for indice in tabela.indexes:
+            if indice.name not in antes:
+                # Índices com ddl_if de outro dialeto são ignorados pelo create
+                indice.create(bind=conn, checkfirst=True)
+        depois = {i["name"] for i in inspect(conn).get_indexes(tabela.name)}
+        criados += sorted(depois - antes)
+    return criados
+
+
+def migrar(engine: Engine) -> list[str]:
+    """Aplica o que falta; retorna o nome dos passos executados agora."""
+    executados = []
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        _controle.create_all(bind=conn)
+        executados += [f"indice:{n}" for n in _criar_indices_faltantes(conn)]
+
+        aplicadas = set(conn.execute(select(schema_migracoes.c.nome)).scalars())
+        for nome, passo in MIGRACOES:
+            if nome in aplicadas:
+                continue
+            passo(conn)
+            conn.execute(
+                schema_migracoes.insert(),
+                {"nome": nome, "aplicada_em": datetime.utcnow()},
+            )
+            executados.append(nome)
+
+    for nome in executados:
+        logger.info(f"Migração aplicada: {nome}")
+    return executados
@@ -3,9 +3,10 @@ Modelos SQLAlchemy — domínio fiscal simplificado para o lab.
 Simula entidades do universo ASIS TaxTech.
 """
 from sqlalchemy import (
-    Column, Integer, String, Float, DateTime, ForeignKey, Text
+    BigInteger, Column, Integer, String, Float, DateTime, ForeignKey, Text, Index,
+    DDL, event, func, insert, inspect, select, text, update,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, relationship
 from datetime import datetime
 
 from app.database import Base
@@ -32,6 +33,14 @@ class Produto(Base):
 class NotaFiscal(Base):
     """Nota Fiscal Eletrônica simplificada."""
     __tablename__ = "notas_fiscais"
+    __table_args__ = (
+        # Índices compostos terminando em (data_emissao, id): atendem os
+        # filtros da busca E a ordenação/cursor keyset no mesmo range scan.
+        Index("ix_notas_emitente_data", "emitente_cnpj", "data_emissao", "id"),
+        Index("ix_notas_destinatario_data", "destinatario_cnpj", "data_emissao", "id"),
+        Index("ix_notas_status_data", "status", "data_emissao", "id"),
+        Index("ix_notas_data_emissao", "data_emissao", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     numero = Column(String(20), unique=True, nullable=False)
@@ -43,15 +52,64 @@ class NotaFiscal(Base):
     data_emissao = Column(DateTime, default=datetime.utcnow)
     observacao = Column(Text, nullable=True)
 
+    # Resumo dos itens, mantido na mesma transação que grava os itens
+    # (ver "Agregados de itens" abaixo) — listagens não precisam de JOIN.
+    qtd_itens = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    quantidade_total = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    produtos_distintos = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
     itens = relationship("ItemNota", back_populates="nota")
 
     def __repr__(self):
         return f"<NF {self.numero} — R${self.valor_total:.2f}>"
 
 
+# ─── Busca textual em NotaFiscal.observacao ─────────────
+# PostgreSQL: índice GIN sobre a expressão tsvector. A busca precisa usar
+# exatamente esta expressão para o planner escolher o índice.
+TS_CONFIG = text("'portuguese'::regconfig")
+TSVECTOR_OBSERVACAO = func.to_tsvector(
+    TS_CONFIG, func.coalesce(NotaFiscal.__table__.c.observacao, text("''"))
+)
+Index(
+    "ix_notas_observacao_fts", TSVECTOR_OBSERVACAO, postgresql_using="gin"
+).ddl_if(dialect="postgresql")
+
+# SQLite (testes): tabela virtual FTS5 de conteúdo externo, mantida por
+# triggers. `rowid` da FTS = `id` da nota.
+NOTAS_FTS = "notas_fiscais_fts"
+NOTAS_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {NOTAS_FTS} USING fts5("
+    "observacao, content='notas_fiscais', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {NOTAS_FTS}_ai AFTER INSERT ON notas_fiscais BEGIN "
+    f"INSERT INTO {NOTAS_FTS}(rowid, observacao) VALUES (new.id, new.observacao); END",
+    f"CREATE TRIGGER IF NOT EXISTS {NOTAS_FTS}_ad AFTER DELETE ON notas_fiscais BEGIN "
+    f"INSERT INTO {NOTAS_FTS}({NOTAS_FTS}, rowid, observacao) "
+    "VALUES ('delete', old.id, old.observacao); END",
+    f"CREATE TRIGGER IF NOT EXISTS {NOTAS_FTS}_au AFTER UPDATE OF observacao ON notas_fiscais BEGIN "
+    f"INSERT INTO {NOTAS_FTS}({NOTAS_FTS}, rowid, observacao) "
+    "VALUES ('delete', old.id, old.observacao); "
+    f"INSERT INTO {NOTAS_FTS}(rowid, observacao) VALUES (new.id, new.observacao); END",
+]
+for _ddl in NOTAS_FTS_DDL:
+    event.listen(
+        NotaFiscal.__table__, "after_create", DDL(_ddl).execute_if(dialect="sqlite")
+    )
+event.listen(
+    NotaFiscal.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {NOTAS_FTS}").execute_if(dialect="sqlite"),
+)
+
+
 class ItemNota(Base):
     """Item de uma Nota Fiscal."""
     __tablename__ = "itens_nota"
+    __table_args__ = (
+        # Cobre a conciliação (soma por nota em faixas de nota_id) e a carga de itens por nota
+        Index("ix_itens_nota_valor", "nota_id", "valor_total"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     nota_id = Column(Integer, ForeignKey("notas_fiscais.id"), nullable=False)
@@ -62,3 +120,206 @@ class ItemNota(Base):
 
     nota = relationship("NotaFiscal", back_populates="itens")
     produto = relationship("Produto", back_populates="itens")
+
+
+# ─── Agregados de itens ─────────────────────────────────
+# Todo flush que insere, altera ou remove ItemNota recalcula o resumo das
+# notas afetadas na mesma transação. As notas já existentes são travadas
+# (FOR UPDATE) antes do flush: duas transações adicionando itens à mesma
+# nota se serializam, e o recálculo da segunda enxerga os itens da primeira.
+# Escritas em itens_nota por SQL puro não passam por aqui — use
+# `python -m app.cli verificar-agregados --reparar`.
+
+def recalcular_agregados_stmt(nota_ids=None):
+    """UPDATE que recalcula o resumo a partir de itens_nota (todas ou `nota_ids`)."""
+    notas, itens = NotaFiscal.__table__, ItemNota.__table__
+    da_nota = itens.c.nota_id == notas.c.id
+    stmt = update(notas).values(
+        qtd_itens=select(func.count()).where(da_nota).scalar_subquery(),
+        quantidade_total=select(
+            func.coalesce(func.sum(itens.c.quantidade), 0)
+        ).where(da_nota).scalar_subquery(),
+        produtos_distintos=select(
+            func.count(func.distinct(itens.c.produto_id))
+        ).where(da_nota).scalar_subquery(),
+    )
+    if nota_ids is not None:
+        stmt = stmt.where(notas.c.id.in_(sorted(nota_ids)))
+    return stmt
+
+
+def _notas_dos_itens(session: Session) -> set[int]:
+    ids = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, ItemNota):
+            ids.add(obj.nota_id)
+            # Item ligado via relationship (`item.nota = nf`), sem nota_id ainda
+            ids.add(getattr(obj.__dict__.get("nota"), "id", None))
+            ids.update(inspect(obj).attrs.nota_id.history.deleted or ())
+    ids.discard(None)
+    return ids
+
+
+@event.listens_for(Session, "before_flush")
+def _travar_notas(session, flush_context, instances):
+    ids = _notas_dos_itens(session)
+    if ids:
+        session.execute(
+            select(NotaFiscal.id).where(NotaFiscal.id.in_(sorted(ids))).with_for_update()
+        )
+
+
+@event.listens_for(Session, "after_flush")
+def _coletar_notas(session, flush_context):
+    ids = _notas_dos_itens(session)  # ainda no estado pré-flush, já com FKs
+    if ids:
+        session.info.setdefault("agregados_pendentes", set()).update(ids)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _recalcular_agregados(session, flush_context):
+    ids = session.info.pop("agregados_pendentes", None)
+    if not ids:
+        return
+    session.connection().execute(recalcular_agregados_stmt(ids))
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, NotaFiscal) and obj.id in ids:
+            session.expire(obj, ["qtd_itens", "quantidade_total", "produtos_distintos"])
+
+
+# ─── Feed de alterações ─────────────────────────────────
+class Alteracao(Base):
+    """
+    Uma linha por insert/update/delete de NotaFiscal ou Produto, com `seq`
+    crescente — consumidores sincronizam com GET /v2/changes?since=<seq>.
+    """
+    __tablename__ = "alteracoes"
+    __table_args__ = (
+        Index("ix_alteracoes_entidade_seq", "entidade", "seq"),
+        {"sqlite_autoincrement": True},  # seq nunca é reutilizado
+    )
+
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    entidade = Column(String(20), nullable=False)  # nota, produto
+    entidade_id = Column(Integer, nullable=False)
+    operacao = Column(String(10), nullable=False)  # insert, update, delete
+    versao = Column(Integer, nullable=True)  # Produto.version após a alteração
+    registrado_em = Column(DateTime, default=datetime.utcnow)
+
+
+# Chave do advisory lock que serializa quem grava alterações no PostgreSQL:
+# sem ele, uma transação pode obter seq=10, outra seq=11 e commitar antes —
+# um consumidor que leu até 11 nunca veria o 10. Com o lock (liberado no
+# commit), a ordem de seq é a ordem de commit.
+# Custo: é uma chave só, do primeiro registro até o COMMIT (fsync incluso),
+# então toda transação que escreve nota ou produto — inclusive o estoque v2
+# e o lote inteiro da importação — espera a anterior terminar. O throughput
+# de escrita fica limitado a ~1 / (flush final + commit), independente do
+# número de workers. Ver o cenário `estoque_v2_paralelo` do bench.
+LOCK_ALTERACOES = 7_310_039
+
+
+def registrar_alteracoes(conn, registros: list[dict]):
+    """Grava alterações na transação corrente (`conn` = session.connection())."""
+    if not registros:
+        return
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": LOCK_ALTERACOES})
+    agora = datetime.utcnow()
+    conn.execute(
+        insert(Alteracao.__table__),
+        [{"versao": None, "registrado_em": agora, **r} for r in registros],
+    )
+
+
+def _alteracao(entidade, obj, operacao):
+    versao = obj.version if isinstance(obj, Produto) else None
+    return {"entidade": entidade, "entidade_id": obj.id, "operacao": operacao, "versao": versao}
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_alteracoes(session, flush_context):
+    """
+    Inserts/updates/deletes via ORM de NotaFiscal e Produto (só estoque e
+    version). Itens alterados contam como update da nota. UPDATEs em SQL
+    puro precisam chamar `registrar_alteracoes` (ver estoque v2).
+    """
+    registros, vistas = [], set()
+    for obj in session.new:
+        if isinstance(obj, NotaFiscal):
+            registros.append(_alteracao("nota", obj, "insert"))
+            vistas.add(obj.id)
+        elif isinstance(obj, Produto):
+            registros.append(_alteracao("produto", obj, "insert"))
+    for obj in session.dirty:
+        if isinstance(obj, NotaFiscal) and session.is_modified(obj, include_collections=False):
+            registros.append(_alteracao("nota", obj, "update"))
+            vistas.add(obj.id)
+        elif isinstance(obj, Produto) and (
+            inspect(obj).attrs.estoque.history.has_changes()
+            or inspect(obj).attrs.version.history.has_changes()
+        ):
+            registros.append(_alteracao("produto", obj, "update"))
+    for obj in session.deleted:
+        if isinstance(obj, NotaFiscal):
+            registros.append(_alteracao("nota", obj, "delete"))
+            vistas.add(obj.id)
+        elif isinstance(obj, Produto):
+            registros.append(_alteracao("produto", obj, "delete"))
+    for nota_id in sorted(_notas_dos_itens(session) - vistas):
+        registros.append({"entidade": "nota", "entidade_id": nota_id, "operacao": "update"})
+    registrar_alteracoes(session.connection(), registros)
+
+
+class Job(Base):
+    """Job em segundo plano (exportações, recálculos). Ver app/jobs.py."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_criado", "status", "criado_em"),
+    )
+
+    id = Column(String(32), primary_key=True)
+    tipo = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="pendente")  # pendente, executando, concluido, falhou
+    parametros = Column(Text, nullable=False, default="{}")  # JSON
+    checkpoint = Column(Text, nullable=True)  # JSON — onde retomar após reinício
+    processados = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=True)
+    arquivo = Column(String(255), nullable=True)
+    erro = Column(Text, nullable=True)
+    tentativas = Column(Integer, nullable=False, default=0)
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    iniciado_em = Column(DateTime, nullable=True)
+    heartbeat_em = Column(DateTime, nullable=True)
+    concluido_em = Column(DateTime, nullable=True)
+
+    @property
+    def progresso(self):
+        if self.status == "concluido":
+            return 1.0
+        if not self.total:
+            return None
+        return round(min(self.processados / self.total, 1.0), 4)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.tipo} {self.status}>"
+
+
+class RespostaIdempotente(Base):
+    """
+    Primeira resposta de uma escrita com header Idempotency-Key, gravada na
+    mesma transação da escrita. Ver app/idempotencia.py.
+    """
+    __tablename__ = "respostas_idempotentes"
+    __table_args__ = (
+        Index("ix_respostas_idempotentes_expira", "expira_em"),
+    )
+
+    cliente = Column(String(64), primary_key=True)
+    chave = Column(String(128), primary_key=True)
+    rota = Column(String(200), nullable=False)          # "PUT /v2/produtos/1/estoque"
+    impressao = Column(String(64), nullable=False)      # sha256 de query + corpo
+    status_code = Column(Integer, nullable=True)        # None enquanto a escrita não terminou
+    corpo = Column(Text, nullable=True)                 # JSON
+    criado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expira_em = Column(DateTime, nullable=False)
@@ -0,0 +1,282 @@
+"""
+Particionamento mensal de notas_fiscais por data_emissao (PostgreSQL).
+
+Quase toda consulta é limitada por data_emissao; com uma partição por mês
+o planner descarta (partition pruning) os meses fora do filtro, e meses
+antigos podem ser desanexados sem DELETE em massa nem VACUUM.
+
+Ciclo de vida:
+  1. `converter`  — transforma a tabela heap existente em particionada,
+                    copiando os dados (executar uma vez, em janela de manutenção)
+  2. `criar`      — garante partições para os próximos N meses (cron diário)
+  3. `arquivar`   — desanexa meses mais antigos que a retenção; os itens
+                    dessas notas vão para itens_nota_AAAA_MM
+
+itens_nota não é particionada: ela não tem data_emissao e uma FK para uma
+tabela particionada exigiria a chave composta (id, data_emissao). Os itens
+acompanham suas notas no arquivamento.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("asis_taxtech")
+
+TABELA = "notas_fiscais"
+PARTICAO_DEFAULT = f"{TABELA}_default"
+_NOME_PARTICAO = re.compile(rf"^{TABELA}_(\d{{4}})_(\d{{2}})$")
+
+
+class ParticionamentoIndisponivel(RuntimeError):
+    """Operação exige PostgreSQL com notas_fiscais particionada."""
+
+
+@dataclass(frozen=True)
+class Particao:
+    nome: str
+    inicio: date  # inclusivo
+    fim: date     # exclusivo
+
+
+def primeiro_dia(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def somar_meses(mes: date, n: int) -> date:
+    total = mes.year * 12 + (mes.month - 1) + n
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def particao_do_mes(mes: date) -> Particao:
+    inicio = primeiro_dia(mes)
+    return Particao(
+        nome=f"{TABELA}_{inicio:%Y_%m}",
+        inicio=inicio,
+        fim=somar_meses(inicio, 1),
+    )
+
+
+def meses_entre(inicio: date, fim: date) -> list[date]:
+    """Primeiro dia de cada mês de `inicio` a `fim`, inclusive."""
+    meses = []
+    mes = primeiro_dia(inicio)
+    while mes <= primeiro_dia(fim):
+        meses.append(mes)
+        mes = somar_meses(mes, 1)
+    return meses
+
+
+def mes_da_particao(nome: str) -> Optional[date]:
+    m = _NOME_PARTICAO.match(nome)
+    return date(int(m.group(1)), int(m.group(2)), 1) if m else None
+
+
+def particoes_a_arquivar(
+    existentes: list[str], reter_meses: int, hoje: Optional[date] = None
+) -> list[Particao]:
+    """Partições cujo mês inteiro é anterior à janela de retenção."""
+    corte = somar_meses(primeiro_dia(hoje or date.today()), -reter_meses)
+    meses = sorted(m for m in map(mes_da_particao, existentes) if m)
+    return [particao_do_mes(m) for m in meses if somar_meses(m, 1) <= corte]
+
+
+def ddl_criar_particao(p: Particao) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {p.nome} PARTITION OF {TABELA} "
+        f"FOR VALUES FROM ('{p.inicio.isoformat()}') TO ('{p.fim.isoformat()}')"
+    )
+
+
+# ─── Operações no banco ─────────────────────────────────
+
+def _exigir_postgres(engine: Engine):
+    if engine.dialect.name != "postgresql":
+        raise ParticionamentoIndisponivel(
+            f"Particionamento requer PostgreSQL (dialeto atual: {engine.dialect.name})"
+        )
+
+
+def _esta_particionada(conn) -> bool:
+    return bool(conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :t"
+        ),
+        {"t": TABELA},
+    ).scalar())
+
+
+def listar_particoes(engine: Engine) -> list[str]:
+    _exigir_postgres(engine)
+    with engine.connect() as conn:
+        return list(conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :t ORDER BY c.relname"
+            ),
+            {"t": TABELA},
+        ).scalars())
+
+
+def _criar_particao(conn, p: Particao):
+    """
+    Cria a partição do mês. Se a partição DEFAULT já tiver linhas desse
+    intervalo, o PostgreSQL recusaria o CREATE — as linhas são movidas
+    para uma tabela avulsa que então é anexada.
+    """
+    intervalo = {"inicio": p.inicio, "fim": p.fim}
+    pendentes = conn.execute(
+        text(
+            f"SELECT count(*) FROM {PARTICAO_DEFAULT} "
+            "WHERE data_emissao >= :inicio AND data_emissao < :fim"
+        ),
+        intervalo,
+    ).scalar()
+    if not pendentes:
+        conn.execute(text(ddl_criar_particao(p)))
+        return
+
+    conn.execute(text(
+        f"CREATE TABLE {p.nome} (LIKE {TABELA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    conn.execute(
+        text(
+            f"WITH movidas AS (DELETE FROM {PARTICAO_DEFAULT} "
+            "WHERE data_emissao >= :inicio AND data_emissao < :fim RETURNING *) "
+            f"INSERT INTO {p.nome} SELECT * FROM movidas"
+        ),
+        intervalo,
+    )
+    conn.execute(text(
+        f"ALTER TABLE {TABELA} ATTACH PARTITION {p.nome} "
+        f"FOR VALUES FROM ('{p.inicio.isoformat()}') TO ('{p.fim.isoformat()}')"
+    ))
+    logger.info(f"Partição {p.nome}: {pendentes} notas movidas da DEFAULT")
+
+
+def criar_particoes_futuras(
+    engine: Engine, meses_futuros: int = 3, hoje: Optional[date] = None
+) -> list[str]:
+    """Garante partições do mês corrente até `meses_futuros` à frente."""
+    _exigir_postgres(engine)
+    atual = primeiro_dia(hoje or date.today())
+    existentes = set(listar_particoes(engine))
+    criadas = []
+    with engine.begin() as conn:
+        if not _esta_particionada(conn):
+            raise ParticionamentoIndisponivel(
+                f"{TABELA} não está particionada — execute `particoes converter`"
+            )
+        for mes in meses_entre(atual, somar_meses(atual, meses_futuros)):
+            p = particao_do_mes(mes)
+            if p.nome not in existentes:
+                _criar_particao(conn, p)
+                criadas.append(p.nome)
+    return criadas
+
+
+def converter_para_particionada(engine: Engine, meses_futuros: int = 3) -> list[str]:
+    """
+    Recria notas_fiscais como tabela particionada por RANGE (data_emissao).
+
+    A chave primária passa a ser (id, data_emissao) — exigência do
+    PostgreSQL para tabelas particionadas — e `numero` deixa de ter
+    UNIQUE global pelo mesmo motivo (vira UNIQUE por partição). A FK
+    itens_nota.nota_id é removida; o id continua vindo da mesma sequence.
+    """
+    _exigir_postgres(engine)
+    with engine.begin() as conn:
+        if _esta_particionada(conn):
+            raise ParticionamentoIndisponivel(f"{TABELA} já está particionada")
+
+        legado = f"{TABELA}_legado"
+        conn.execute(text(
+            "ALTER TABLE itens_nota DROP CONSTRAINT IF EXISTS itens_nota_nota_id_fkey"
+        ))
+        conn.execute(text(f"ALTER TABLE {TABELA} RENAME TO {legado}"))
+        # Índices mantêm o nome ao renomear a tabela; liberar os nomes
+        # para que create_all/ORM encontrem os índices na tabela nova.
+        for nome in conn.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = :t AND indexname LIKE 'ix_%'"),
+            {"t": legado},
+        ).scalars().all():
+            conn.execute(text(f"ALTER INDEX {nome} RENAME TO {nome}_legado"))
+
+        conn.execute(text(
+            f"CREATE TABLE {TABELA} (LIKE {legado} INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (data_emissao)"
+        ))
+        conn.execute(text(
+            f"ALTER TABLE {TABELA} ALTER COLUMN data_emissao SET NOT NULL, "
+            "ADD PRIMARY KEY (id, data_emissao), "
+            "ADD UNIQUE (numero, data_emissao)"
+        ))
+        conn.execute(text(
+            f"ALTER SEQUENCE IF EXISTS {TABELA}_id_seq OWNED BY {TABELA}.id"
+        ))
+        conn.execute(text(
+            f"CREATE TABLE {PARTICAO_DEFAULT} PARTITION OF {TABELA} DEFAULT"
+        ))
+
+        limites = conn.execute(
+            text(f"SELECT min(data_emissao), max(data_emissao) FROM {legado}")
+        ).one()
+        hoje = primeiro_dia(date.today())
+        inicio = limites[0].date() if limites[0] else hoje
+        fim = max(limites[1].date() if limites[1] else hoje, hoje)
+        criadas = []
+        for mes in meses_entre(inicio, somar_meses(fim, meses_futuros)):
+            p = particao_do_mes(mes)
+            conn.execute(text(ddl_criar_particao(p)))
+            criadas.append(p.nome)
+
+        conn.execute(text(f"INSERT INTO {TABELA} SELECT * FROM {legado}"))
+        conn.execute(text(f"DROP TABLE {legado}"))
+
+    # Índices declarados em models.py (busca, FTS) nascem nas partições
+    from app.models import NotaFiscal
+    for indice in NotaFiscal.__table__.indexes:
+        indice.create(bind=engine, checkfirst=True)
+
+    logger.info(f"{TABELA} convertida: {len(criadas)} partições mensais")
+    return criadas
+
+
+def arquivar_particoes(
+    engine: Engine,
+    reter_meses: int,
+    hoje: Optional[date] = None,
+    executar: bool = True,
+) -> list[Particao]:
+    """
+    Desanexa as partições fora da janela de retenção. A tabela desanexada
+    continua existindo (consultável, pronta para pg_dump/DROP), e os itens
+    das notas dela são movidos para itens_nota_AAAA_MM.
+    """
+    _exigir_postgres(engine)
+    alvo = particoes_a_arquivar(listar_particoes(engine), reter_meses, hoje)
+    if not executar:
+        return alvo
+
+    for p in alvo:
+        itens = f"itens_nota_{p.inicio:%Y_%m}"
+        # Uma transação por mês: falha no meio não deixa itens órfãos
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABELA} DETACH PARTITION {p.nome}"))
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {itens} (LIKE itens_nota INCLUDING DEFAULTS)"
+            ))
+            conn.execute(text(
+                f"WITH movidos AS (DELETE FROM itens_nota i USING {p.nome} n "
+                "WHERE i.nota_id = n.id RETURNING i.*) "
+                f"INSERT INTO {itens} SELECT * FROM movidos"
+            ))
+        logger.info(f"Partição {p.nome} desanexada; itens em {itens}")
+    return alvo
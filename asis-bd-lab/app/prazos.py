@@ -0,0 +1,232 @@
+"""
+Prazos (deadlines) de request propagados até o banco.
+
+Cada request HTTP recebe um prazo: o header X-Request-Timeout-Ms do
+cliente (limitado a PRAZO_MAXIMO_MS), ou o padrão da rota, ou
+PRAZO_PADRAO_MS. O prazo vale de ponta a ponta:
+
+  - toda transação aberta durante o request recebe o tempo restante
+    como `SET LOCAL statement_timeout` (PostgreSQL) — o próprio servidor
+    aborta a query, mesmo que a API trave;
+  - se o prazo estoura ou o cliente desconecta, a query em andamento é
+    cancelada na conexão (psycopg2 `cancel()`, sqlite3 `interrupt()`)
+    em vez de continuar consumindo o banco para ninguém;
+  - o cliente recebe 504 em vez de esperar indefinidamente.
+"""
+import asyncio
+import json
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+from starlette.routing import compile_path
+
+HEADER_PRAZO = "x-request-timeout-ms"
+PRAZO_PADRAO_MS = int(os.getenv("PRAZO_PADRAO_MS", "30000"))
+PRAZO_MAXIMO_MS = int(os.getenv("PRAZO_MAXIMO_MS", "60000"))
+
+# None: rota sem prazo (streams de longa duração)
+PRAZOS_ROTA_MS: dict[str, Optional[int]] = {
+    "GET /v1/notas": 15000,
+    "GET /v2/notas": 5000,
+    "GET /v2/notas/busca": 5000,
+    "POST /v2/notas/lookup": 5000,
+    "GET /v2/changes/stream": None,
+}
+
+_rotas = [
+    (chave.split(" ", 1)[0], compile_path(chave.split(" ", 1)[1])[0], ms)
+    for chave, ms in PRAZOS_ROTA_MS.items()
+]
+
+
+class PrazoEsgotado(Exception):
+    """O prazo do request acabou antes de a operação começar."""
+
+
+class EstadoPrazo:
+    def __init__(self, prazo_s: float):
+        self.limite = time.monotonic() + prazo_s
+        self.cancelado: Optional[str] = None  # "prazo_esgotado" | "cliente_desconectou"
+        self.conexoes: set = set()
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+    def cancelar(self, motivo: str):
+        """Interrompe as queries em andamento nas conexões deste request."""
+        self.cancelado = motivo
+        for conexao in list(self.conexoes):
+            cancelar = getattr(conexao, "cancel", None) or getattr(conexao, "interrupt", None)
+            if cancelar:
+                try:
+                    cancelar()
+                except Exception:
+                    pass  # conexão já encerrada
+
+
+_estado: ContextVar[Optional[EstadoPrazo]] = ContextVar("prazo_request", default=None)
+
+
+def estado_atual() -> Optional[EstadoPrazo]:
+    return _estado.get()
+
+
+def resolver_prazo_ms(metodo: str, path: str, header: Optional[str]) -> Optional[int]:
+    padrao = PRAZO_PADRAO_MS
+    for m, regex, ms in _rotas:
+        if m == metodo and regex.match(path):
+            if ms is None:
+                return None
+            padrao = ms
+            break
+    if header:
+        try:
+            return max(1, min(int(header), PRAZO_MAXIMO_MS))
+        except ValueError:
+            pass
+    return padrao
+
+
+def foi_cancelamento(exc: Exception) -> bool:
+    """O erro do banco veio do prazo/desconexão (e não de um bug)?"""
+    estado = _estado.get()
+    if estado is not None and estado.cancelado:
+        return True
+    original = getattr(exc, "orig", None) if isinstance(exc, DBAPIError) else None
+    if getattr(original, "pgcode", None) == "57014":  # query_canceled
+        return True
+    return original is not None and "interrupted" in str(original)
+
+
+# ─── Integração com SQLAlchemy ──────────────────────────
+
+@event.listens_for(Session, "after_begin")
+def _aplicar_prazo(session, transaction, connection):
+    estado = _estado.get()
+    if estado is None:
+        return  # fora de um request HTTP (CLI, jobs)
+    restante = estado.restante()
+    if restante <= 0 or estado.cancelado:
+        raise PrazoEsgotado()
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {max(1, int(restante * 1000))}"
+        )
+    estado.conexoes.add(connection.connection.dbapi_connection)
+
+
+@event.listens_for(Pool, "checkin")
+def _liberar_conexao(dbapi_connection, connection_record):
+    # Conexão voltou ao pool e pode servir outro request: não cancelar mais
+    estado = _estado.get()
+    if estado is not None:
+        estado.conexoes.discard(dbapi_connection)
+
+
+# ─── Middleware ASGI ────────────────────────────────────
+
+RESPOSTA_504 = json.dumps({"detail": "Tempo limite do request excedido"}).encode()
+
+
+class MiddlewarePrazo:
+    """
+    Middleware ASGI puro. O corpo do request é lido antes de chamar a app
+    para que a conexão possa ser vigiada: a próxima mensagem do servidor
+    só chega se o cliente desconectar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        prazo_ms = resolver_prazo_ms(
+            scope["method"], scope["path"],
+            headers.get(HEADER_PRAZO.encode(), b"").decode() or None,
+        )
+        if prazo_ms is None:
+            await self.app(scope, receive, send)
+            return
+
+        partes = []
+        while True:
+            msg = await receive()
+            if msg["type"] == "http.disconnect":
+                return
+            partes.append(msg.get("body", b""))
+            if not msg.get("more_body", False):
+                break
+        corpo = b"".join(partes)
+
+        desconectou = asyncio.Event()
+        entregue = False
+        iniciada = False
+        encerrada = False
+
+        async def receive_app():
+            nonlocal entregue
+            if not entregue:
+                entregue = True
+                return {"type": "http.request", "body": corpo, "more_body": False}
+            await desconectou.wait()
+            return {"type": "http.disconnect"}
+
+        async def send_app(msg):
+            nonlocal iniciada
+            if encerrada:
+                return  # 504 enviado ou em envio, ou cliente foi embora
+            if msg["type"] == "http.response.start":
+                iniciada = True
+            await send(msg)
+
+        async def vigiar():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            desconectou.set()
+
+        estado = EstadoPrazo(prazo_ms / 1000)
+        token = _estado.set(estado)
+        tarefa = asyncio.ensure_future(self.app(scope, receive_app, send_app))
+        vigia = asyncio.ensure_future(vigiar())
+        try:
+            feitas, _ = await asyncio.wait(
+                {tarefa, vigia},
+                timeout=max(0.0, estado.restante()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if tarefa in feitas:
+                tarefa.result()
+                return
+
+            motivo = "cliente_desconectou" if vigia in feitas else "prazo_esgotado"
+            estado.cancelar(motivo)
+            # Antes do primeiro await: a app segue rodando enquanto o 504 é
+            # enviado e não pode escrever a própria resposta na mesma conexão
+            encerrada = True
+            if motivo == "prazo_esgotado" and not iniciada:
+                await send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(RESPOSTA_504)).encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": RESPOSTA_504})
+            try:
+                await tarefa  # o cancelamento no banco faz a app terminar logo
+            except Exception:
+                pass
+        finally:
+            vigia.cancel()
+            _estado.reset(token)
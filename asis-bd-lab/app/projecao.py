@@ -0,0 +1,68 @@
+"""
+Projeção de campos (sparse fieldsets) nas listagens v2.
+
+    GET /v2/notas?fields=id,numero,status,valor_total
+    GET /v2/notas?fields=id,numero,itens
+    GET /v2/produtos?fields=id,codigo,estoque
+
+Só os campos pedidos saem do banco (`load_only`) e vão para a resposta —
+uma grade que mostra número, status e valor não lê nem serializa
+`observacao` (Text sem limite). Relações (`itens`) só são carregadas
+quando pedidas, com um SELECT ... IN por página (`selectinload`).
+
+Os campos válidos são os do schema de resposta do endpoint (whitelist):
+colunas internas não são expostas por este caminho.
+"""
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Query, load_only, selectinload
+
+
+class CamposInvalidos(ValueError):
+    pass
+
+
+class Projecao:
+    """Whitelist de campos de um endpoint e como carregá-los/serializá-los."""
+
+    def __init__(self, modelo, schema: type[BaseModel],
+                 relacoes: Optional[dict[str, type[BaseModel]]] = None):
+        self.modelo = modelo
+        self.relacoes = relacoes or {}
+        self.permitidos = tuple(schema.model_fields) + tuple(self.relacoes)
+
+    def campos(self, fields: Optional[str]) -> Optional[list[str]]:
+        """Campos pedidos, na ordem e sem repetição; None sem `fields=`."""
+        if fields is None:
+            return None
+        campos = list(dict.fromkeys(c.strip() for c in fields.split(",") if c.strip()))
+        invalidos = [c for c in campos if c not in self.permitidos]
+        if invalidos or not campos:
+            raise CamposInvalidos(
+                f"Campos inválidos: {', '.join(invalidos) or '(nenhum)'}. "
+                f"Permitidos: {', '.join(self.permitidos)}"
+            )
+        return campos
+
+    def aplicar(self, query: Query, campos: list[str]) -> Query:
+        colunas = [getattr(self.modelo, c) for c in campos if c not in self.relacoes]
+        opcoes = [load_only(*colunas or [self.modelo.id])]  # a PK é sempre carregada
+        opcoes += [selectinload(getattr(self.modelo, r)) for r in self.relacoes if r in campos]
+        return query.options(*opcoes)
+
+    def serializar(self, objetos, campos: list[str]) -> list[dict]:
+        """Dicts prontos para JSON/msgpack (datas em ISO 8601)."""
+        linhas = []
+        for obj in objetos:
+            linha = {}
+            for c in campos:
+                valor = getattr(obj, c)
+                if c in self.relacoes:
+                    valor = [self.relacoes[c].model_validate(v).model_dump(mode="json") for v in valor]
+                elif isinstance(valor, datetime):
+                    valor = valor.isoformat()
+                linha[c] = valor
+            linhas.append(linha)
+        return linhas
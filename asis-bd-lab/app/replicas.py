@@ -0,0 +1,119 @@
+"""
+Roteamento de leituras para réplicas.
+
+Com DATABASE_READ_URLS (lista separada por vírgula), os endpoints de
+leitura da v2 usam `get_db_leitura`: cada sessão escolhe uma réplica em
+round-robin, pulando as que falharam no health check. Escritas continuam
+no primário:
+
+  - SessaoRoteada manda para a réplica só o que é leitura (SELECT fora de
+    flush); flush, UPDATE/INSERT/DELETE e SQL desconhecido vão ao primário
+  - leitura após escrita: depois de um commit com escrita, o mesmo cliente
+    lê do primário por LEITURA_APOS_ESCRITA_S segundos, para não ver uma
+    réplica atrasada que ainda não recebeu o que ele acabou de gravar
+
+Sem réplicas configuradas tudo vai ao primário, como antes.
+"""
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import TextClause
+
+
+def _eh_leitura(clause) -> bool:
+    if isinstance(clause, Select):
+        return True
+    if isinstance(clause, TextClause):
+        # EXECUTE ler_*: prepared statement de leitura (app/consultas.py)
+        return clause.text.lstrip().upper().startswith(("SELECT", "WITH", "EXECUTE LER_"))
+    return False
+
+
+class SessaoRoteada(Session):
+    """
+    `info["replica"]`: engine de leitura desta sessão (None = só primário).
+    `info["cliente"]`: quem fez o request, para a fixação no primário.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if not self._flushing and _eh_leitura(clause):
+            if replica is not None:
+                return replica
+        else:
+            self.info["escreveu"] = True
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+class Replica:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.saudavel = True
+        self.verificada_em = float("-inf")
+
+
+class RoteadorReplicas:
+    """Round-robin entre réplicas saudáveis; health check a cada `intervalo_s`."""
+
+    def __init__(self, engines: list[Engine], intervalo_s: float = 10.0):
+        self.replicas = [Replica(e) for e in engines]
+        self.intervalo_s = intervalo_s
+        self._proxima = 0
+        self._trava = threading.Lock()
+
+    def escolher(self) -> Optional[Engine]:
+        """Próxima réplica saudável, ou None (usar o primário)."""
+        for _ in range(len(self.replicas)):
+            with self._trava:
+                replica = self.replicas[self._proxima % len(self.replicas)]
+                self._proxima += 1
+            if self._saudavel(replica):
+                return replica.engine
+        return None
+
+    def marcar_falha(self, engine: Engine):
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.saudavel = False
+                replica.verificada_em = time.monotonic()
+
+    def _saudavel(self, replica: Replica) -> bool:
+        agora = time.monotonic()
+        if agora - replica.verificada_em >= self.intervalo_s:
+            replica.verificada_em = agora
+            replica.saudavel = self._ping(replica.engine)
+        return replica.saudavel
+
+    @staticmethod
+    def _ping(engine: Engine) -> bool:
+        try:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+
+class FixacaoPrimario:
+    """Clientes que escreveram há pouco e devem ler do primário."""
+
+    def __init__(self, janela_s: float, max_clientes: int = 10_000):
+        self.janela_s = janela_s
+        self.max_clientes = max_clientes
+        self._ate: dict[str, float] = {}
+        self._trava = threading.Lock()
+
+    def fixar(self, cliente: str):
+        agora = time.monotonic()
+        with self._trava:
+            if len(self._ate) >= self.max_clientes:
+                self._ate = {c: t for c, t in self._ate.items() if t > agora}
+            self._ate[cliente] = agora + self.janela_s
+
+    def fixado(self, cliente: str) -> bool:
+        return self._ate.get(cliente, 0.0) > time.monotonic()
+
@@ -58,18 +58,124 @@ class NotaFiscalResponse(NotaFiscalBase):
     id: int
     status: str
     data_emissao: datetime
+    qtd_itens: int = 0
+    quantidade_total: int = 0
+    produtos_distintos: int = 0
 
     class Config:
         from_attributes = True
 
 
+class ItemNotaResponse(BaseModel):
+    id: int
+    produto_id: int
+    quantidade: int
+    valor_unitario: float
+    valor_total: float
+
+    class Config:
+        from_attributes = True
+
+
+class NotaFiscalDetalheResponse(NotaFiscalResponse):
+    itens: list[ItemNotaResponse] = []
+
+
+# ─── Lookup em lote ─────────────────────────────────────
+LOOKUP_MAX_IDS = 500
+
+
+class NotaLookupRequest(BaseModel):
+    """Lista de ids a resolver em uma única query."""
+    ids: list[int] = Field(..., min_length=1, max_length=LOOKUP_MAX_IDS)
+
+
+class NotaLookupResponse(BaseModel):
+    notas: list[NotaFiscalDetalheResponse]
+    nao_encontrados: list[int]
+
+
+class NotaLoteResponse(BaseModel):
+    inseridas: int
+    ids: list[int]
+
+
 # ─── Busca ──────────────────────────────────────────────
+class NotaResumoResponse(BaseModel):
+    """Linha do resultado de busca — sem observação; itens só resumidos."""
+    id: int
+    numero: str
+    emitente_cnpj: str
+    destinatario_cnpj: str
+    valor_total: float
+    status: str
+    data_emissao: datetime
+    qtd_itens: int = 0
+    quantidade_total: int = 0
+    produtos_distintos: int = 0
+
+    class Config:
+        from_attributes = True
+
+
+class TotalEmitenteResponse(BaseModel):
+    emitente_cnpj: str
+    notas: int
+    valor_total: float
+
+
 class BuscaNotaParams(BaseModel):
     """Parâmetros de busca — usados no endpoint vulnerável."""
     cnpj: Optional[str] = None
     status: Optional[str] = None
 
 
+# ─── Feed de alterações ─────────────────────────────────
+class AlteracaoResponse(BaseModel):
+    seq: int
+    entidade: str
+    entidade_id: int
+    operacao: str
+    versao: Optional[int] = None
+    registrado_em: datetime
+    dados: Optional[dict] = None
+
+
+class AlteracoesResponse(BaseModel):
+    alteracoes: list[AlteracaoResponse]
+    proximo_since: int
+    tem_mais: bool
+
+
+# ─── Jobs ───────────────────────────────────────────────
+class JobExportRequest(BaseModel):
+    """Exportação de notas; mesmos filtros da busca (todos opcionais)."""
+    formato: str = Field(default="csv", pattern=r"^(csv|jsonl|msgpack)$")
+    cnpj: Optional[str] = Field(None, pattern=r"^\d{14}$", description="Emitente OU destinatário")
+    emitente_cnpj: Optional[str] = Field(None, pattern=r"^\d{14}$")
+    destinatario_cnpj: Optional[str] = Field(None, pattern=r"^\d{14}$")
+    status: Optional[str] = Field(None, pattern=r"^(emitida|autorizada|cancelada)$")
+    data_inicio: Optional[datetime] = None
+    data_fim: Optional[datetime] = None
+    valor_min: Optional[float] = Field(None, ge=0)
+    valor_max: Optional[float] = Field(None, ge=0)
+
+
+class JobResponse(BaseModel):
+    id: str
+    tipo: str
+    status: str
+    processados: int
+    total: Optional[int] = None
+    progresso: Optional[float] = None
+    erro: Optional[str] = None
+    criado_em: datetime
+    concluido_em: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # ─── Auth ───────────────────────────────────────────────
 class Token(BaseModel):
     access_token: str
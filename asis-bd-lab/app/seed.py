@@ -0,0 +1,71 @@
+"""
+Seed — dados fictícios para os exercícios do lab.
+
+Passo explícito, fora do startup da API:
+    python -m app.cli seed
+"""
+import logging
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal
+from app.models import Produto, NotaFiscal, ItemNota
+
+logger = logging.getLogger("asis_taxtech")
+
+
+def seed_database():
+    """Popula o banco com dados fictícios para os exercícios."""
+    db = SessionLocal()
+    try:
+        if db.query(Produto).count() > 0:
+            return  # Já populado
+
+        # Criar produtos
+        produtos = []
+        for i in range(1, 11):
+            p = Produto(
+                codigo=f"PROD-{i:04d}",
+                descricao=f"Produto Fiscal {i}",
+                ncm=f"{10000000 + i}",
+                preco_unitario=round(50.0 + i * 12.5, 2),
+                estoque=100 + i * 10,
+            )
+            db.add(p)
+            produtos.append(p)
+        db.flush()
+
+        # Criar 200 notas fiscais (para testar volumetria)
+        for i in range(1, 201):
+            cnpj_emit = f"{11222333000100 + (i % 5):014d}"
+            cnpj_dest = f"{44555666000100 + (i % 8):014d}"
+            nf = NotaFiscal(
+                numero=f"NF-{i:06d}",
+                emitente_cnpj=cnpj_emit,
+                destinatario_cnpj=cnpj_dest,
+                valor_total=round(100.0 + i * 7.5, 2),
+                status=["emitida", "autorizada", "cancelada"][i % 3],
+                data_emissao=datetime(2026, 1, 1) + timedelta(hours=i),
+            )
+            db.add(nf)
+            db.flush()
+
+            # Adicionar 2-3 itens por nota
+            for j in range(1, (i % 3) + 2):
+                prod = produtos[(i + j) % len(produtos)]
+                item = ItemNota(
+                    nota_id=nf.id,
+                    produto_id=prod.id,
+                    quantidade=j * 2,
+                    valor_unitario=prod.preco_unitario,
+                    valor_total=prod.preco_unitario * j * 2,
+                )
+                db.add(item)
+
+        db.commit()
+        logger.info(f"Seed concluído: 10 produtos, 200 notas fiscais")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Erro no seed: {e}")
+    finally:
+        db.close()
@@ -0,0 +1,96 @@
+"""
+Entry point de produção — gunicorn com workers uvicorn.
+
+Uso (a partir de asis-bd-lab/):
+    python -m app.servidor                       # workers = núcleos de CPU
+    python -m app.servidor --migrar --seed       # migra/popula antes de subir
+    WEB_CONCURRENCY=4 MAX_REQUESTS=5000 python -m app.servidor
+
+Diferente do `uvicorn --reload` do Dockerfile de desenvolvimento:
+  - N processos (um por núcleo), sem file watcher
+  - com --migrar/--seed, migração e seed rodam UMA vez no processo pai,
+    antes do fork — nunca em paralelo nos workers
+  - preload: app e dependências importados no pai; os workers nascem
+    prontos e compartilham as páginas de memória (copy-on-write)
+  - cada worker é reciclado após MAX_REQUESTS (± jitter), contendo
+    vazamentos de memória sem derrubar todos ao mesmo tempo
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger("asis_taxtech")
+
+
+def configuracao() -> dict:
+    """Parâmetros do gunicorn a partir do ambiente."""
+    return {
+        "bind": os.getenv("BIND", "0.0.0.0:8000"),
+        "workers": int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count())),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "max_requests": int(os.getenv("MAX_REQUESTS", "10000")),
+        "max_requests_jitter": int(os.getenv("MAX_REQUESTS_JITTER", "1000")),
+        "timeout": int(os.getenv("WORKER_TIMEOUT", "60")),
+        "graceful_timeout": int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        "keepalive": int(os.getenv("KEEPALIVE", "5")),
+        "accesslog": os.getenv("ACCESS_LOG", "-") or None,
+        "post_fork": post_fork,
+    }
+
+
+def post_fork(server, worker):
+    """
+    O pai pode ter usado o pool de conexões na migração/seed. Conexões
+    não podem atravessar o fork: cada worker descarta as herdadas (sem
+    fechá-las, elas ainda pertencem ao pai) e abre as suas sob demanda.
+    """
+    from app.database import engine, read_engines
+    for e in (engine, *read_engines):
+        e.dispose(close=False)
+
+
+class ServidorASIS(BaseApplication):
+    def __init__(self, app, opcoes: dict):
+        self.application = app
+        self.opcoes = opcoes
+        super().__init__()
+
+    def load_config(self):
+        for chave, valor in self.opcoes.items():
+            if chave in self.cfg.settings and valor is not None:
+                self.cfg.set(chave, valor)
+
+    def load(self):
+        return self.application
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.servidor")
+    parser.add_argument("--migrar", action="store_true", help="Aplica migrações antes de subir")
+    parser.add_argument("--seed", action="store_true", help="Popula dados fictícios antes de subir")
+    args = parser.parse_args()
+
+    if args.migrar:
+        from app.database import engine
+        from app.migracoes import migrar
+        migrar(engine)
+    if args.seed:
+        from app.seed import seed_database
+        seed_database()
+
+    from app.main import app
+
+    opcoes = configuracao()
+    logger.info(
+        f"Iniciando {opcoes['workers']} workers em {opcoes['bind']} "
+        f"(max_requests={opcoes['max_requests']})"
+    )
+    ServidorASIS(app, opcoes).run()
+
+
+if __name__ == "__main__":
+    main()
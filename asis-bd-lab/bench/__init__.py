@@ -0,0 +1,6 @@
+"""
+Benchmarks do lab ASIS TaxTech.
+
+`python -m bench` roda o harness de carga contra a API (ver __main__.py);
+benchmarks específicos rodam com `python -m bench.<nome>`.
+"""
@@ -0,0 +1,214 @@
+"""
+Harness de carga em Python — complemento ao plano JMeter, sem JVM.
+
+Uso (a partir de asis-bd-lab/):
+    python -m bench --iniciar-servidor                  # sobe uvicorn local com SQLite
+    python -m bench --url http://localhost:8000 --cenarios listar_v2,busca_v2
+    python -m bench --saida atual.json --baseline baseline.json --tolerancia 0.2
+    python -m bench --iniciar-servidor --soak 600 --max-rss-mb 50  # ver bench/soak.py
+
+Roda cada cenário por `--duracao` segundos com `--concorrencia` threads e
+imprime JSON com throughput, p50/p95/p99 e taxa de erro por cenário (429/503
+do controle de admissão contam como `rejeitados`, não como erro). Com
+`--baseline`, sai com código 1 se alguma métrica regrediu além da tolerância.
+Com `--soak`, roda os cenários misturados pelo tempo dado e sai com código 1
+se a memória do servidor cresceu além dos limites.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from bench.cenarios import CENARIOS
+from bench.metricas import Amostras, resumir, comparar
+from bench.soak import executar_soak, obter_token
+
+
+REJEICOES = {429, 503}
+
+
+def executar_cenario(url: str, cenario, duracao: float, concorrencia: int) -> Amostras:
+    amostras = Amostras()
+    trava = threading.Lock()
+    fim = time.perf_counter() + duracao
+
+    def worker(semente: int):
+        rnd = random.Random(semente)
+        locais = Amostras()
+        with httpx.Client(base_url=url, timeout=30.0) as client:
+            while time.perf_counter() < fim:
+                t0 = time.perf_counter()
+                try:
+                    status, esperados = cenario(client, rnd)
+                except httpx.HTTPError:
+                    status, esperados = None, ()
+                if status in REJEICOES and status not in esperados:
+                    # Admissão (app/admissao.py) recusou: não é erro do endpoint
+                    locais.rejeitados += 1
+                    continue
+                locais.latencias_ms.append((time.perf_counter() - t0) * 1000)
+                if status == 409 and 409 in esperados:
+                    locais.conflitos += 1
+                elif status not in esperados:
+                    locais.erros += 1
+        with trava:
+            amostras.somar(locais)
+
+    inicio = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(i,)) for i in range(concorrencia)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    amostras.duracao_s = time.perf_counter() - inicio
+    return amostras
+
+
+def aguardar_saude(url: str, timeout: float = 30.0):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Servidor em {url} não respondeu /health em {timeout}s")
+
+
+@contextmanager
+def servidor_local(porta: int, database_url: str):
+    """Migra, popula e sobe `uvicorn app.main:app` num subprocesso (sem --reload)."""
+    env = {**os.environ, "DATABASE_URL": database_url}
+    for comando in ("migrar", "seed"):
+        subprocess.run(
+            [sys.executable, "-m", "app.cli", comando],
+            env=env, check=True, stdout=subprocess.DEVNULL,
+        )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(porta), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{porta}"
+    try:
+        aguardar_saude(url)
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--iniciar-servidor", action="store_true",
+                        help="Sobe uvicorn local em --porta usando --database-url")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--database-url", default="sqlite:////tmp/asis_bench.db")
+    parser.add_argument("--cenarios", default=",".join(CENARIOS),
+                        help=f"Lista separada por vírgula. Disponíveis: {', '.join(CENARIOS)}")
+    parser.add_argument("--duracao", type=float, default=10.0, help="Segundos por cenário")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--saida", help="Grava o JSON de resultados neste arquivo")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    parser.add_argument("--soak", type=float, metavar="SEGUNDOS",
+                        help="Modo soak: tráfego misto por SEGUNDOS, vigiando a memória")
+    parser.add_argument("--aquecimento", type=float, default=30.0,
+                        help="Soak: segundos de carga antes da medição inicial")
+    parser.add_argument("--medicoes", type=int, default=10, help="Soak: medições de memória")
+    parser.add_argument("--max-rss-mb", type=float, default=50.0,
+                        help="Soak: crescimento máximo do RSS do servidor")
+    parser.add_argument("--max-retido-mb", type=float, default=20.0,
+                        help="Soak: crescimento máximo da memória retida (tracemalloc)")
+    parser.add_argument("--admin-token", default=os.getenv("ASIS_ADMIN_TOKEN"),
+                        help="Soak: JWT de admin (sem ele, faz login com --admin-usuario/--admin-senha)")
+    parser.add_argument("--admin-usuario", default="admin")
+    parser.add_argument("--admin-senha", default="admin123")
+    args = parser.parse_args()
+
+    nomes = [n.strip() for n in args.cenarios.split(",") if n.strip()]
+    desconhecidos = [n for n in nomes if n not in CENARIOS]
+    if desconhecidos:
+        parser.error(f"Cenários desconhecidos: {', '.join(desconhecidos)}")
+
+    def rodar(url: str) -> dict:
+        resultados = {}
+        for nome in nomes:
+            amostras = executar_cenario(url, CENARIOS[nome], args.duracao, args.concorrencia)
+            resultados[nome] = resumir(amostras)
+            print(f"{nome:16s} {resultados[nome]}", file=sys.stderr)
+        return resultados
+
+    def soak(url: str) -> dict:
+        token = args.admin_token or obter_token(url, args.admin_usuario, args.admin_senha)
+        with httpx.Client(base_url=url, timeout=120.0,
+                          headers={"Authorization": f"Bearer {token}"}) as admin:
+            return executar_soak(
+                admin,
+                lambda cenario, segundos: executar_cenario(url, cenario, segundos, args.concorrencia),
+                [CENARIOS[n] for n in nomes], args.soak, args.aquecimento, args.medicoes,
+                args.max_rss_mb, args.max_retido_mb,
+            )
+
+    executar = soak if args.soak else rodar
+    if args.iniciar_servidor:
+        with servidor_local(args.porta, args.database_url) as url:
+            resultado = executar(url)
+    else:
+        aguardar_saude(args.url)
+        resultado = executar(args.url)
+
+    if args.soak:
+        resultado["config"]["concorrencia"] = args.concorrencia
+        resultado["config"]["cenarios"] = nomes
+        for v in resultado["violacoes"]:
+            print(f"SOAK {v}", file=sys.stderr)
+        saida = json.dumps(resultado, indent=2)
+        if args.saida:
+            with open(args.saida, "w") as f:
+                f.write(saida)
+        print(saida)
+        return 1 if resultado["violacoes"] else 0
+    cenarios = resultado
+
+    relatorio = {
+        "config": {
+            "duracao_s": args.duracao,
+            "concorrencia": args.concorrencia,
+        },
+        "cenarios": cenarios,
+    }
+
+    codigo = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        regressoes = comparar(cenarios, base["cenarios"], args.tolerancia)
+        relatorio["regressoes"] = regressoes
+        for r in regressoes:
+            print(f"REGRESSÃO {r}", file=sys.stderr)
+        codigo = 1 if regressoes else 0
+
+    saida = json.dumps(relatorio, indent=2)
+    if args.saida:
+        with open(args.saida, "w") as f:
+            f.write(saida)
+    print(saida)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
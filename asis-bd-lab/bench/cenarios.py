@@ -0,0 +1,148 @@
+"""
+Cenários de carga — um por endpoint v1/v2.
+
+Cada cenário é uma função `(client, rnd) -> (status_code, esperados)`
+que faz UMA operação lógica. Os dados assumem o seed padrão da aplicação
+(10 produtos, 200 notas, CNPJs 11222333000100..104).
+"""
+import random
+
+import httpx
+import msgpack
+
+NOTAS_SEED = 200
+PRODUTOS_SEED = 10
+CNPJS_EMITENTES = [f"{11222333000100 + i:014d}" for i in range(5)]
+
+OK = {200}
+
+
+def listar_v1(client: httpx.Client, rnd: random.Random):
+    return client.get("/v1/notas").status_code, OK
+
+
+def listar_v2(client: httpx.Client, rnd: random.Random):
+    offset = rnd.randrange(0, NOTAS_SEED - 20)
+    return client.get(f"/v2/notas?limit=20&offset={offset}").status_code, OK
+
+
+# Listagem de 100 notas decodificada no cliente: compara tamanho + parse
+# de cada formato (ver app/formatos.py).
+def listar_v2_json(client: httpx.Client, rnd: random.Random):
+    r = client.get(f"/v2/notas?limit=100&offset={rnd.randrange(0, NOTAS_SEED - 100)}")
+    r.json()
+    return r.status_code, OK
+
+
+def listar_v2_colunar(client: httpx.Client, rnd: random.Random):
+    r = client.get(
+        f"/v2/notas?limit=100&offset={rnd.randrange(0, NOTAS_SEED - 100)}",
+        headers={"Accept": "application/vnd.asis.colunar+json"},
+    )
+    r.json()
+    return r.status_code, OK
+
+
+def listar_v2_msgpack(client: httpx.Client, rnd: random.Random):
+    r = client.get(
+        f"/v2/notas?limit=100&offset={rnd.randrange(0, NOTAS_SEED - 100)}",
+        headers={"Accept": "application/msgpack"},
+    )
+    msgpack.unpackb(r.content)
+    return r.status_code, OK
+
+
+def obter_nota_v1(client: httpx.Client, rnd: random.Random):
+    return client.get(f"/v1/notas/{rnd.randint(1, NOTAS_SEED)}").status_code, OK
+
+
+def obter_nota_v2(client: httpx.Client, rnd: random.Random):
+    return client.get(f"/v2/notas/{rnd.randint(1, NOTAS_SEED)}").status_code, OK
+
+
+def lookup_v2(client: httpx.Client, rnd: random.Random):
+    ids = rnd.sample(range(1, NOTAS_SEED + 1), 50)
+    return client.post("/v2/notas/lookup", json={"ids": ids}).status_code, OK
+
+
+# /v1/notas/busca é declarada DEPOIS de /v1/notas/{nota_id} em app/main.py:
+# "busca" casa com o path param e falha na validação do int (422) — o
+# handler vulnerável nunca roda. O cenário mede esse caminho de rejeição.
+ROTA_SOMBREADA = {422}
+
+
+def busca_v1(client: httpx.Client, rnd: random.Random):
+    cnpj = rnd.choice(CNPJS_EMITENTES)
+    return client.get(f"/v1/notas/busca?cnpj={cnpj}").status_code, ROTA_SOMBREADA
+
+
+def busca_v2(client: httpx.Client, rnd: random.Random):
+    params = {"cnpj": rnd.choice(CNPJS_EMITENTES), "limit": 20}
+    if rnd.random() < 0.5:
+        params["status"] = rnd.choice(["emitida", "autorizada", "cancelada"])
+    return client.get("/v2/notas/busca", params=params).status_code, OK
+
+
+def estoque_v1(client: httpx.Client, rnd: random.Random):
+    # Todos os workers disputam o mesmo produto — o cenário é a contenção
+    return client.put("/v1/produtos/1/estoque?quantidade=1").status_code, OK
+
+
+def estoque_v2(client: httpx.Client, rnd: random.Random):
+    produto = client.get("/v2/produtos/1").json()
+    r = client.put(
+        f"/v2/produtos/1/estoque?quantidade=1&version={produto['version']}"
+    )
+    return r.status_code, {200, 409}
+
+
+def estoque_v2_paralelo(client: httpx.Client, rnd: random.Random):
+    # Cada request num produto sorteado: quase sem disputa de linha, então o
+    # que limitar o throughput com mais workers é serialização global (o
+    # advisory lock do feed de alterações no PostgreSQL — ver app/models.py)
+    produto_id = rnd.randint(1, PRODUTOS_SEED)
+    produto = client.get(f"/v2/produtos/{produto_id}").json()
+    r = client.put(
+        f"/v2/produtos/{produto_id}/estoque?quantidade=1&version={produto['version']}"
+    )
+    return r.status_code, {200, 409}
+
+
+def listar_produtos(client: httpx.Client, rnd: random.Random):
+    return client.get("/v2/produtos?limit=20").status_code, OK
+
+
+def obter_produto(client: httpx.Client, rnd: random.Random):
+    return client.get(f"/v2/produtos/{rnd.randint(1, PRODUTOS_SEED)}").status_code, OK
+
+
+def login(client: httpx.Client, rnd: random.Random):
+    r = client.post(
+        "/v2/auth/token", json={"username": "admin", "password": "admin123"}
+    )
+    return r.status_code, OK
+
+
+def health(client: httpx.Client, rnd: random.Random):
+    return client.get("/health").status_code, OK
+
+
+CENARIOS = {
+    "health": health,
+    "listar_v1": listar_v1,
+    "listar_v2": listar_v2,
+    "listar_v2_json": listar_v2_json,
+    "listar_v2_colunar": listar_v2_colunar,
+    "listar_v2_msgpack": listar_v2_msgpack,
+    "obter_nota_v1": obter_nota_v1,
+    "obter_nota_v2": obter_nota_v2,
+    "lookup_v2": lookup_v2,
+    "busca_v1": busca_v1,
+    "busca_v2": busca_v2,
+    "estoque_v1": estoque_v1,
+    "estoque_v2": estoque_v2,
+    "estoque_v2_paralelo": estoque_v2_paralelo,
+    "listar_produtos": listar_produtos,
+    "obter_produto": obter_produto,
+    "login": login,
+}
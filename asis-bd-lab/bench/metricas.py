@@ -0,0 +1,77 @@
+"""
+Agregação de latências e comparação com baseline.
+"""
+import math
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Amostras:
+    """Resultado bruto de um cenário: uma latência (ms) por request."""
+    latencias_ms: list[float] = field(default_factory=list)
+    erros: int = 0
+    conflitos: int = 0  # 409 esperados (ex.: optimistic locking)
+    rejeitados: int = 0  # 429/503 da admissão: fora das latências e dos erros
+    duracao_s: float = 0.0
+
+    def somar(self, outras: "Amostras"):
+        self.latencias_ms += outras.latencias_ms
+        self.erros += outras.erros
+        self.conflitos += outras.conflitos
+        self.rejeitados += outras.rejeitados
+        self.duracao_s += outras.duracao_s
+
+
+def percentil(valores: list[float], p: float) -> float:
+    """Percentil por interpolação linear (mesmo critério do numpy)."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    baixo, alto = math.floor(k), math.ceil(k)
+    if baixo == alto:
+        return ordenados[int(k)]
+    return ordenados[baixo] + (ordenados[alto] - ordenados[baixo]) * (k - baixo)
+
+
+def resumir(amostras: Amostras) -> dict:
+    total = len(amostras.latencias_ms)
+    return {
+        "requests": total,
+        "throughput_rps": round(total / amostras.duracao_s, 2) if amostras.duracao_s else 0.0,
+        "p50_ms": round(percentil(amostras.latencias_ms, 50), 3),
+        "p95_ms": round(percentil(amostras.latencias_ms, 95), 3),
+        "p99_ms": round(percentil(amostras.latencias_ms, 99), 3),
+        "taxa_erro": round(amostras.erros / total, 4) if total else 0.0,
+        "conflitos": amostras.conflitos,
+        "rejeitados": amostras.rejeitados,
+    }
+
+
+def comparar(atual: dict, baseline: dict, tolerancia: float = 0.2) -> list[str]:
+    """
+    Regressões de `atual` em relação a `baseline` (dicts por cenário, no
+    formato de `resumir`). Latência e throughput toleram `tolerancia`
+    relativa; taxa de erro tolera 1 ponto percentual.
+    """
+    regressoes = []
+    for nome, base in baseline.items():
+        if nome not in atual:
+            continue
+        novo = atual[nome]
+        for metrica in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[metrica] and novo[metrica] > base[metrica] * (1 + tolerancia):
+                regressoes.append(
+                    f"{nome}: {metrica} {base[metrica]} → {novo[metrica]}"
+                )
+        if base["throughput_rps"] and (
+            novo["throughput_rps"] < base["throughput_rps"] * (1 - tolerancia)
+        ):
+            regressoes.append(
+                f"{nome}: throughput_rps {base['throughput_rps']} → {novo['throughput_rps']}"
+            )
+        if novo["taxa_erro"] > base["taxa_erro"] + 0.01:
+            regressoes.append(
+                f"{nome}: taxa_erro {base['taxa_erro']} → {novo['taxa_erro']}"
+            )
+    return regressoes
@@ -0,0 +1,109 @@
+"""
+Modo soak — tráfego misto por um tempo fixo, vigiando a memória do servidor.
+
+    python -m bench --iniciar-servidor --soak 600 --max-rss-mb 50 --max-retido-mb 20
+    python -m bench --url http://staging:8000 --soak 1800 --admin-token $TOKEN
+
+Cada request sorteia um dos `--cenarios`. Depois de `--aquecimento`
+segundos (pools, caches e catálogo se estabilizam), liga o tracemalloc no
+servidor e mede o ponto de partida; ao fim, mede de novo. As duas medições
+rodam gc.collect() antes, então o que sobra é memória retida, não lixo à
+espera de coleta. Falha (código 1) se o RSS ou a memória rastreada pelo
+tracemalloc cresceram além dos limites. O relatório traz a série de
+medições e os locais de alocação que mais cresceram.
+
+Usa os endpoints /v2/admin/memoria (token de admin). As medições são do
+worker que respondeu — rode o servidor com um worker só.
+"""
+import random
+
+import httpx
+
+from bench.metricas import Amostras, resumir
+
+MB = 1024 * 1024
+
+
+def trafego_misto(cenarios: list):
+    """Cenário que, a cada chamada, executa um dos `cenarios` ao acaso."""
+    def misto(client: httpx.Client, rnd: random.Random):
+        return rnd.choice(cenarios)(client, rnd)
+    return misto
+
+
+def obter_token(url: str, usuario: str, senha: str) -> str:
+    r = httpx.post(f"{url}/v2/auth/token", json={"username": usuario, "password": senha})
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+def medir_memoria(admin: httpx.Client) -> dict:
+    """RSS e memória rastreada do servidor após um gc.collect(), em MB."""
+    r = admin.get("/v2/admin/memoria", params={"coletar": "true"})
+    r.raise_for_status()
+    corpo = r.json()
+    return {
+        "pid": corpo["pid"],
+        "rss_mb": round((corpo["rss_bytes"] or corpo["rss_pico_bytes"]) / MB, 2),
+        "retido_mb": round(corpo["tracemalloc"]["rastreado_bytes"] / MB, 2),
+        "objetos_gc": corpo["gc"]["objetos_rastreados"],
+        "objetos_orm": corpo["identity_maps"]["objetos_total"],
+    }
+
+
+def avaliar(inicial: dict, final: dict, max_rss_mb: float, max_retido_mb: float) -> list[str]:
+    """Violações dos limites de crescimento entre duas medições."""
+    violacoes = []
+    if final["pid"] != inicial["pid"]:
+        violacoes.append(f"pid mudou ({inicial['pid']} → {final['pid']}): worker reiniciado?")
+    rss = final["rss_mb"] - inicial["rss_mb"]
+    if rss > max_rss_mb:
+        violacoes.append(f"RSS cresceu {rss:.1f} MB (limite {max_rss_mb} MB)")
+    retido = final["retido_mb"] - inicial["retido_mb"]
+    if retido > max_retido_mb:
+        violacoes.append(f"memória retida cresceu {retido:.1f} MB (limite {max_retido_mb} MB)")
+    return violacoes
+
+
+def executar_soak(admin: httpx.Client, rodar, cenarios: list, duracao: float,
+                  aquecimento: float, medicoes: int, max_rss_mb: float,
+                  max_retido_mb: float, frames: int = 10) -> dict:
+    """
+    `admin`: cliente do servidor com o token de admin no header.
+    `rodar(cenario, segundos) -> Amostras`: gera a carga (ver executar_cenario).
+    """
+    misto = trafego_misto(cenarios)
+    rodar(misto, aquecimento)
+
+    admin.post("/v2/admin/memoria/tracemalloc", params={"frames": frames}).raise_for_status()
+    try:
+        inicial = medir_memoria(admin)
+        base = admin.post("/v2/admin/memoria/snapshots", params={"limit": 1}).json()["id"]
+
+        total = Amostras()
+        serie = [{"t_s": 0, **inicial}]
+        for _ in range(medicoes):
+            total.somar(rodar(misto, duracao / medicoes))
+            serie.append({"t_s": round(total.duracao_s), **medir_memoria(admin)})
+        final = serie[-1]
+
+        atual = admin.post("/v2/admin/memoria/snapshots", params={"limit": 1}).json()["id"]
+        diff = admin.get(f"/v2/admin/memoria/snapshots/{atual}/diff",
+                         params={"base": base, "limit": 10}).json()["diferencas"]
+    finally:
+        admin.delete("/v2/admin/memoria/tracemalloc")
+
+    return {
+        "config": {
+            "duracao_s": duracao, "aquecimento_s": aquecimento, "medicoes": medicoes,
+            "max_rss_mb": max_rss_mb, "max_retido_mb": max_retido_mb,
+        },
+        "trafego": resumir(total),
+        "memoria": {
+            "crescimento_rss_mb": round(final["rss_mb"] - inicial["rss_mb"], 2),
+            "crescimento_retido_mb": round(final["retido_mb"] - inicial["retido_mb"], 2),
+            "serie": serie,
+        },
+        "maiores_crescimentos": diff,
+        "violacoes": avaliar(inicial, final, max_rss_mb, max_retido_mb),
+    }
@@ -0,0 +1,125 @@
+"""
+Benchmark de cold start — quanto um pod novo leva para servir.
+
+Uso (a partir de asis-bd-lab/):
+    python -m bench.startup
+    python -m bench.startup --repeticoes 10 --saida startup.json
+    python -m bench.startup --baseline startup.json --tolerancia 0.2
+
+Mede, em processos novos (sem cache de import em memória):
+  - import_ms:         `import app.main`
+  - primeira_resposta: spawn do uvicorn até o primeiro 200 em /health
+e lista os módulos mais caros do import (`python -X importtime`).
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+_MEDIR_IMPORT = (
+    "import time; t = time.perf_counter(); import app.main; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def medir_import(env: dict) -> float:
+    saida = subprocess.run(
+        [sys.executable, "-c", _MEDIR_IMPORT],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return float(saida.stdout.strip().splitlines()[-1])
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir_primeira_resposta(env: dict, timeout: float = 30.0) -> float:
+    porta = _porta_livre()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(porta), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                r = httpx.get(f"http://127.0.0.1:{porta}/health", timeout=0.5)
+                if r.status_code == 200:
+                    return (time.perf_counter() - t0) * 1000
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"/health não respondeu em {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def modulos_mais_caros(env: dict, top: int) -> list[dict]:
+    """Top módulos por tempo cumulativo, via `-X importtime`."""
+    saida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    linhas = []
+    for linha in saida.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", linha)
+        # Só módulos de primeiro nível sob app.main (indentação ≤ 3)
+        if m and len(m.group(3)) <= 3:
+            linhas.append({"modulo": m.group(4), "cumulativo_ms": int(m.group(2)) / 1000})
+    return sorted(linhas, key=lambda x: x["cumulativo_ms"], reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.startup")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--database-url", default="sqlite:////tmp/asis_bench_startup.db")
+    parser.add_argument("--saida")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    env = {**os.environ, "DATABASE_URL": args.database_url}
+    imports = [medir_import(env) for _ in range(args.repeticoes)]
+    respostas = [medir_primeira_resposta(env) for _ in range(args.repeticoes)]
+
+    resultado = {
+        "import_ms": round(statistics.median(imports), 1),
+        "primeira_resposta_ms": round(statistics.median(respostas), 1),
+        "modulos": modulos_mais_caros(env, args.top),
+    }
+
+    codigo = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        regressoes = [
+            f"{chave}: {base[chave]} → {resultado[chave]}"
+            for chave in ("import_ms", "primeira_resposta_ms")
+            if resultado[chave] > base[chave] * (1 + args.tolerancia)
+        ]
+        resultado["regressoes"] = regressoes
+        codigo = 1 if regressoes else 0
+
+    saida = json.dumps(resultado, indent=2)
+    if args.saida:
+        with open(args.saida, "w") as f:
+            f.write(saida)
+    print(saida)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,6 +8,24 @@ Business Driver: A API ASIS precisa suportar 50k+ notas fiscais.
 Sem paginação, um único GET pode derrubar o serviço.
 """
 import pytest
+from sqlalchemy import event
+
+from conftest import engine_test
+
+
+def _contar_sql(funcao):
+    """(resultado de funcao(), nº de statements SQL executados)."""
+    sqls = []
+
+    def capturar(conn, cursor, statement, *args):
+        if "SAVEPOINT" not in statement:  # transação do teste (conftest)
+            sqls.append(statement)
+
+    event.listen(engine_test, "before_cursor_execute", capturar)
+    try:
+        return funcao(), len(sqls)
+    finally:
+        event.remove(engine_test, "before_cursor_execute", capturar)
 
 
 class TestVolumetriaBugV1:
@@ -77,3 +95,91 @@ class TestVolumetriaFixV2:
         """v2 deve rejeitar limit < 1."""
         response = client.get("/v2/notas?limit=0")
         assert response.status_code == 422
+
+
+class TestLookupEmLoteV2:
+    """Testes do lookup em lote — uma query em vez de N round trips."""
+
+    def test_lookup_retorna_notas_na_ordem_pedida(self, client, seed_notas):
+        ids = [seed_notas[5].id, seed_notas[0].id, seed_notas[2].id]
+        response = client.post("/v2/notas/lookup", json={"ids": ids})
+        assert response.status_code == 200
+
+        data = response.json()
+        assert [n["id"] for n in data["notas"]] == ids
+        assert data["nao_encontrados"] == []
+
+    def test_lookup_inclui_itens(self, client, seed_notas):
+        response = client.post(
+            "/v2/notas/lookup", json={"ids": [seed_notas[0].id]}
+        )
+        nota = response.json()["notas"][0]
+        assert len(nota["itens"]) == 1
+        assert nota["itens"][0]["quantidade"] == 2
+
+    def test_lookup_reporta_ids_inexistentes(self, client, seed_notas):
+        ids = [seed_notas[0].id, 99999, 88888]
+        response = client.post("/v2/notas/lookup", json={"ids": ids})
+        data = response.json()
+        assert len(data["notas"]) == 1
+        assert data["nao_encontrados"] == [99999, 88888]
+
+    def test_lookup_ignora_ids_duplicados(self, client, seed_notas):
+        nota_id = seed_notas[0].id
+        response = client.post(
+            "/v2/notas/lookup", json={"ids": [nota_id, nota_id]}
+        )
+        assert [n["id"] for n in response.json()["notas"]] == [nota_id]
+
+    def test_lookup_rejeita_lista_acima_do_limite(self, client):
+        response = client.post(
+            "/v2/notas/lookup", json={"ids": list(range(1, 502))}
+        )
+        assert response.status_code == 422
+
+    def test_lookup_rejeita_lista_vazia(self, client):
+        response = client.post("/v2/notas/lookup", json={"ids": []})
+        assert response.status_code == 422
+
+
+class TestVolumetriaEmEscala:
+    """Os mesmos contratos da v2 com 50k+ notas (fixture volume_notas)."""
+
+    def test_v2_pagina_profunda_custa_o_mesmo_que_a_primeira(self, client, volume_notas):
+        primeira, sqls_primeira = _contar_sql(lambda: client.get("/v2/notas?limit=100"))
+        funda, sqls_funda = _contar_sql(
+            lambda: client.get(f"/v2/notas?limit=100&offset={volume_notas - 100}")
+        )
+        assert len(primeira.json()) == len(funda.json()) == 100
+        assert funda.json()[-1]["id"] == volume_notas
+        # Sem N+1: o número de queries não depende do tamanho da página
+        assert sqls_primeira == sqls_funda <= 2
+
+    def test_busca_keyset_percorre_emitente_grande(self, client, volume_notas):
+        maior = client.get("/v2/relatorios/emitentes?limit=1").json()[0]
+        assert maior["notas"] > 1000
+
+        vistos, anterior, cursor = set(), None, None
+        for _ in range(5):
+            url = f"/v2/notas/busca?emitente_cnpj={maior['emitente_cnpj']}&limit=100"
+            response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+            pagina = response.json()
+            assert len(pagina) == 100
+            chaves = [(n["data_emissao"], n["id"]) for n in pagina]
+            assert chaves == sorted(chaves, reverse=True)
+            assert anterior is None or chaves[0] < anterior
+            vistos |= {n["id"] for n in pagina}
+            anterior, cursor = chaves[-1], response.headers["x-proximo-cursor"]
+        assert len(vistos) == 500
+
+    def test_lookup_de_500_ids_espalhados(self, client, volume_notas):
+        ids = list(range(1, volume_notas + 1, volume_notas // 500))[:500]
+        response, sqls = _contar_sql(lambda: client.post("/v2/notas/lookup", json={"ids": ids}))
+        notas = response.json()["notas"]
+        assert [n["id"] for n in notas] == ids
+        assert all(len(n["itens"]) == 1 for n in notas)
+        assert sqls <= 2  # notas + itens (selectinload)
+
+    def test_relatorio_agrega_todo_o_volume(self, client, volume_notas):
+        emitentes = client.get("/v2/relatorios/emitentes?limit=1000").json()
+        assert sum(e["notas"] for e in emitentes) == volume_notas
@@ -8,13 +8,15 @@ Business Driver: Em um sistema fiscal com múltiplos operadores,
 duas pessoas podem tentar atualizar o mesmo produto ao mesmo tempo.
 Sem controle de concorrência, dados são perdidos (lost update).
 """
-import pytest
 from concurrent.futures import ThreadPoolExecutor
 
+import pytest
+
 
 class TestConcorrenciaBugV1:
     """Testes que EXPÕEM a race condition da versão v1."""
 
+    @pytest.mark.commit_real  # requests em threads: transações independentes
     def test_v1_lost_update(self, client, seed_produtos):
         """
         BUG: Dois updates simultâneos causam lost update.
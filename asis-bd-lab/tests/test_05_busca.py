@@ -0,0 +1,171 @@
+"""
+Busca de notas — filtros combinados e paginação keyset
+======================================================
+Testes do /v2/notas/busca: cada filtro restringe o resultado e o
+cursor percorre todas as notas sem repetir nem pular nenhuma.
+
+Business Driver: um emitente grande tem centenas de milhares de notas.
+A busca precisa ser paginada e o custo de cada página, constante.
+"""
+import pytest
+
+
+def _todas_as_paginas(client, params):
+    """Segue X-Proximo-Cursor até a última página."""
+    ids = []
+    cursor = None
+    while True:
+        query = dict(params)
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get("/v2/notas/busca", params=query)
+        assert response.status_code == 200
+        ids.extend(n["id"] for n in response.json())
+        cursor = response.headers.get("x-proximo-cursor")
+        if not cursor:
+            return ids
+
+
+class TestBuscaFiltros:
+
+    def test_cnpj_casa_emitente_ou_destinatario(self, client, seed_notas):
+        # 44555666000100 é destinatário das notas 5, 10, ..., 50
+        cnpj = "44555666000100"
+        data = client.get(f"/v2/notas/busca?cnpj={cnpj}&limit=100").json()
+
+        esperado = {
+            n.id for n in seed_notas
+            if cnpj in (n.emitente_cnpj, n.destinatario_cnpj)
+        }
+        assert {n["id"] for n in data} == esperado
+
+    def test_filtro_por_destinatario(self, client, seed_notas):
+        cnpj = seed_notas[0].destinatario_cnpj
+        data = client.get(
+            f"/v2/notas/busca?destinatario_cnpj={cnpj}&limit=100"
+        ).json()
+        assert data
+        assert all(n["destinatario_cnpj"] == cnpj for n in data)
+
+    def test_filtro_por_faixa_de_valor(self, client, seed_notas):
+        data = client.get(
+            "/v2/notas/busca?valor_min=100&valor_max=120&limit=100"
+        ).json()
+        assert data
+        assert all(100 <= n["valor_total"] <= 120 for n in data)
+
+    def test_filtro_por_periodo(self, client, seed_notas):
+        data = client.get(
+            "/v2/notas/busca",
+            params={
+                "data_inicio": "2026-01-01T10:00:00",
+                "data_fim": "2026-01-01T20:00:00",
+                "limit": 100,
+            },
+        ).json()
+        # Notas 10..19 (data_emissao = 2026-01-01 + i horas)
+        assert len(data) == 10
+
+    def test_status_invalido_rejeitado(self, client):
+        response = client.get("/v2/notas/busca?status=qualquer")
+        assert response.status_code == 422
+
+    def test_resultado_ordenado_do_mais_recente(self, client, seed_notas):
+        data = client.get("/v2/notas/busca?limit=5").json()
+        datas = [n["data_emissao"] for n in data]
+        assert datas == sorted(datas, reverse=True)
+
+
+class TestBuscaPaginacaoKeyset:
+
+    def test_cursor_percorre_tudo_sem_repetir(self, client, seed_notas):
+        ids = _todas_as_paginas(client, {"limit": 7})
+        assert len(ids) == len(set(ids)) == 50
+
+    def test_cursor_com_cnpj_nos_dois_ramos(self, client, seed_notas):
+        cnpj = "44555666000100"
+        ids = _todas_as_paginas(client, {"cnpj": cnpj, "limit": 3})
+        esperado = {
+            n.id for n in seed_notas
+            if cnpj in (n.emitente_cnpj, n.destinatario_cnpj)
+        }
+        assert len(ids) == len(esperado)
+        assert set(ids) == esperado
+
+    def test_ultima_pagina_sem_cursor(self, client, seed_notas):
+        response = client.get("/v2/notas/busca?limit=100")
+        assert len(response.json()) == 50
+        assert "x-proximo-cursor" not in response.headers
+
+    def test_nota_sem_data_de_emissao_fica_fora(self, client, db_session, seed_notas):
+        seed_notas[0].data_emissao = None
+        db_session.commit()
+
+        # SQLite ordena NULL por último no DESC, PostgreSQL primeiro: fora nos dois
+        for limit in (7, 100):
+            ids = _todas_as_paginas(client, {"limit": limit})
+            assert len(ids) == len(set(ids)) == 49
+            assert seed_notas[0].id not in ids
+
+    def test_cursor_invalido_retorna_422(self, client, seed_notas):
+        response = client.get("/v2/notas/busca?cursor=nao-e-um-cursor")
+        assert response.status_code == 422
+
+
+@pytest.fixture
+def notas_com_observacao(db_session, seed_notas):
+    """Observações livres em algumas notas, como as que auditores procuram."""
+    textos = {
+        0: "Devolução parcial de mercadoria avariada no transporte",
+        1: "Mercadoria avariada; devolução total autorizada pela auditoria",
+        2: "Complemento de ICMS referente à nota anterior",
+        3: "Remessa para conserto",
+    }
+    for indice, texto in textos.items():
+        seed_notas[indice].observacao = texto
+    db_session.commit()
+    return seed_notas
+
+
+class TestBuscaTextual:
+
+    def test_q_encontra_palavra_na_observacao(self, client, notas_com_observacao):
+        data = client.get("/v2/notas/busca?q=conserto").json()
+        assert [n["id"] for n in data] == [notas_com_observacao[3].id]
+
+    def test_q_exige_todas_as_palavras(self, client, notas_com_observacao):
+        data = client.get("/v2/notas/busca?q=devolução avariada").json()
+        assert {n["id"] for n in data} == {
+            notas_com_observacao[0].id, notas_com_observacao[1].id,
+        }
+
+    def test_q_ignora_acentos(self, client, notas_com_observacao):
+        data = client.get("/v2/notas/busca?q=devolucao").json()
+        assert len(data) == 2
+
+    def test_q_combina_com_filtros(self, client, notas_com_observacao):
+        cnpj = notas_com_observacao[0].emitente_cnpj
+        data = client.get(
+            f"/v2/notas/busca?q=avariada&emitente_cnpj={cnpj}"
+        ).json()
+        assert [n["id"] for n in data] == [notas_com_observacao[0].id]
+
+    def test_q_paginado(self, client, notas_com_observacao):
+        r1 = client.get("/v2/notas/busca?q=avariada&limit=1")
+        cursor = r1.headers["x-proximo-cursor"]
+        r2 = client.get(f"/v2/notas/busca?q=avariada&limit=1&cursor={cursor}")
+
+        assert r1.json()[0]["id"] != r2.json()[0]["id"]
+        assert "x-proximo-cursor" not in r2.headers
+
+    def test_q_com_operadores_nao_quebra(self, client, notas_com_observacao):
+        response = client.get('/v2/notas/busca', params={"q": 'ICMS" * ('})
+        assert response.status_code == 200
+        assert [n["id"] for n in response.json()] == [notas_com_observacao[2].id]
+
+    def test_q_acompanha_alteracao_da_observacao(
+        self, client, db_session, notas_com_observacao
+    ):
+        notas_com_observacao[3].observacao = "Retorno de demonstração"
+        db_session.commit()
+        assert client.get("/v2/notas/busca?q=conserto").json() == []
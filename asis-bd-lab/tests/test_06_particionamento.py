@@ -0,0 +1,76 @@
+"""
+Particionamento mensal de notas_fiscais
+=======================================
+As operações no banco exigem PostgreSQL; aqui validamos o cálculo das
+partições (limites, nomes, janela de retenção) e que o comando recusa
+rodar em outro dialeto.
+
+Business Driver: o histórico cresce para sempre; consultas recentes não
+podem ficar mais lentas por causa de meses que ninguém mais consulta.
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.particionamento import (
+    ParticionamentoIndisponivel,
+    arquivar_particoes,
+    ddl_criar_particao,
+    meses_entre,
+    particao_do_mes,
+    particoes_a_arquivar,
+)
+
+
+class TestCalculoParticoes:
+
+    def test_particao_do_mes_cobre_o_mes_inteiro(self):
+        p = particao_do_mes(date(2026, 12, 17))
+        assert p.nome == "notas_fiscais_2026_12"
+        assert p.inicio == date(2026, 12, 1)
+        assert p.fim == date(2027, 1, 1)
+
+    def test_meses_entre_inclui_extremos(self):
+        meses = meses_entre(date(2025, 11, 20), date(2026, 2, 3))
+        assert meses == [
+            date(2025, 11, 1), date(2025, 12, 1),
+            date(2026, 1, 1), date(2026, 2, 1),
+        ]
+
+    def test_ddl_usa_intervalo_semiaberto(self):
+        ddl = ddl_criar_particao(particao_do_mes(date(2026, 3, 1)))
+        assert "PARTITION OF notas_fiscais" in ddl
+        assert "FROM ('2026-03-01') TO ('2026-04-01')" in ddl
+
+
+class TestRetencao:
+
+    EXISTENTES = [
+        "notas_fiscais_2024_01",
+        "notas_fiscais_2024_06",
+        "notas_fiscais_2025_10",
+        "notas_fiscais_2025_11",
+        "notas_fiscais_default",
+    ]
+
+    def test_arquiva_apenas_meses_fora_da_janela(self):
+        alvo = particoes_a_arquivar(self.EXISTENTES, 12, hoje=date(2026, 10, 19))
+        assert [p.nome for p in alvo] == [
+            "notas_fiscais_2024_01", "notas_fiscais_2024_06",
+        ]
+
+    def test_mes_no_limite_da_janela_e_mantido(self):
+        # Retenção de 11 meses a partir de out/2026 → corte em nov/2025
+        alvo = particoes_a_arquivar(self.EXISTENTES, 11, hoje=date(2026, 10, 19))
+        assert "notas_fiscais_2025_11" not in [p.nome for p in alvo]
+        assert "notas_fiscais_2025_10" in [p.nome for p in alvo]
+
+    def test_particao_default_nunca_e_arquivada(self):
+        alvo = particoes_a_arquivar(self.EXISTENTES, 0, hoje=date(2030, 1, 1))
+        assert "notas_fiscais_default" not in [p.nome for p in alvo]
+
+
+def test_recusa_dialeto_sem_particionamento():
+    with pytest.raises(ParticionamentoIndisponivel):
+        arquivar_particoes(create_engine("sqlite://"), reter_meses=12)
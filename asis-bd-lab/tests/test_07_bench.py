@@ -0,0 +1,78 @@
+"""
+Harness de benchmark (python -m bench)
+======================================
+Valida as métricas agregadas e a detecção de regressões contra baseline —
+é o que decide se o pipeline de performance falha.
+"""
+import random
+
+from bench.cenarios import CENARIOS
+from bench.metricas import Amostras, comparar, percentil, resumir
+
+
+def _resumo(p95=10.0, rps=100.0, erro=0.0):
+    return {
+        "requests": 1000, "throughput_rps": rps,
+        "p50_ms": 5.0, "p95_ms": p95, "p99_ms": 20.0,
+        "taxa_erro": erro, "conflitos": 0, "rejeitados": 0,
+    }
+
+
+class TestMetricas:
+
+    def test_percentis_interpolados(self):
+        valores = list(range(1, 101))  # 1..100 ms
+        assert percentil(valores, 50) == 50.5
+        assert percentil(valores, 99) == 99.01
+        assert percentil([], 95) == 0.0
+
+    def test_resumo_calcula_throughput_e_erro(self):
+        amostras = Amostras(latencias_ms=[10.0] * 50, erros=5, duracao_s=2.0)
+        resumo = resumir(amostras)
+        assert resumo["throughput_rps"] == 25.0
+        assert resumo["taxa_erro"] == 0.1
+        assert resumo["p99_ms"] == 10.0
+
+    def test_rejeicoes_da_admissao_nao_sao_erro(self):
+        total = Amostras(latencias_ms=[10.0] * 8, erros=0)
+        total.somar(Amostras(latencias_ms=[20.0] * 2, erros=1, rejeitados=5, duracao_s=1.0))
+        resumo = resumir(total)
+        assert (resumo["requests"], resumo["rejeitados"], resumo["taxa_erro"]) == (10, 5, 0.1)
+
+
+class TestCenarios:
+
+    def test_cenarios_de_leitura_respondem_o_esperado(self, client, seed_notas):
+        for nome in ("busca_v1", "busca_v2", "obter_produto", "listar_produtos"):
+            status, esperados = CENARIOS[nome](client, random.Random(1))
+            assert status in esperados, nome
+
+    def test_escrita_paralela_sorteia_o_produto(self, client, seed_produtos):
+        for semente in range(5):
+            status, esperados = CENARIOS["estoque_v2_paralelo"](client, random.Random(semente))
+            assert status == 200 and status in esperados
+
+
+class TestComparacaoBaseline:
+
+    def test_sem_regressao_dentro_da_tolerancia(self):
+        base = {"busca_v2": _resumo(p95=10.0)}
+        atual = {"busca_v2": _resumo(p95=11.5)}
+        assert comparar(atual, base, tolerancia=0.2) == []
+
+    def test_latencia_acima_da_tolerancia(self):
+        base = {"busca_v2": _resumo(p95=10.0)}
+        atual = {"busca_v2": _resumo(p95=15.0)}
+        regressoes = comparar(atual, base, tolerancia=0.2)
+        assert len(regressoes) == 1
+        assert "p95_ms" in regressoes[0]
+
+    def test_queda_de_throughput_e_aumento_de_erro(self):
+        base = {"listar_v2": _resumo(rps=100.0)}
+        atual = {"listar_v2": _resumo(rps=50.0, erro=0.05)}
+        regressoes = comparar(atual, base, tolerancia=0.2)
+        assert any("throughput_rps" in r for r in regressoes)
+        assert any("taxa_erro" in r for r in regressoes)
+
+    def test_cenario_ausente_na_execucao_atual_e_ignorado(self):
+        assert comparar({}, {"login": _resumo()}) == []
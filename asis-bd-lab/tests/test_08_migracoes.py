@@ -0,0 +1,61 @@
+"""
+Migrações de schema (python -m app.cli migrar)
+==============================================
+O startup da API não toca mais no banco; o schema é responsabilidade
+do comando de migração, que precisa ser idempotente.
+"""
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import StaticPool
+
+from app.migracoes import MIGRACOES, migrar
+
+
+def _engine_vazio():
+    return create_engine("sqlite://", poolclass=StaticPool)
+
+
+def test_migrar_banco_vazio_cria_tabelas_e_registra_passos():
+    engine = _engine_vazio()
+    executados = migrar(engine)
+
+    tabelas = set(inspect(engine).get_table_names())
+    assert {"produtos", "notas_fiscais", "itens_nota", "schema_migracoes"} <= tabelas
+    assert [nome for nome, _ in MIGRACOES] == [
+        e for e in executados if not e.startswith("indice:")
+    ]
+
+
+def test_migrar_e_idempotente():
+    engine = _engine_vazio()
+    migrar(engine)
+    assert migrar(engine) == []
+
+
+def test_migrar_banco_antigo_cria_indices_e_busca_textual():
+    engine = _engine_vazio()
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE notas_fiscais (id INTEGER PRIMARY KEY, "
+            "numero VARCHAR(20) NOT NULL, serie VARCHAR(5), "
+            "emitente_cnpj VARCHAR(14) NOT NULL, destinatario_cnpj VARCHAR(14) NOT NULL, "
+            "valor_total FLOAT NOT NULL, status VARCHAR(20), data_emissao DATETIME, "
+            "observacao TEXT)"
+        ))
+        conn.execute(text(
+            "INSERT INTO notas_fiscais VALUES "
+            "(1, 'NF-1', '001', '1', '2', 10.0, 'emitida', '2026-01-01', 'remessa para conserto')"
+        ))
+
+    executados = migrar(engine)
+
+    assert "indice:ix_notas_emitente_data" in executados
+    with engine.connect() as conn:
+        achados = conn.execute(text(
+            "SELECT rowid FROM notas_fiscais_fts WHERE notas_fiscais_fts MATCH 'conserto'"
+        )).scalars().all()
+    assert achados == [1]
+
+
+def test_startup_da_api_nao_acessa_o_banco(client):
+    """O TestClient roda o lifespan; com o banco real inacessível, não pode falhar."""
+    assert client.get("/health").status_code == 200
@@ -0,0 +1,137 @@
+"""
+Controle de admissão e load shedding
+====================================
+Rotas caras têm limite de concorrência, fila e taxa por cliente; quando
+saturadas, respondem 503/429 com Retry-After em vez de segurar conexões.
+Rotas baratas não podem ser afetadas.
+
+Business Driver: um único cliente martelando /v1/notas não pode derrubar
+a API para todos os outros.
+"""
+import asyncio
+
+from app.admissao import (
+    LIMITES_PADRAO, RESERVA_ROTAS_LIVRES, ControleAdmissao, LimiteRota, Portao,
+)
+from app.database import POOL_MAX_OVERFLOW, POOL_SIZE, engine
+from app.jobs import GerenciadorJobs
+from app.main import app
+
+
+def _instalar(limites):
+    controle = ControleAdmissao(limites)
+    app.state.admissao = controle
+    return controle
+
+
+def _portao(controle, chave):
+    return next(p for _, _, c, _, p in controle.rotas if c == chave)
+
+
+class TestPortaoConcorrencia:
+
+    def test_rota_saturada_retorna_503_com_retry_after(self, client, seed_notas):
+        controle = _instalar({"GET /v1/notas": LimiteRota(concorrencia=1, fila=0)})
+        _portao(controle, "GET /v1/notas").ativos = 1  # vaga ocupada
+
+        response = client.get("/v1/notas")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert "x-correlation-id" in response.headers
+
+    def test_rotas_baratas_respondem_com_rota_pesada_saturada(
+        self, client, seed_produtos
+    ):
+        controle = _instalar({"GET /v1/notas": LimiteRota(concorrencia=1, fila=0)})
+        _portao(controle, "GET /v1/notas").ativos = 1
+
+        assert client.get("/health").status_code == 200
+        assert client.get(f"/v2/produtos/{seed_produtos[0].id}").status_code == 200
+
+    def test_vaga_e_liberada_apos_o_request(self, client, seed_notas):
+        controle = _instalar({"GET /v2/notas": LimiteRota(concorrencia=1, fila=0)})
+        for _ in range(3):
+            assert client.get("/v2/notas").status_code == 200
+        assert _portao(controle, "GET /v2/notas").ativos == 0
+
+    def test_fila_limitada_e_repasse_de_vaga(self):
+        async def cenario():
+            portao = Portao(LimiteRota(concorrencia=1, fila=1, espera_max_s=1))
+            assert await portao.entrar()
+
+            segundo = asyncio.ensure_future(portao.entrar())
+            await asyncio.sleep(0)
+            assert portao.na_fila == 1
+            assert not await portao.entrar()  # fila cheia
+
+            portao.sair()
+            assert await segundo
+            assert portao.ativos == 1
+
+        asyncio.run(cenario())
+
+    def test_cancelado_apos_receber_a_vaga_devolve(self):
+        async def cenario():
+            portao = Portao(LimiteRota(concorrencia=1, fila=1, espera_max_s=1))
+            await portao.entrar()
+            segundo = asyncio.ensure_future(portao.entrar())
+            await asyncio.sleep(0)
+
+            portao.sair()      # repassa a vaga ao segundo...
+            segundo.cancel()   # ...que é cancelado antes de rodar
+            try:
+                await segundo
+            except asyncio.CancelledError:
+                pass
+            assert portao.ativos == 0 and portao.na_fila == 0
+            assert await portao.entrar()
+
+        asyncio.run(cenario())
+
+    def test_espera_esgotada_rejeita(self):
+        async def cenario():
+            portao = Portao(LimiteRota(concorrencia=1, fila=1, espera_max_s=0.01))
+            await portao.entrar()
+            assert not await portao.entrar()
+            assert portao.na_fila == 0
+
+        asyncio.run(cenario())
+
+
+class TestTokenBucket:
+
+    def test_excesso_de_taxa_retorna_429(self, client, seed_notas):
+        _instalar({"GET /v2/notas": LimiteRota(concorrencia=10, taxa=0.5, rajada=2)})
+
+        assert client.get("/v2/notas").status_code == 200
+        assert client.get("/v2/notas").status_code == 200
+        response = client.get("/v2/notas")
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+
+    def test_buckets_separados_por_credencial(self, client, seed_notas):
+        _instalar({"GET /v2/notas": LimiteRota(concorrencia=10, taxa=0.5, rajada=1)})
+
+        a = {"Authorization": "Bearer cliente-a"}
+        b = {"Authorization": "Bearer cliente-b"}
+        assert client.get("/v2/notas", headers=a).status_code == 200
+        assert client.get("/v2/notas", headers=a).status_code == 429
+        assert client.get("/v2/notas", headers=b).status_code == 200
+
+
+def test_limites_configuraveis_por_ambiente(monkeypatch):
+    monkeypatch.setenv(
+        "ADMISSAO_LIMITES", '{"GET /v2/produtos": {"concorrencia": 3, "fila": 1}}'
+    )
+    controle = ControleAdmissao.do_ambiente()
+    chaves = {c: limite for _, _, c, limite, _ in controle.rotas}
+    assert chaves["GET /v2/produtos"] == LimiteRota(concorrencia=3, fila=1)
+    assert "GET /v1/notas" in chaves  # padrões continuam valendo
+
+
+def test_limites_padrao_cabem_no_pool():
+    """Rotas limitadas + jobs nunca esgotam o pool: sobra reserva para as rotas livres."""
+    assert engine.pool.size() == POOL_SIZE and engine.pool._max_overflow == POOL_MAX_OVERFLOW
+    workers = GerenciadorJobs.do_ambiente(None).workers
+    necessarias = ControleAdmissao(LIMITES_PADRAO).conexoes_maximas() + workers
+    assert necessarias + RESERVA_ROTAS_LIVRES <= POOL_SIZE + POOL_MAX_OVERFLOW
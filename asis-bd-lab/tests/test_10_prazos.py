@@ -0,0 +1,153 @@
+"""
+Prazos de request
+=================
+Todo request tem um prazo (header X-Request-Timeout-Ms ou padrão da rota)
+que chega ao banco: estourado o prazo, a query é cancelada e o cliente
+recebe 504; se o cliente desconecta, o trabalho no banco é abandonado.
+
+Business Driver: uma query lenta não pode segurar thread e conexão por
+mais tempo do que o cliente está disposto a esperar.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import prazos
+from app.database import get_db_leitura
+from app.main import app
+from app.prazos import EstadoPrazo, MiddlewarePrazo, PrazoEsgotado, resolver_prazo_ms
+
+from conftest import TestSession
+
+CONSULTA_INFINITA = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+    "SELECT count(*) FROM c"
+)
+
+
+def _com_estado(estado):
+    """Executa o bloco como se estivesse dentro de um request com prazo."""
+    return prazos._estado.set(estado)
+
+
+class TestResolucaoPrazo:
+
+    def test_header_do_cliente_tem_prioridade(self):
+        assert resolver_prazo_ms("GET", "/v2/notas", "250") == 250
+
+    def test_header_e_limitado_ao_maximo(self):
+        assert resolver_prazo_ms("GET", "/v2/notas", "999999999") == prazos.PRAZO_MAXIMO_MS
+
+    def test_padrao_da_rota_e_fallback_global(self):
+        assert resolver_prazo_ms("GET", "/v2/notas/busca", None) == 5000
+        assert resolver_prazo_ms("GET", "/health", "abc") == prazos.PRAZO_PADRAO_MS
+
+
+class TestPrazoNoBanco:
+
+    def test_transacao_com_prazo_esgotado_nem_comeca(self):
+        engine = create_engine("sqlite://")
+        token = _com_estado(EstadoPrazo(-1))
+        try:
+            with Session(engine) as s, pytest.raises(PrazoEsgotado):
+                s.execute(text("SELECT 1"))
+        finally:
+            prazos._estado.reset(token)
+
+    def test_sem_request_nao_ha_prazo(self):
+        with Session(create_engine("sqlite://")) as s:
+            assert s.execute(text("SELECT 1")).scalar() == 1
+
+    def test_cancelamento_interrompe_query_em_andamento(self):
+        engine = create_engine("sqlite://")
+        estado = EstadoPrazo(30)
+        token = _com_estado(estado)
+        threading.Timer(0.1, estado.cancelar, args=("prazo_esgotado",)).start()
+        inicio = time.monotonic()
+        try:
+            with Session(engine) as s, pytest.raises(OperationalError) as erro:
+                s.execute(text(CONSULTA_INFINITA))
+            assert prazos.foi_cancelamento(erro.value)
+        finally:
+            prazos._estado.reset(token)
+        assert time.monotonic() - inicio < 5
+
+
+class TestPrazoHTTP:
+
+    def test_request_dentro_do_prazo(self, client, seed_notas):
+        response = client.get("/v2/notas", headers={"X-Request-Timeout-Ms": "5000"})
+        assert response.status_code == 200
+
+    def test_prazo_estourado_retorna_504(self, client, seed_notas):
+        def get_db_lento():
+            time.sleep(0.3)
+            db = TestSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db_leitura] = get_db_lento
+        response = client.get("/v2/notas", headers={"X-Request-Timeout-Ms": "50"})
+        assert response.status_code == 504
+        assert "x-correlation-id" in response.headers
+
+    def test_desconexao_do_cliente_cancela_o_trabalho(self):
+        estados = []
+        enviados = []
+
+        async def app_lenta(scope, receive, send):
+            estados.append(prazos.estado_atual())
+            await asyncio.sleep(0.5)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        mensagens = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if mensagens:
+                return mensagens.pop(0)
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(msg):
+            enviados.append(msg)
+
+        scope = {"type": "http", "method": "GET", "path": "/v2/notas", "headers": []}
+        asyncio.run(asyncio.wait_for(MiddlewarePrazo(app_lenta)(scope, receive, send), 5))
+
+        assert estados[0].cancelado == "cliente_desconectou"
+        assert enviados == []  # nada é enviado para um cliente que já foi
+
+    def test_app_termina_durante_o_envio_do_504(self):
+        enviados = []
+
+        async def app_quase_no_prazo(scope, receive, send):
+            await asyncio.sleep(0.05)  # acorda enquanto o 504 ainda está sendo enviado
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+
+        mensagens = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if mensagens:
+                return mensagens.pop(0)
+            await asyncio.sleep(10)
+            return {"type": "http.disconnect"}
+
+        async def send_lento(msg):
+            enviados.append(msg)
+            if msg["type"] == "http.response.start":
+                await asyncio.sleep(0.1)  # socket lento: a app roda nesse meio tempo
+
+        scope = {"type": "http", "method": "GET", "path": "/v2/notas",
+                 "headers": [(b"x-request-timeout-ms", b"20")]}
+        asyncio.run(asyncio.wait_for(MiddlewarePrazo(app_quase_no_prazo)(scope, receive, send_lento), 5))
+
+        assert [m.get("status") for m in enviados if m["type"] == "http.response.start"] == [504]
+        assert enviados[-1]["body"] == prazos.RESPOSTA_504
@@ -0,0 +1,130 @@
+"""
+Réplicas de leitura
+===================
+Leituras da v2 vão às réplicas em round-robin (pulando as fora do ar);
+escritas vão ao primário; quem acabou de escrever lê do primário por uma
+janela curta.
+
+Business Driver: escalar leitura sem sobrecarregar o primário e sem que o
+cliente deixe de ver o que acabou de gravar.
+"""
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+from app import database
+from app.database import Base, get_db_leitura
+from app.models import Produto
+from app.replicas import FixacaoPrimario, RoteadorReplicas, SessaoRoteada
+
+
+def _engine_memoria():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _request(auth="Bearer cliente-a"):
+    return Request({
+        "type": "http",
+        "headers": [(b"authorization", auth.encode())],
+        "client": ("10.0.0.1", 1234),
+    })
+
+
+@pytest.fixture
+def topologia(monkeypatch):
+    """Primário + 2 réplicas em memória, instalados no módulo database."""
+    primario, r1, r2 = _engine_memoria(), _engine_memoria(), _engine_memoria()
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(
+        class_=SessaoRoteada, autoflush=False, bind=primario
+    ))
+    monkeypatch.setattr(database, "roteador", RoteadorReplicas([r1, r2]))
+    monkeypatch.setattr(database, "fixacoes", FixacaoPrimario(janela_s=60))
+    return primario, r1, r2
+
+
+def _produto(codigo):
+    return Produto(codigo=codigo, descricao="x", ncm="12345678", preco_unitario=1, estoque=1)
+
+
+class TestRoteador:
+
+    def test_round_robin_entre_replicas(self):
+        r1, r2 = _engine_memoria(), _engine_memoria()
+        roteador = RoteadorReplicas([r1, r2])
+        assert [roteador.escolher() for _ in range(4)] == [r1, r2, r1, r2]
+
+    def test_replica_fora_do_ar_e_pulada(self):
+        saudavel = _engine_memoria()
+        fora = create_engine("sqlite:////diretorio/inexistente/replica.db")
+        roteador = RoteadorReplicas([fora, saudavel])
+        assert {roteador.escolher() for _ in range(4)} == {saudavel}
+
+    def test_sem_replica_saudavel_usa_primario(self):
+        roteador = RoteadorReplicas([_engine_memoria()])
+        roteador.marcar_falha(roteador.replicas[0].engine)
+        assert roteador.escolher() is None
+        assert RoteadorReplicas([]).escolher() is None
+
+
+class TestSessaoRoteada:
+
+    def test_leitura_na_replica_escrita_no_primario(self, topologia):
+        primario, replica, _ = topologia
+        db = database.SessionLocal(info={"replica": replica})
+        db.add(_produto("P-1"))
+        db.commit()
+
+        assert db.query(Produto).count() == 0  # réplica ainda não recebeu
+        with primario.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM produtos")).scalar() == 1
+        db.close()
+
+    def test_update_textual_vai_ao_primario(self, topologia):
+        primario, replica, _ = topologia
+        with primario.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO produtos (codigo, descricao, ncm, preco_unitario, estoque, version) "
+                "VALUES ('P-1', 'x', '12345678', 1, 1, 1)"
+            ))
+        db = database.SessionLocal(info={"replica": replica})
+        assert db.execute(text("UPDATE produtos SET estoque = 9")).rowcount == 1
+        db.commit()
+        db.close()
+
+
+class TestLeituraAposEscrita:
+
+    def test_get_db_leitura_escolhe_replica(self, topologia):
+        _, r1, r2 = topologia
+        gen = get_db_leitura(_request())
+        db = next(gen)
+        assert db.info["replica"] in (r1, r2)
+        gen.close()
+
+    def test_cliente_que_escreveu_le_do_primario(self, topologia):
+        db = database.SessionLocal(info={"cliente": database.identificar_cliente(_request())})
+        db.add(_produto("P-2"))
+        db.commit()
+        db.close()
+
+        gen = get_db_leitura(_request())
+        assert next(gen).info["replica"] is None
+        gen.close()
+
+        outro = get_db_leitura(_request("Bearer cliente-b"))
+        assert next(outro).info["replica"] is not None
+        outro.close()
+
+    def test_commit_so_de_leitura_nao_fixa(self, topologia):
+        cliente = database.identificar_cliente(_request())
+        db = database.SessionLocal(info={"cliente": cliente})
+        db.query(Produto).all()
+        db.commit()
+        db.close()
+        assert not database.fixacoes.fixado(cliente)
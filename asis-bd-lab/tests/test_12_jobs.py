@@ -0,0 +1,188 @@
+"""
+Jobs em segundo plano
+=====================
+Exportações grandes viram jobs: o POST responde 202 na hora, o cliente
+acompanha o progresso e baixa o arquivo quando pronto. A fila é a tabela
+`jobs`; um job interrompido retoma do checkpoint sem duplicar linhas.
+
+Business Driver: trabalho longo não pode ocupar workers de request nem se
+perder quando o processo reinicia.
+"""
+import csv
+import io
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import jobs
+from app.jobs import GerenciadorJobs
+from app.main import app
+from app.models import Job
+
+from conftest import TestSession
+
+
+def _submeter(client, **payload):
+    response = client.post("/v2/jobs/export", json=payload)
+    assert response.status_code == 202
+    return response
+
+
+class TestSubmissao:
+
+    def test_export_e_enfileirado_com_location(self, client, seed_notas):
+        response = _submeter(client)
+        job = response.json()
+        assert job["status"] == "pendente"
+        assert response.headers["location"] == f"/v2/jobs/{job['id']}"
+
+    def test_resultado_antes_de_concluir_retorna_409(self, client, seed_notas):
+        job_id = _submeter(client).json()["id"]
+        assert client.get(f"/v2/jobs/{job_id}/resultado").status_code == 409
+
+    def test_job_inexistente_retorna_404(self, client):
+        assert client.get("/v2/jobs/naoexiste").status_code == 404
+
+    def test_formato_invalido_retorna_422(self, client):
+        assert client.post("/v2/jobs/export", json={"formato": "xlsx"}).status_code == 422
+
+
+class TestExecucao:
+
+    def test_export_csv_completo(self, client, seed_notas):
+        job_id = _submeter(client).json()["id"]
+        assert app.state.jobs.executar_pendentes() == 1
+
+        job = client.get(f"/v2/jobs/{job_id}").json()
+        assert job["status"] == "concluido"
+        assert job["processados"] == job["total"] == 50
+        assert job["progresso"] == 1.0
+
+        response = client.get(f"/v2/jobs/{job_id}/resultado")
+        assert response.status_code == 200
+        linhas = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(linhas) == 50
+
+    def test_export_jsonl_com_filtro(self, client, seed_notas):
+        job_id = _submeter(client, formato="jsonl", emitente_cnpj="11222333000100").json()["id"]
+        app.state.jobs.executar_pendentes()
+
+        response = client.get(f"/v2/jobs/{job_id}/resultado")
+        registros = [json.loads(l) for l in response.text.splitlines()]
+        assert len(registros) == 16  # i % 3 == 0 para i em 1..50
+        assert {r["emitente_cnpj"] for r in registros} == {"11222333000100"}
+
+    def test_periodo_igual_ao_da_busca(self, client, seed_notas):
+        periodo = {"data_inicio": "2026-01-01T10:00:00", "data_fim": "2026-01-01T20:00:00"}
+        job_id = _submeter(client, formato="jsonl", **periodo).json()["id"]
+        app.state.jobs.executar_pendentes()
+
+        exportadas = {json.loads(l)["id"] for l in
+                      client.get(f"/v2/jobs/{job_id}/resultado").text.splitlines()}
+        buscadas = {n["id"] for n in client.get("/v2/notas/busca",
+                                                 params={**periodo, "limit": 100}).json()}
+        # data_fim exclusivo: a nota emitida exatamente às 20:00 fica de fora
+        assert exportadas == buscadas and len(exportadas) == 10
+
+    def test_cnpj_e_faixa_de_valor_iguais_aos_da_busca(self, client, seed_notas):
+        filtros = {"cnpj": "11222333000101", "valor_min": 30.0, "valor_max": 120.0}
+        job_id = _submeter(client, formato="jsonl", **filtros).json()["id"]
+        app.state.jobs.executar_pendentes()
+
+        exportadas = {json.loads(l)["id"] for l in
+                      client.get(f"/v2/jobs/{job_id}/resultado").text.splitlines()}
+        buscadas = {n["id"] for n in client.get("/v2/notas/busca",
+                                                 params={**filtros, "limit": 100}).json()}
+        assert exportadas == buscadas
+        assert 0 < len(exportadas) < 50
+
+    def test_falha_definitiva_apos_max_tentativas(self, client, seed_notas, monkeypatch):
+        def quebra(ctx):
+            raise RuntimeError("disco cheio")
+
+        monkeypatch.setitem(jobs.TIPOS, "exportar_notas", quebra)
+        job_id = _submeter(client).json()["id"]
+        assert app.state.jobs.executar_pendentes() == 3  # max_tentativas
+
+        job = client.get(f"/v2/jobs/{job_id}").json()
+        assert job["status"] == "falhou"
+        assert "disco cheio" in job["erro"]
+        assert client.get(f"/v2/jobs/{job_id}/resultado").status_code == 409
+
+
+class TestRetomada:
+
+    def test_interrupcao_retoma_do_checkpoint_sem_duplicar(
+        self, client, seed_notas, monkeypatch
+    ):
+        monkeypatch.setattr(jobs, "LOTE_EXPORT", 20)
+        gerenciador = app.state.jobs
+        progresso_original = jobs.ContextoJob.progresso
+
+        def desligar_no_primeiro_lote(ctx, *args, **kwargs):
+            gerenciador._parar.set()  # processo recebeu SIGTERM
+            progresso_original(ctx, *args, **kwargs)
+
+        monkeypatch.setattr(jobs.ContextoJob, "progresso", desligar_no_primeiro_lote)
+        job_id = _submeter(client).json()["id"]
+        gerenciador.executar_proximo()
+
+        job = client.get(f"/v2/jobs/{job_id}").json()
+        assert job["status"] == "pendente"
+        assert job["processados"] == 20
+
+        # "Reinício": novo gerenciador, mesma tabela e mesmo diretório
+        monkeypatch.setattr(jobs.ContextoJob, "progresso", progresso_original)
+        novo = GerenciadorJobs(TestSession, gerenciador.diretorio, workers=0)
+        app.state.jobs = novo
+        assert novo.executar_pendentes() == 1
+
+        texto = client.get(f"/v2/jobs/{job_id}/resultado").text
+        ids = [int(l["id"]) for l in csv.DictReader(io.StringIO(texto))]
+        assert len(ids) == len(set(ids)) == 50
+
+    def test_job_orfao_volta_para_a_fila(self, client, seed_notas):
+        job_id = _submeter(client).json()["id"]
+        with TestSession() as db:
+            job = db.get(Job, job_id)
+            job.status = "executando"  # processo morreu no meio
+            job.heartbeat_em = datetime.utcnow() - timedelta(minutes=10)
+            db.commit()
+
+        assert app.state.jobs.recuperar_orfaos() == 1
+        app.state.jobs.executar_pendentes()
+        assert client.get(f"/v2/jobs/{job_id}").json()["status"] == "concluido"
+
+    def test_heartbeat_renovado_durante_passo_longo(self, client, seed_notas, monkeypatch):
+        def passo_longo(ctx):
+            time.sleep(0.3)  # ex.: o count do export, sem chamar progresso
+
+        monkeypatch.setitem(jobs.TIPOS, "exportar_notas", passo_longo)
+        gerenciador = GerenciadorJobs(TestSession, app.state.jobs.diretorio, workers=0,
+                                      heartbeat_expira_s=0.2)
+        job_id = _submeter(client).json()["id"]
+        assert gerenciador.executar_proximo()
+
+        with TestSession() as db:
+            job = db.get(Job, job_id)
+            assert job.status == "concluido"
+            assert job.heartbeat_em - job.iniciado_em >= timedelta(seconds=0.15)
+
+    def test_execucao_que_perdeu_o_job_para_sem_gravar(self, client, seed_notas, monkeypatch):
+        def assumido_por_outro(ctx):
+            with TestSession() as db:  # heartbeat expirou e outro worker reservou
+                db.execute(update(Job).where(Job.id == ctx.id)
+                           .values(tentativas=Job.tentativas + 1))
+                db.commit()
+            ctx.progresso(10, 50, {"ultimo_id": 10})
+            raise AssertionError("progresso deveria ter parado a execução")
+
+        monkeypatch.setitem(jobs.TIPOS, "exportar_notas", assumido_por_outro)
+        job_id = _submeter(client).json()["id"]
+        assert app.state.jobs.executar_proximo()
+
+        job = client.get(f"/v2/jobs/{job_id}").json()
+        assert job["status"] == "executando"  # é do outro worker agora
+        assert job["processados"] == 0 and job["erro"] is None
@@ -0,0 +1,149 @@
+"""
+Agregados de itens na nota
+==========================
+qtd_itens, quantidade_total e produtos_distintos ficam gravados na própria
+nota e são recalculados na mesma transação que grava os itens. Listagem e
+busca devolvem o resumo sem consultar itens_nota.
+
+Business Driver: página de listagem com resumo de itens sem JOIN por
+request — e um comando que detecta e corrige divergências.
+"""
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import StaticPool
+
+from app.agregados import verificar_agregados
+from app.migracoes import migrar
+from app.models import ItemNota, NotaFiscal
+
+from conftest import engine_test
+
+
+def _resumo(nota):
+    return (nota.qtd_itens, nota.quantidade_total, nota.produtos_distintos)
+
+
+def _item(nota_id, produto, quantidade):
+    return ItemNota(nota_id=nota_id, produto_id=produto.id, quantidade=quantidade,
+                    valor_unitario=1.0, valor_total=float(quantidade))
+
+
+class TestManutencao:
+
+    def test_seed_tem_resumo_calculado(self, db_session, seed_notas):
+        nota = db_session.get(NotaFiscal, seed_notas[0].id)
+        assert _resumo(nota) == (1, 2, 1)
+
+    def test_novo_item_atualiza_na_mesma_transacao(self, db_session, seed_notas, seed_produtos):
+        nota = seed_notas[0]
+        db_session.add(_item(nota.id, seed_produtos[5], 3))
+        db_session.flush()
+        assert _resumo(nota) == (2, 5, 2)  # visível antes do commit
+
+        db_session.add(_item(nota.id, seed_produtos[5], 1))
+        db_session.commit()
+        assert _resumo(nota) == (3, 6, 2)
+
+    def test_item_pela_relationship_em_nota_nova(self, db_session, seed_produtos):
+        nota = NotaFiscal(numero="NF-REL", emitente_cnpj="1" * 14,
+                          destinatario_cnpj="2" * 14, valor_total=10.0)
+        nota.itens.append(ItemNota(produto_id=seed_produtos[0].id, quantidade=4,
+                                   valor_unitario=2.5, valor_total=10.0))
+        db_session.add(nota)
+        db_session.commit()
+        assert _resumo(nota) == (1, 4, 1)
+
+    def test_remover_e_mover_item_atualiza_as_duas_notas(self, db_session, seed_notas):
+        origem, destino = seed_notas[0], seed_notas[1]
+        item = origem.itens[0]
+        item.nota_id = destino.id
+        db_session.commit()
+        assert _resumo(origem) == (0, 0, 0)
+        assert _resumo(destino)[0] == 2
+
+        db_session.delete(item)
+        db_session.commit()
+        assert _resumo(destino) == (1, 2, 1)
+
+    def test_rollback_nao_altera_resumo(self, db_session, seed_notas, seed_produtos):
+        nota = seed_notas[0]
+        db_session.add(_item(nota.id, seed_produtos[5], 7))
+        db_session.flush()
+        db_session.rollback()
+        assert _resumo(db_session.get(NotaFiscal, nota.id)) == (1, 2, 1)
+
+
+class TestEndpoints:
+
+    def test_listagem_traz_resumo_sem_tocar_itens(self, client, seed_notas):
+        sqls = []
+
+        def capturar(conn, cursor, statement, *args):
+            sqls.append(statement)
+
+        event.listen(engine_test, "before_cursor_execute", capturar)
+        try:
+            notas = client.get("/v2/notas?limit=5").json()
+        finally:
+            event.remove(engine_test, "before_cursor_execute", capturar)
+
+        assert [_resumo_json(n) for n in notas] == [(1, 2, 1)] * 5
+        assert not any("itens_nota" in s for s in sqls)
+
+    def test_busca_traz_resumo(self, client, seed_notas):
+        notas = client.get("/v2/notas/busca", params={"cnpj": "11222333000101"}).json()
+        assert notas and all(_resumo_json(n) == (1, 2, 1) for n in notas)
+
+
+def _resumo_json(n):
+    return (n["qtd_itens"], n["quantidade_total"], n["produtos_distintos"])
+
+
+class TestVerificacao:
+
+    @pytest.mark.commit_real  # escreve e repara pelo engine, fora da sessão
+    def test_detecta_e_repara_divergencia(self, db_session, seed_notas):
+        nota_id = seed_notas[0].id
+        with engine_test.begin() as conn:  # escrita fora do ORM
+            conn.execute(text(
+                "INSERT INTO itens_nota (nota_id, produto_id, quantidade, valor_unitario, valor_total) "
+                f"VALUES ({nota_id}, 1, 10, 1.0, 10.0)"
+            ))
+
+        divergencias = verificar_agregados(engine_test)
+        assert [(d.nota_id, d.gravado, d.real) for d in divergencias] == [
+            (nota_id, (1, 2, 1), (2, 12, 2))
+        ]
+
+        verificar_agregados(engine_test, reparar=True)
+        assert verificar_agregados(engine_test) == []
+
+    def test_migracao_preenche_banco_antigo(self):
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE notas_fiscais (id INTEGER PRIMARY KEY, "
+                "numero VARCHAR(20) NOT NULL, serie VARCHAR(5), "
+                "emitente_cnpj VARCHAR(14) NOT NULL, destinatario_cnpj VARCHAR(14) NOT NULL, "
+                "valor_total FLOAT NOT NULL, status VARCHAR(20), data_emissao DATETIME, "
+                "observacao TEXT)"
+            ))
+            conn.execute(text(
+                "INSERT INTO notas_fiscais VALUES "
+                "(1, 'NF-1', '001', '1', '2', 10.0, 'emitida', '2026-01-01', NULL)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE itens_nota (id INTEGER PRIMARY KEY, nota_id INTEGER NOT NULL, "
+                "produto_id INTEGER NOT NULL, quantidade INTEGER NOT NULL, "
+                "valor_unitario FLOAT NOT NULL, valor_total FLOAT NOT NULL)"
+            ))
+            conn.execute(text(
+                "INSERT INTO itens_nota VALUES (1, 1, 7, 3, 1.0, 3.0), (2, 1, 8, 2, 1.0, 2.0)"
+            ))
+
+        assert "0002_agregados_itens" in migrar(engine)
+        assert "qtd_itens" in {c["name"] for c in inspect(engine).get_columns("notas_fiscais")}
+        with engine.connect() as conn:
+            assert conn.execute(text(
+                "SELECT qtd_itens, quantidade_total, produtos_distintos FROM notas_fiscais"
+            )).one() == (2, 5, 2)
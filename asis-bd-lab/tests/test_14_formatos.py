@@ -0,0 +1,87 @@
+"""
+Formatos compactos (colunar JSON / MessagePack)
+===============================================
+Consumidores internos pedem, via Accept, o layout colunar — nomes de campo
+uma única vez — em JSON ou MessagePack. Sem Accept específico, nada muda.
+
+Business Driver: payload menor e parse mais rápido em leituras em massa
+entre serviços.
+"""
+import io
+
+import msgpack
+
+from app.formatos import MIDIA_COLUNAR, MIDIA_JSON, MIDIA_MSGPACK, negociar
+from app.main import app
+
+COLUNAR = {"Accept": MIDIA_COLUNAR}
+MSGPACK = {"Accept": MIDIA_MSGPACK}
+
+
+class TestNegociacao:
+
+    def test_padrao_e_json(self):
+        assert negociar(None) == MIDIA_JSON
+        assert negociar("*/*") == MIDIA_JSON
+        assert negociar("text/html, application/xml") == MIDIA_JSON
+
+    def test_respeita_q_e_sinonimos(self):
+        assert negociar("application/json;q=0.5, application/msgpack") == MIDIA_MSGPACK
+        assert negociar("application/msgpack;q=0.2, application/json") == MIDIA_JSON
+        assert negociar("application/x-msgpack") == MIDIA_MSGPACK
+
+
+class TestListagem:
+
+    def test_json_continua_igual(self, client, seed_notas):
+        response = client.get("/v2/notas?limit=3")
+        assert response.headers["content-type"] == "application/json"
+        assert response.headers["vary"] == "Accept"
+        assert isinstance(response.json()[0], dict)
+
+    def test_colunar_equivale_ao_json(self, client, seed_notas):
+        objetos = client.get("/v2/notas?limit=5").json()
+        response = client.get("/v2/notas?limit=5", headers=COLUNAR)
+
+        assert response.headers["content-type"] == MIDIA_COLUNAR
+        corpo = response.json()
+        reconstruido = [dict(zip(corpo["columns"], linha)) for linha in corpo["rows"]]
+        assert reconstruido == objetos
+
+    def test_msgpack_e_menor_que_json(self, client, seed_notas):
+        texto = client.get("/v2/notas?limit=50").content
+        response = client.get("/v2/notas?limit=50", headers=MSGPACK)
+
+        corpo = msgpack.unpackb(response.content)
+        assert len(corpo["rows"]) == 50
+        assert len(response.content) < len(texto) / 2
+
+
+    def test_produtos_sem_fields_tambem_negociam(self, client, seed_produtos):
+        objetos = client.get("/v2/produtos?limit=5").json()
+        response = client.get("/v2/produtos?limit=5", headers=COLUNAR)
+
+        assert response.headers["content-type"] == MIDIA_COLUNAR
+        corpo = response.json()
+        assert [dict(zip(corpo["columns"], linha)) for linha in corpo["rows"]] == objetos
+        assert len(msgpack.unpackb(client.get("/v2/produtos?limit=5", headers=MSGPACK).content)["rows"]) == 5
+
+
+class TestBuscaEExport:
+
+    def test_busca_colunar_mantem_cursor(self, client, seed_notas):
+        response = client.get("/v2/notas/busca?limit=10", headers=COLUNAR)
+        assert response.status_code == 200
+        assert len(response.json()["rows"]) == 10
+        assert "x-proximo-cursor" in response.headers
+        assert "observacao" not in response.json()["columns"]
+
+    def test_export_msgpack(self, client, seed_notas):
+        job_id = client.post("/v2/jobs/export", json={"formato": "msgpack"}).json()["id"]
+        app.state.jobs.executar_pendentes()
+
+        response = client.get(f"/v2/jobs/{job_id}/resultado")
+        assert response.headers["content-type"] == MIDIA_MSGPACK
+        colunas, *linhas = list(msgpack.Unpacker(io.BytesIO(response.content)))
+        assert colunas[0] == "id"
+        assert len(linhas) == 50
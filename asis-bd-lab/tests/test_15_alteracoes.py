@@ -0,0 +1,179 @@
+"""
+Feed de alterações
+==================
+Toda escrita em notas e produtos grava uma linha em `alteracoes` na mesma
+transação. Consumidores pedem só o que mudou desde o último `seq` visto —
+paginando GET /v2/changes ou assinando o stream SSE.
+
+Business Driver: sistemas parceiros sincronizam sem reler a base inteira
+nem perder alterações entre uma leitura e outra.
+"""
+import json
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.pool import StaticPool
+
+from app import alteracoes
+from app.database import fabrica_leitura
+from app.main import app
+from app.migracoes import migrar
+from app.models import Alteracao, ItemNota, NotaFiscal
+
+from conftest import TestSession
+
+
+def _ultimo_seq(db):
+    return db.scalar(select(Alteracao.seq).order_by(Alteracao.seq.desc()).limit(1)) or 0
+
+
+def _feed(client, **params):
+    response = client.get("/v2/changes", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def _nota(numero="NF-FEED"):
+    return NotaFiscal(numero=numero, emitente_cnpj="1" * 14,
+                      destinatario_cnpj="2" * 14, valor_total=10.0)
+
+
+class TestRegistro:
+
+    def test_insert_update_delete_de_nota(self, client, db_session):
+        nota = _nota()
+        db_session.add(nota)
+        db_session.commit()
+        nota.status = "cancelada"
+        db_session.commit()
+        nota_id = nota.id
+        db_session.delete(nota)
+        db_session.commit()
+
+        feed = _feed(client, entidade="nota")["alteracoes"]
+        assert [(a["entidade_id"], a["operacao"]) for a in feed] == [
+            (nota_id, "insert"), (nota_id, "update"), (nota_id, "delete"),
+        ]
+        assert all(a["dados"] is None for a in feed)  # nota não existe mais
+
+    def test_dados_trazem_estado_atual(self, client, db_session):
+        nota = _nota()
+        db_session.add(nota)
+        db_session.commit()
+        nota.status = "cancelada"
+        db_session.commit()
+
+        feed = _feed(client)["alteracoes"]
+        assert {a["dados"]["status"] for a in feed} == {"cancelada"}
+
+    def test_rollback_nao_registra(self, db_session):
+        antes = _ultimo_seq(db_session)
+        db_session.add(_nota())
+        db_session.flush()
+        db_session.rollback()
+        assert _ultimo_seq(db_session) == antes
+
+    def test_item_alterado_conta_como_update_da_nota(self, db_session, seed_notas, seed_produtos):
+        nota = seed_notas[0]
+        since = _ultimo_seq(db_session)
+        db_session.add(ItemNota(nota_id=nota.id, produto_id=seed_produtos[0].id,
+                                quantidade=1, valor_unitario=1.0, valor_total=1.0))
+        db_session.commit()
+
+        novas = db_session.scalars(select(Alteracao).where(Alteracao.seq > since)).all()
+        assert [(a.entidade, a.entidade_id, a.operacao) for a in novas] == [
+            ("nota", nota.id, "update")
+        ]
+
+    def test_estoque_v2_registra_com_versao(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        since = _feed(client)["proximo_since"]
+        r = client.put(f"/v2/produtos/{produto.id}/estoque",
+                       params={"quantidade": -5, "version": produto.version})
+        assert r.status_code == 200
+
+        feed = _feed(client, since=since)["alteracoes"]
+        assert [(a["entidade_id"], a["operacao"], a["versao"]) for a in feed] == [
+            (produto.id, "update", r.json()["version"])
+        ]
+        assert feed[0]["dados"]["estoque"] == 95
+
+    def test_conflito_de_versao_nao_registra(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        since = _feed(client)["proximo_since"]
+        r = client.put(f"/v2/produtos/{produto.id}/estoque",
+                       params={"quantidade": 1, "version": produto.version + 7})
+        assert r.status_code == 409
+        assert _feed(client, since=since)["alteracoes"] == []
+
+
+class TestPaginacao:
+
+    def test_since_e_tem_mais_percorrem_tudo_sem_repetir(self, client, seed_produtos):
+        vistos, since = [], 0
+        while True:
+            pagina = _feed(client, since=since, limit=3)
+            vistos += [a["seq"] for a in pagina["alteracoes"]]
+            since = pagina["proximo_since"]
+            if not pagina["tem_mais"]:
+                break
+        assert len(vistos) == len(set(vistos)) == 10
+        assert vistos == sorted(vistos)
+        assert _feed(client, since=since) == {"alteracoes": [], "proximo_since": since,
+                                              "tem_mais": False}
+
+    def test_filtro_por_entidade(self, client, seed_notas):
+        produtos = _feed(client, entidade="produto", limit=1000)["alteracoes"]
+        assert len(produtos) == 10
+        assert {a["entidade"] for a in produtos} == {"produto"}
+        assert client.get("/v2/changes", params={"entidade": "item"}).status_code == 422
+
+
+class TestStream:
+
+    def test_sse_entrega_eventos_a_partir_do_last_event_id(self, client, seed_produtos, monkeypatch):
+        monkeypatch.setattr(alteracoes, "SSE_DURACAO_MAX_S", 0.05)
+        monkeypatch.setattr(alteracoes, "SSE_INTERVALO_S", 0.01)
+        seqs = [a["seq"] for a in _feed(client)["alteracoes"]]
+
+        response = client.get("/v2/changes/stream", headers={"Last-Event-ID": str(seqs[6])})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        eventos = [b for b in response.text.split("\n\n") if b.startswith("id:")]
+        ids = [int(e.splitlines()[0].split(": ")[1]) for e in eventos]
+        assert ids == seqs[7:]
+        dados = json.loads(eventos[0].splitlines()[2][len("data: "):])
+        assert dados["entidade"] == "produto"
+
+
+    def test_sse_usa_e_fecha_a_propria_sessao(self, client, seed_produtos, monkeypatch):
+        monkeypatch.setattr(alteracoes, "SSE_DURACAO_MAX_S", 0.05)
+        monkeypatch.setattr(alteracoes, "SSE_INTERVALO_S", 0.01)
+        fechadas = []
+
+        def abrir():
+            db = TestSession()
+            fechar = db.close
+            db.close = lambda: (fechadas.append(db), fechar())
+            return db
+
+        app.dependency_overrides[fabrica_leitura] = lambda: abrir
+        assert "event: alteracao" in client.get("/v2/changes/stream").text
+        assert len(fechadas) == 1  # uma sessão por stream, fechada pelo gerador
+
+
+class TestMigracao:
+
+    def test_banco_existente_ganha_insert_por_registro(self):
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE produtos (id INTEGER PRIMARY KEY, codigo VARCHAR(20))"
+            ))
+            conn.execute(text("INSERT INTO produtos VALUES (1, 'A'), (2, 'B')"))
+
+        assert "0003_alteracoes_inicial" in migrar(engine)
+        with engine.connect() as conn:
+            assert conn.execute(text(
+                "SELECT entidade, entidade_id, operacao FROM alteracoes ORDER BY seq"
+            )).all() == [("produto", 1, "insert"), ("produto", 2, "insert")]
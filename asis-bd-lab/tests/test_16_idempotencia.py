@@ -0,0 +1,110 @@
+"""
+Idempotency-Key
+===============
+Retry de uma escrita com a mesma chave devolve a primeira resposta sem
+reexecutar: o delta de estoque não é aplicado duas vezes e o POST não
+cria o produto de novo.
+
+Business Driver: clientes podem repetir escritas agressivamente quando a
+rede oscila — e, com isso, usar timeouts menores.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.idempotencia import limpar_expiradas
+from app.models import Produto, RespostaIdempotente
+
+from conftest import engine_test
+
+NOVO = {"codigo": "IDEM-1", "descricao": "Produto idempotente", "ncm": "12345678",
+        "preco_unitario": 10.0, "estoque": 5}
+
+
+def _estoque(client, produto, quantidade, version, chave=None):
+    headers = {"Idempotency-Key": chave} if chave else {}
+    return client.put(f"/v2/produtos/{produto.id}/estoque",
+                      params={"quantidade": quantidade, "version": version},
+                      headers=headers)
+
+
+class TestEstoque:
+
+    def test_retry_nao_reaplica_delta(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        primeira = _estoque(client, produto, -10, produto.version, chave="k-1")
+        repetida = _estoque(client, produto, -10, produto.version, chave="k-1")
+
+        assert primeira.status_code == repetida.status_code == 200
+        assert repetida.json() == primeira.json() == {
+            "id": produto.id, "estoque": 90, "version": produto.version + 1,
+        }
+        assert repetida.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in primeira.headers
+        assert client.get(f"/v2/produtos/{produto.id}").json()["estoque"] == 90
+
+    def test_sem_chave_o_retry_conflita(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        assert _estoque(client, produto, -10, produto.version).status_code == 200
+        assert _estoque(client, produto, -10, produto.version).status_code == 409
+
+    def test_conflito_nao_e_gravado(self, client, db_session, seed_produtos):
+        produto = seed_produtos[0]
+        assert _estoque(client, produto, 1, produto.version + 5, chave="k-2").status_code == 409
+        assert db_session.scalar(select(func.count()).select_from(RespostaIdempotente)) == 0
+        # Mesma chave, agora com a versão certa: executa normalmente
+        assert _estoque(client, produto, 1, produto.version, chave="k-2").status_code == 200
+
+    def test_mesma_chave_com_outro_corpo_retorna_422(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        assert _estoque(client, produto, -1, produto.version, chave="k-3").status_code == 200
+        assert _estoque(client, produto, -2, produto.version, chave="k-3").status_code == 422
+
+    def test_chave_longa_demais_retorna_400(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        assert _estoque(client, produto, 1, produto.version, chave="x" * 129).status_code == 400
+
+
+class TestCriacao:
+
+    def test_post_repetido_nao_duplica(self, client, db_session):
+        headers = {"Idempotency-Key": "novo-1"}
+        primeira = client.post("/v2/produtos", json=NOVO, headers=headers)
+        repetida = client.post("/v2/produtos", json=NOVO, headers=headers)
+
+        assert primeira.status_code == repetida.status_code == 201
+        assert repetida.json() == primeira.json()
+        assert db_session.scalar(
+            select(func.count()).select_from(Produto).where(Produto.codigo == "IDEM-1")
+        ) == 1
+
+    def test_chave_e_por_cliente(self, client):
+        headers = {"Idempotency-Key": "novo-2"}
+        assert client.post("/v2/produtos", json=NOVO, headers=headers).status_code == 201
+        outro = client.post("/v2/produtos", json={**NOVO, "codigo": "IDEM-2"},
+                            headers={**headers, "Authorization": "Bearer outro-cliente"})
+        assert outro.status_code == 201
+        assert outro.json()["codigo"] == "IDEM-2"
+
+
+class TestExpiracao:
+
+    @pytest.mark.commit_real  # limpar_expiradas() comita pelo engine
+    def test_chave_expirada_executa_de_novo_e_e_limpa(self, client, db_session, seed_produtos):
+        produto, version = seed_produtos[0], seed_produtos[0].version
+        assert _estoque(client, produto, -1, version, chave="k-4").status_code == 200
+        db_session.execute(RespostaIdempotente.__table__.update().values(
+            expira_em=datetime.utcnow() - timedelta(seconds=1)
+        ))
+        db_session.commit()
+
+        nova = _estoque(client, produto, -1, version + 1, chave="k-4")
+        assert nova.status_code == 200 and "Idempotent-Replayed" not in nova.headers
+        assert nova.json()["estoque"] == 98
+
+        db_session.execute(RespostaIdempotente.__table__.update().values(
+            expira_em=datetime.utcnow() - timedelta(seconds=1)
+        ))
+        db_session.commit()
+        assert limpar_expiradas(engine_test) == 1
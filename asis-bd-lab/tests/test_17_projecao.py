@@ -0,0 +1,85 @@
+"""
+Projeção de campos (fields=)
+============================
+Listagens v2 aceitam `fields=` com whitelist: só as colunas pedidas entram
+no SELECT e na resposta; itens só são carregados quando pedidos.
+
+Business Driver: grades que mostram três colunas não devem ler nem
+trafegar `observacao` e o resto da nota.
+"""
+import msgpack
+from sqlalchemy import event
+
+from app.formatos import MIDIA_MSGPACK
+
+from conftest import engine_test
+
+
+def _capturar_sql(client, url, **kwargs):
+    sqls = []
+
+    def capturar(conn, cursor, statement, *args):
+        sqls.append(statement)
+
+    event.listen(engine_test, "before_cursor_execute", capturar)
+    try:
+        response = client.get(url, **kwargs)
+    finally:
+        event.remove(engine_test, "before_cursor_execute", capturar)
+    return response, sqls
+
+
+class TestNotas:
+
+    def test_so_campos_pedidos_no_select_e_na_resposta(self, client, seed_notas):
+        response, sqls = _capturar_sql(client, "/v2/notas?limit=5&fields=numero,status,valor_total")
+        assert response.status_code == 200
+        notas = response.json()
+        assert len(notas) == 5
+        assert list(notas[0]) == ["numero", "status", "valor_total"]
+
+        select_notas = next(s for s in sqls if "FROM notas_fiscais" in s)
+        assert "observacao" not in select_notas
+        assert "emitente_cnpj" not in select_notas
+        assert not any("itens_nota" in s for s in sqls)
+
+    def test_itens_so_quando_pedidos_em_uma_query(self, client, seed_notas):
+        response, sqls = _capturar_sql(client, "/v2/notas?limit=10&fields=id,itens")
+        notas = response.json()
+        assert [len(n["itens"]) for n in notas] == [1] * 10
+        assert set(notas[0]["itens"][0]) == {"id", "produto_id", "quantidade",
+                                             "valor_unitario", "valor_total"}
+        assert sum("itens_nota" in s for s in sqls) == 1  # selectinload, sem N+1
+
+    def test_campo_fora_da_whitelist_retorna_422(self, client, seed_notas):
+        for fields in ("numero,senha", "itens.produto", ",", ""):
+            response = client.get("/v2/notas", params={"fields": fields})
+            assert response.status_code == 422, fields
+        assert "Permitidos" in client.get("/v2/notas?fields=x").json()["detail"]
+
+    def test_datas_em_iso_e_ordem_preservada(self, client, seed_notas):
+        notas = client.get("/v2/notas?limit=2&fields=data_emissao,id").json()
+        assert notas == [
+            {"data_emissao": "2026-01-01T01:00:00", "id": seed_notas[0].id},
+            {"data_emissao": "2026-01-01T02:00:00", "id": seed_notas[1].id},
+        ]
+
+    def test_projecao_com_msgpack(self, client, seed_notas):
+        response = client.get("/v2/notas?limit=3&fields=id,numero",
+                              headers={"Accept": MIDIA_MSGPACK})
+        corpo = msgpack.unpackb(response.content)
+        assert corpo["columns"] == ["id", "numero"]
+        assert corpo["rows"][0] == [seed_notas[0].id, "TST-000001"]
+
+    def test_sem_fields_resposta_inalterada(self, client, seed_notas):
+        nota = client.get("/v2/notas?limit=1").json()[0]
+        assert "observacao" in nota and "itens" not in nota
+
+
+class TestProdutos:
+
+    def test_projecao_em_produtos(self, client, seed_produtos):
+        response, sqls = _capturar_sql(client, "/v2/produtos?limit=3&fields=codigo,estoque")
+        assert response.json() == [{"codigo": f"TEST-{i:04d}", "estoque": 100} for i in (1, 2, 3)]
+        assert "descricao" not in next(s for s in sqls if "FROM produtos" in s)
+        assert client.get("/v2/produtos?fields=itens").status_code == 422
@@ -0,0 +1,134 @@
+"""
+Conciliação de totais
+=====================
+Audita notas cujo valor_total difere da soma de itens_nota.valor_total,
+lendo as duas tabelas em faixas de id e somando com NumPy — sem N+1 e com
+memória limitada pelo lote. Retoma do checkpoint sem duplicar linhas.
+
+Business Driver: auditar a base inteira (dezenas de milhões de itens) sem
+carregar tudo em memória nem recomeçar do zero a cada falha.
+"""
+import csv
+
+import numpy as np
+import pytest
+from sqlalchemy import event
+
+from app import conciliacao
+from app.cli import main as cli
+from app.conciliacao import conciliar_faixa, conciliar_totais
+from app.main import app
+from app.models import ItemNota, NotaFiscal
+
+from conftest import TestSession, engine_test
+
+
+@pytest.fixture
+def notas_conciliacao(db_session, seed_produtos):
+    """30 notas com dois itens; as de número múltiplo de 7 divergem."""
+    divergentes = []
+    for i in range(1, 31):
+        total = 30.0 + (0.5 if i % 7 == 0 else 0.0)
+        nota = NotaFiscal(numero=f"CONC-{i}", emitente_cnpj="1" * 14,
+                          destinatario_cnpj="2" * 14, valor_total=total)
+        for valor in (10.0, 20.0):
+            nota.itens.append(ItemNota(produto_id=seed_produtos[0].id, quantidade=1,
+                                       valor_unitario=valor, valor_total=valor))
+        db_session.add(nota)
+        db_session.flush()
+        if i % 7 == 0:
+            divergentes.append(nota.id)
+    db_session.commit()
+    return divergentes
+
+
+def _ids_relatorio(caminho):
+    with open(caminho) as f:
+        return [int(l["nota_id"]) for l in csv.DictReader(f)]
+
+
+class TestFaixa:
+
+    def test_soma_por_nota_com_tolerancia(self):
+        ids = np.array([1, 2, 3, 5])
+        totais = np.array([10.0, 5.0, 7.0, 1.0])
+        item_notas = np.array([1, 1, 2, 3, 4])
+        valores = np.array([4.0, 6.0, 5.004, 6.0, 9.0])
+        soma, qtd, divergentes, orfaos = conciliar_faixa(ids, totais, item_notas, valores)
+        assert soma.tolist() == pytest.approx([10.0, 5.004, 6.0, 0.0])
+        assert qtd.tolist() == [2, 1, 1, 0]
+        assert divergentes.tolist() == [False, False, True, True]
+        assert orfaos == 1  # item da nota 4, que não existe
+
+
+class TestConciliacao:
+
+    def test_relatorio_lista_so_divergentes(self, notas_conciliacao, tmp_path, monkeypatch):
+        monkeypatch.setattr(conciliacao, "LOTE_CONCILIACAO", 8)
+        relatorio = str(tmp_path / "conc.csv")
+        ck = conciliar_totais(TestSession, relatorio)
+
+        assert _ids_relatorio(relatorio) == notas_conciliacao
+        assert (ck["notas"], ck["itens"], ck["divergentes"]) == (30, 60, 4)
+        with open(relatorio) as f:
+            linha = next(csv.DictReader(f))
+        assert (linha["soma_itens"], linha["diferenca"], linha["qtd_itens"]) == ("30.00", "0.50", "2")
+
+    def test_sem_n_mais_1(self, notas_conciliacao, tmp_path, monkeypatch):
+        monkeypatch.setattr(conciliacao, "LOTE_CONCILIACAO", 10)
+        sqls = []
+
+        def capturar(conn, cursor, statement, *args):
+            if "SAVEPOINT" not in statement:  # transação do teste (conftest)
+                sqls.append(statement)
+
+        event.listen(engine_test, "before_cursor_execute", capturar)
+        try:
+            conciliar_totais(TestSession, str(tmp_path / "conc.csv"))
+        finally:
+            event.remove(engine_test, "before_cursor_execute", capturar)
+        # 1 COUNT + 3 faixas x (notas + itens) + a consulta vazia final
+        assert len(sqls) == 8
+
+    def test_retomada_nao_duplica(self, notas_conciliacao, tmp_path, monkeypatch):
+        monkeypatch.setattr(conciliacao, "LOTE_CONCILIACAO", 8)
+        relatorio = str(tmp_path / "conc.csv")
+        checkpoints = []
+
+        def cair_no_segundo_lote(ck, total):
+            checkpoints.append(ck)
+            if len(checkpoints) == 2:
+                raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            conciliar_totais(TestSession, relatorio, ao_concluir_lote=cair_no_segundo_lote)
+        with open(relatorio, "a") as f:
+            f.write("999,lixo de escrita interrompida")
+
+        # Retoma do PRIMEIRO checkpoint: o lote 2 é refeito e o lixo é truncado
+        ck = conciliar_totais(TestSession, relatorio, checkpoints[0])
+        assert _ids_relatorio(relatorio) == notas_conciliacao
+        assert ck["notas"] == 30 and ck["divergentes"] == 4
+
+
+class TestComandoEJob:
+
+    def test_cli_retorna_1_com_divergencias(self, notas_conciliacao, tmp_path, monkeypatch):
+        monkeypatch.setattr("app.database.SessionLocal", TestSession)
+        relatorio = str(tmp_path / "cli.csv")
+        assert cli(["conciliar-totais", "--relatorio", relatorio]) == 1
+        assert _ids_relatorio(relatorio) == notas_conciliacao
+        assert not (tmp_path / "cli.csv.checkpoint.json").exists()
+
+    def test_job_de_conciliacao(self, client, notas_conciliacao):
+        response = client.post("/v2/jobs/conciliacao")
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        assert app.state.jobs.executar_pendentes() == 1
+
+        job = client.get(f"/v2/jobs/{job_id}").json()
+        assert job["status"] == "concluido" and job["processados"] == 30
+        resultado = client.get(f"/v2/jobs/{job_id}/resultado")
+        assert resultado.headers["content-type"].startswith("text/csv")
+        ids = [int(l["nota_id"]) for l in csv.DictReader(resultado.text.splitlines())]
+        assert ids == notas_conciliacao
@@ -0,0 +1,158 @@
+"""
+Arquivo frio em Parquet
+=======================
+Notas anteriores ao corte saem do banco para Parquet particionado por mês
+e emitente. Busca e relatório continuam respondendo sobre o histórico
+inteiro, mesclando banco e arquivo.
+
+Business Driver: anos de notas fora do banco OLTP (índices e vacuum
+menores) sem perder consultas históricas.
+"""
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import func, select
+
+from app import arquivo_frio
+from app.arquivo_frio import ArquivoFrio
+from app.main import app
+from app.models import Alteracao, ItemNota, NotaFiscal
+
+from conftest import engine_test
+
+# arquivar() abre conexões próprias pelo engine
+pytestmark = pytest.mark.commit_real
+
+CORTE = datetime(2026, 1, 2)  # seed: notas de hora em hora a partir de 2026-01-01 01:00
+
+
+@pytest.fixture
+def arquivo(tmp_path, monkeypatch):
+    arquivo = ArquivoFrio(str(tmp_path / "frio"))
+    monkeypatch.setattr(app.state, "arquivo", arquivo)
+    return arquivo
+
+
+def _contar(db, modelo):
+    return db.scalar(select(func.count()).select_from(modelo))
+
+
+class TestArquivamento:
+
+    def test_move_notas_antigas_com_itens(self, db_session, seed_notas, arquivo):
+        resumo = arquivo.arquivar(engine_test, CORTE)
+        assert (resumo.notas, resumo.itens) == (23, 23)  # 01:00 até 23:00
+        assert _contar(db_session, NotaFiscal) == 27
+        assert _contar(db_session, ItemNota) == 27
+
+        arquivos = list(Path(arquivo.raiz).rglob("*.parquet"))
+        assert {p.parent.parent.name for p in arquivos} == {"ano_mes=2026-01"}
+        assert {p.parent.name for p in arquivos} == {
+            f"emitente_cnpj={11222333000100 + r:014d}" for r in range(3)
+        }
+        nota = arquivo.buscar(limit=1, colunas=["id", "itens"])[0]
+        assert [i["quantidade"] for i in nota.itens] == [2]
+
+    def test_feed_recebe_delete_das_notas_arquivadas(self, client, db_session, seed_notas, arquivo):
+        since = db_session.scalar(select(func.max(Alteracao.seq)))
+        arquivadas = {n.id for n in seed_notas if n.data_emissao < CORTE}
+        arquivo.arquivar(engine_test, CORTE)
+
+        feed = client.get("/v2/changes", params={"since": since, "limit": 100}).json()
+        assert {a["entidade_id"] for a in feed["alteracoes"]} == arquivadas
+        assert {(a["operacao"], a["dados"]) for a in feed["alteracoes"]} == {("delete", None)}
+
+    def test_dry_run_nao_altera_nada(self, db_session, seed_notas, arquivo):
+        assert arquivo.arquivar(engine_test, CORTE, executar=False).notas == 23
+        assert _contar(db_session, NotaFiscal) == 50
+        assert not arquivo.ativo
+
+    def test_queda_entre_gravar_e_apagar_nao_duplica(self, client, seed_notas, arquivo, monkeypatch):
+        def queda(*args):
+            raise RuntimeError("processo morreu")
+
+        monkeypatch.setattr(arquivo_frio, "delete", queda)
+        with pytest.raises(RuntimeError):
+            arquivo.arquivar(engine_test, CORTE)
+        # Notas no banco E no arquivo: a busca mostra cada uma uma vez
+        assert len({n["id"] for n in _paginar(client, {"limit": 20})}) == 50
+
+        monkeypatch.undo()
+        monkeypatch.setattr(app.state, "arquivo", arquivo)
+        assert arquivo.arquivar(engine_test, CORTE).notas == 23
+        assert len(arquivo.buscar(limit=100)) == 23  # mesmos arquivos regravados
+
+
+    def test_relatorio_nao_conta_duas_vezes_o_lote_pendente(self, client, seed_notas, arquivo,
+                                                             monkeypatch):
+        antes = client.get("/v2/relatorios/emitentes").json()
+
+        def queda(*args):
+            raise RuntimeError("processo morreu")
+
+        monkeypatch.setattr(arquivo_frio, "delete", queda)
+        with pytest.raises(RuntimeError):
+            arquivo.arquivar(engine_test, CORTE)
+        assert arquivo.ativo and arquivo.ids_pendentes()
+        assert client.get("/v2/relatorios/emitentes").json() == antes
+
+    def test_queda_e_nova_execucao_com_outro_corte(self, seed_notas, arquivo, monkeypatch):
+        def queda(*args):
+            raise RuntimeError("processo morreu")
+
+        monkeypatch.setattr(arquivo_frio, "delete", queda)
+        with pytest.raises(RuntimeError):
+            arquivo.arquivar(engine_test, datetime(2026, 1, 1, 12))  # 11 notas gravadas
+        assert len(arquivo.ids_pendentes()) == 11
+
+        monkeypatch.undo()
+        assert arquivo.arquivar(engine_test, CORTE).notas == 23
+        ids = [n.id for n in arquivo.buscar(limit=100, colunas=["id"])]
+        assert len(ids) == len(set(ids)) == 23  # o lote da queda não ficou duplicado
+        assert arquivo.ids_pendentes() == []
+
+
+class TestLeitura:
+
+    def test_filtros_e_ordem_no_arquivo(self, seed_notas, arquivo):
+        arquivo.arquivar(engine_test, CORTE)
+        emitente = "11222333000101"
+        notas = arquivo.buscar(limit=100, emitente_cnpj=emitente, valor_min=70.0)
+        assert notas and all(n.emitente_cnpj == emitente and n.valor_total >= 70 for n in notas)
+        chaves = [(n.data_emissao, n.id) for n in notas]
+        assert chaves == sorted(chaves, reverse=True)
+
+    def test_busca_mescla_banco_e_arquivo_com_cursor(self, client, seed_notas, arquivo):
+        antes = [n["id"] for n in _paginar(client, {"limit": 7})]
+        arquivo.arquivar(engine_test, CORTE)
+        depois = [n["id"] for n in _paginar(client, {"limit": 7})]
+        assert depois == antes and len(depois) == 50
+
+    def test_busca_com_filtro_de_cnpj_mescla(self, client, seed_notas, arquivo):
+        params = {"cnpj": "11222333000102", "limit": 5}
+        antes = [n["id"] for n in _paginar(client, params)]
+        arquivo.arquivar(engine_test, CORTE)
+        assert [n["id"] for n in _paginar(client, params)] == antes
+
+    def test_relatorio_por_emitente_igual_antes_e_depois(self, client, seed_notas, arquivo):
+        antes = client.get("/v2/relatorios/emitentes").json()
+        arquivo.arquivar(engine_test, CORTE)
+        depois = client.get("/v2/relatorios/emitentes").json()
+        assert depois == antes
+        assert sum(r["notas"] for r in depois) == 50
+
+        so_janeiro_1 = client.get("/v2/relatorios/emitentes",
+                                  params={"data_fim": "2026-01-02T00:00:00"}).json()
+        assert sum(r["notas"] for r in so_janeiro_1) == 23
+
+
+def _paginar(client, params):
+    notas, cursor = [], None
+    while True:
+        response = client.get("/v2/notas/busca", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        notas += response.json()
+        cursor = response.headers.get("X-Proximo-Cursor")
+        if not cursor:
+            return notas
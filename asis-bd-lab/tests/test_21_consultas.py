@@ -0,0 +1,103 @@
+"""
+Caminho quente de consultas
+===========================
+Nota por id, produto por id e baixa de estoque usam statements Core
+pré-compilados (app/consultas.py) — mesmas respostas, menos trabalho no
+Python por request, e a baixa de estoque sai em um único UPDATE RETURNING.
+
+Business Driver: esses três endpoints são os mais chamados; o custo fixo
+por request pesa mais que o SQL.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+
+from app import consultas
+from app.replicas import _eh_leitura
+from bench.consultas import medir
+
+from conftest import engine_test
+
+
+@contextmanager
+def _sql_executado():
+    executados = []
+
+    def registrar(conn, cursor, statement, *args):
+        executados.append(" ".join(statement.split()).upper())
+
+    event.listen(engine_test, "before_cursor_execute", registrar)
+    try:
+        yield executados
+    finally:
+        event.remove(engine_test, "before_cursor_execute", registrar)
+
+
+class TestConsultas:
+
+    def test_nota_resumo(self, client, seed_notas):
+        nota = seed_notas[0]
+        resposta = client.get(f"/v2/notas/{nota.id}")
+        assert resposta.status_code == 200
+        corpo = resposta.json()
+        corpo.pop("correlation_id")
+        assert corpo == {
+            "id": nota.id, "numero": nota.numero,
+            "valor_total": nota.valor_total, "status": nota.status,
+        }
+        assert client.get("/v2/notas/999999").status_code == 404
+
+    def test_produto_igual_ao_orm(self, client, db_session, seed_produtos):
+        produto = seed_produtos[3]
+        linha = consultas.produto(db_session, produto.id)
+        assert linha.codigo == produto.codigo and linha.version == produto.version
+
+        resposta = client.get(f"/v2/produtos/{produto.id}")
+        assert resposta.status_code == 200
+        assert resposta.json() == {
+            "id": produto.id, "codigo": produto.codigo, "descricao": produto.descricao,
+            "ncm": produto.ncm, "preco_unitario": produto.preco_unitario,
+            "estoque": produto.estoque, "version": produto.version,
+        }
+        assert client.get("/v2/produtos/999999").status_code == 404
+
+    def test_baixa_de_estoque_sem_select(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        version = produto.version
+        with _sql_executado() as executados:
+            resposta = client.put(f"/v2/produtos/{produto.id}/estoque",
+                                  params={"quantidade": -3, "version": version})
+        assert resposta.json() == {"id": produto.id, "estoque": 97, "version": version + 1}
+        em_produtos = [s for s in executados if "PRODUTOS" in s]
+        assert len(em_produtos) == 1 and em_produtos[0].startswith("UPDATE")
+        assert "RETURNING" in em_produtos[0]
+
+    def test_versao_antiga_conflita(self, client, db_session, seed_produtos):
+        produto = seed_produtos[0]
+        version = produto.version
+        assert consultas.atualizar_estoque(db_session, produto.id, version + 1, 5) is None
+        assert consultas.atualizar_estoque(db_session, 999999, version, 5) is None
+        db_session.rollback()
+
+        url = f"/v2/produtos/{produto.id}/estoque"
+        assert client.put(url, params={"quantidade": 1, "version": version}).status_code == 200
+        assert client.put(url, params={"quantidade": 1, "version": version}).status_code == 409
+
+    def test_execute_ler_vai_para_replica(self):
+        assert _eh_leitura(text("EXECUTE ler_produto(:id)"))
+        assert not _eh_leitura(text("EXECUTE atualizar_estoque(:b_id, :b_version, :b_quantidade)"))
+
+    def test_preparadas_cobrem_o_caminho_quente(self):
+        assert set(consultas.PREPARADAS) == {"ler_nota_resumo", "ler_produto", "atualizar_estoque"}
+        for tipos, sql, params in consultas.PREPARADAS.values():
+            assert tipos.count(",") == params.count(",") == sql.count("$") - 1
+
+
+class TestBench:
+
+    @pytest.mark.commit_real  # medir() abre a própria sessão no engine
+    def test_medir(self, db_session):
+        resultado = medir(engine_test, 20)
+        assert set(resultado) == {"nota por id", "produto por id", "baixa de estoque"}
+        assert all(orm > 0 and quente > 0 for orm, quente in resultado.values())
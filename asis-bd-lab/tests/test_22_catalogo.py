@@ -0,0 +1,168 @@
+"""
+Catálogo de produtos em memória
+===============================
+GET /v2/produtos?ncm_prefix= é servido de um snapshot em arrays com índice
+de prefixo de NCM, atualizado de forma incremental pelo `version` dos
+produtos. Escritas no mesmo processo aparecem no próximo acesso.
+
+Business Driver: leituras de catálogo são muito mais frequentes que
+escritas; não precisam de uma ida ao banco por request.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event, update
+
+from app.catalogo import Catalogo, Snapshot
+from app.importacao import produtos_existentes
+from app.models import Produto
+
+from conftest import engine_test
+
+
+@contextmanager
+def _sql_executado():
+    sqls = []
+
+    def capturar(conn, cursor, statement, *args):
+        if "SAVEPOINT" not in statement:  # transação do teste (conftest)
+            sqls.append(statement)
+
+    event.listen(engine_test, "before_cursor_execute", capturar)
+    try:
+        yield sqls
+    finally:
+        event.remove(engine_test, "before_cursor_execute", capturar)
+
+
+class TestPrefixoNcm:
+
+    def test_prefixo_seleciona_faixa_em_ordem_de_ncm(self, client, seed_produtos):
+        # seed: NCM 20000001 ... 20000010
+        capitulo = client.get("/v2/produtos?ncm_prefix=20&limit=100").json()
+        assert [p["ncm"] for p in capitulo] == sorted(p.ncm for p in seed_produtos)
+
+        assert len(client.get("/v2/produtos?ncm_prefix=2000000").json()) == 9
+        assert [p["ncm"] for p in client.get("/v2/produtos?ncm_prefix=2000001").json()] == ["20000010"]
+        assert client.get("/v2/produtos?ncm_prefix=9").json() == []
+
+    def test_resposta_igual_a_do_banco(self, client, seed_produtos):
+        memoria = client.get("/v2/produtos?ncm_prefix=20000003").json()
+        assert memoria == [client.get(f"/v2/produtos/{seed_produtos[2].id}").json()]
+
+    def test_paginacao_e_campos(self, client, seed_produtos):
+        pagina = client.get("/v2/produtos?ncm_prefix=2&limit=3&offset=3&fields=id,ncm").json()
+        assert pagina == [{"id": p.id, "ncm": p.ncm} for p in seed_produtos[3:6]]
+
+    def test_prefixo_negocia_o_formato(self, client, seed_produtos):
+        objetos = client.get("/v2/produtos?ncm_prefix=20").json()
+        response = client.get("/v2/produtos?ncm_prefix=20",
+                              headers={"Accept": "application/vnd.asis.colunar+json"})
+        assert response.headers["content-type"] == "application/vnd.asis.colunar+json"
+        corpo = response.json()
+        assert [dict(zip(corpo["columns"], linha)) for linha in corpo["rows"]] == objetos
+
+    def test_entradas_invalidas_retornam_422(self, client, seed_produtos):
+        assert client.get("/v2/produtos?ncm_prefix=22a").status_code == 422
+        assert client.get("/v2/produtos?ncm_prefix=123456789").status_code == 422
+        assert client.get("/v2/produtos?ncm_prefix=20&fields=senha").status_code == 422
+
+    def test_segunda_leitura_nao_vai_ao_banco(self, client, seed_produtos):
+        client.get("/v2/produtos?ncm_prefix=20")
+        with _sql_executado() as sqls:
+            assert len(client.get("/v2/produtos?ncm_prefix=20").json()) == 10
+        assert sqls == []
+
+    def test_escrita_aparece_na_leitura_seguinte(self, client, seed_produtos):
+        produto = seed_produtos[0]
+        version = produto.version
+        client.get("/v2/produtos?ncm_prefix=20")
+        client.put(f"/v2/produtos/{produto.id}/estoque",
+                   params={"quantidade": -7, "version": version})
+        atual = client.get(f"/v2/produtos?ncm_prefix={produto.ncm}").json()[0]
+        assert (atual["estoque"], atual["version"]) == (93, version + 1)
+
+
+class TestAtualizacao:
+
+    def test_incremental_le_so_o_que_mudou(self, db_session, seed_produtos):
+        catalogo = Catalogo(intervalo_s=0)
+        assert catalogo.atualizar(db_session) == 10  # carga completa
+        assert catalogo.atualizar(db_session) == 0
+
+        db_session.execute(
+            update(Produto).where(Produto.id == seed_produtos[4].id)
+            .values(estoque=1, version=Produto.version + 1)
+        )
+        db_session.add(Produto(codigo="NOVO-1", descricao="Novo", ncm="22030000",
+                               preco_unitario=9.9, estoque=3))
+        db_session.delete(seed_produtos[9])
+        db_session.commit()
+
+        assert catalogo.atualizar(db_session) == 2  # o alterado e o novo
+        snapshot = catalogo.snapshot
+        assert len(snapshot) == 10
+        assert snapshot.por_id(seed_produtos[4].id)["estoque"] == 1
+        assert snapshot.por_id(seed_produtos[9].id) is None
+        assert snapshot.por_codigo("NOVO-1")["ncm"] == "22030000"
+        assert [p["codigo"] for p in snapshot.por_prefixo_ncm("2203", 10)] == ["NOVO-1"]
+
+    def test_escrita_sem_version_aparece_na_recarga_completa(self, db_session, seed_produtos):
+        catalogo = Catalogo(intervalo_s=0, recarga_s=3600)
+        catalogo.atualizar(db_session)
+        db_session.execute(update(Produto).where(Produto.id == seed_produtos[0].id).values(estoque=0))
+        db_session.commit()
+        catalogo.atualizar(db_session)
+        assert catalogo.snapshot.por_id(seed_produtos[0].id)["estoque"] == 100
+
+        catalogo.recarga_s = 0
+        catalogo.atualizar(db_session)
+        assert catalogo.snapshot.por_id(seed_produtos[0].id)["estoque"] == 0
+
+    def test_invalidar_durante_a_verificacao_nao_se_perde(self, db_session, seed_produtos,
+                                                           monkeypatch):
+        catalogo = Catalogo(intervalo_s=3600)
+        catalogo.obter(db_session)
+        execute = db_session.execute
+
+        def escrita_no_meio(*args, **kwargs):
+            resultado = execute(*args, **kwargs)
+            catalogo.invalidar()  # outro request escreveu depois desta leitura
+            return resultado
+
+        catalogo.invalidar()
+        monkeypatch.setattr(db_session, "execute", escrita_no_meio)
+        catalogo.obter(db_session)
+        monkeypatch.undo()
+
+        with _sql_executado() as sqls:
+            catalogo.obter(db_session)
+        assert sqls  # a verificação que começou antes da escrita não conta
+        with _sql_executado() as sqls:
+            catalogo.obter(db_session)
+        assert sqls == []
+
+    def test_snapshot_sem_objeto_por_produto(self):
+        snapshot = Snapshot.de_linhas([
+            (2, "B", "Cerveja de malte", "22030000", 5.0, 10, 1),
+            (1, "A", "Água mineral", "22011000", 2.0, 5, 3),
+        ])
+        assert snapshot.ids.tolist() == [1, 2]
+        assert snapshot.descricoes == "Água mineralCerveja de malte"
+        assert snapshot.por_id(2)["descricao"] == "Cerveja de malte"
+        assert [p["id"] for p in snapshot.por_prefixo_ncm("220", 10)] == [1, 2]
+
+
+class TestLote:
+
+    def test_produtos_do_catalogo_nao_sao_consultados(self, db_session, seed_produtos):
+        conhecidos = Catalogo(intervalo_s=0).obter(db_session).ids
+        conhecido = {"produto_id": seed_produtos[0].id}
+        with _sql_executado() as sqls:
+            encontrados = produtos_existentes(db_session, [{"itens": [conhecido]}], conhecidos)
+        assert encontrados.tolist() == [seed_produtos[0].id] and sqls == []
+
+        # Fora do catálogo: vai ao banco só pelos que faltam
+        notas = [{"itens": [conhecido, {"produto_id": 999}]}]
+        with _sql_executado() as sqls:
+            encontrados = produtos_existentes(db_session, notas, conhecidos)
+        assert encontrados.tolist() == [seed_produtos[0].id] and len(sqls) == 1
@@ -0,0 +1,143 @@
+"""
+Diagnóstico de memória
+======================
+/v2/admin/memoria expõe RSS, gc, identity maps das sessões vivas e
+snapshots/diffs do tracemalloc — só para administradores. O modo soak do
+bench usa esses endpoints para falhar quando a memória do servidor cresce.
+
+Business Driver: descobrir vazamentos (ex.: /v1/notas carregando tudo)
+antes do OOM killer derrubar o pod.
+"""
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+from jose import jwt
+
+from app.diagnostico import DiagnosticoMemoria, identity_maps
+from app.main import ALGORITHM, SECRET_KEY
+from bench.cenarios import listar_v1, obter_produto
+from bench.metricas import Amostras
+from bench.soak import avaliar, executar_soak, medir_memoria
+
+from conftest import TestSession
+
+
+def _token(usuario: str) -> dict:
+    token = jwt.encode({"sub": usuario, "exp": datetime.utcnow() + timedelta(minutes=5)},
+                       SECRET_KEY, algorithm=ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+ADMIN = _token("admin")
+
+
+@pytest.fixture(autouse=True)
+def _desligar_tracemalloc():
+    yield
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+class TestAcesso:
+
+    def test_exige_token_de_admin(self, client):
+        assert client.get("/v2/admin/memoria").status_code == 401
+        assert client.get("/v2/admin/memoria",
+                          headers={"Authorization": "Bearer invalido"}).status_code == 401
+        assert client.get("/v2/admin/memoria", headers=_token("aluno")).status_code == 403
+        assert client.post("/v2/admin/memoria/tracemalloc",
+                           headers=_token("aluno")).status_code == 403
+        assert not tracemalloc.is_tracing()
+
+
+class TestResumo:
+
+    def test_rss_gc_e_tracemalloc(self, client):
+        corpo = client.get("/v2/admin/memoria?coletar=true", headers=ADMIN).json()
+        assert corpo["rss_bytes"] > 0 and corpo["rss_pico_bytes"] >= corpo["rss_bytes"]
+        assert corpo["gc"]["coletados"] >= 0 and len(corpo["gc"]["geracoes"]) == 3
+        assert corpo["gc"]["objetos_rastreados"] > 0
+        assert corpo["tracemalloc"] == {
+            "ativo": False, "frames": 1, "rastreado_bytes": 0,
+            "rastreado_pico_bytes": 0, "snapshots": [],
+        }
+
+    def test_identity_map_por_sessao(self, db_session, seed_notas):
+        db_session.expunge_all()
+        outra = TestSession()
+        try:
+            notas = outra.query(type(seed_notas[0])).limit(7).all()
+            [sessao] = [s for s in identity_maps()["maiores"] if s["sessao"] == f"{id(outra):x}"]
+            assert sessao["objetos"] == len(notas) == 7
+            assert sessao["por_classe"] == {"NotaFiscal": 7} and sessao["em_transacao"]
+        finally:
+            outra.close()
+
+
+class TestTracemalloc:
+
+    def test_snapshot_exige_tracemalloc_ligado(self, client):
+        assert client.post("/v2/admin/memoria/snapshots", headers=ADMIN).status_code == 409
+
+    def test_diff_mostra_o_que_cresceu(self, client):
+        ligado = client.post("/v2/admin/memoria/tracemalloc?frames=5", headers=ADMIN).json()
+        assert ligado["ativo"] and ligado["frames"] == 5
+
+        base = client.post("/v2/admin/memoria/snapshots", headers=ADMIN)
+        assert base.status_code == 201 and base.json()["top"]
+        retido = [bytearray(1024) for _ in range(2000)]  # ~2 MB alocados aqui
+        atual = client.post("/v2/admin/memoria/snapshots", headers=ADMIN).json()["id"]
+
+        diff = client.get(f"/v2/admin/memoria/snapshots/{atual}/diff",
+                          params={"base": base.json()["id"], "limit": 3}, headers=ADMIN).json()
+        maior = diff["diferencas"][0]
+        assert maior["local"].split(":")[0] == __file__
+        assert maior["diferenca_bytes"] >= 2000 * 1024 and maior["diferenca_blocos"] >= 2000
+        del retido
+
+        assert client.get(f"/v2/admin/memoria/snapshots/{atual}/diff?base=999",
+                          headers=ADMIN).status_code == 404
+        assert client.delete("/v2/admin/memoria/tracemalloc", headers=ADMIN).status_code == 204
+        assert not tracemalloc.is_tracing()
+
+    def test_guarda_poucos_snapshots(self):
+        diagnostico = DiagnosticoMemoria(max_snapshots=2)
+        diagnostico.iniciar()
+        ids = [diagnostico.capturar() for _ in range(3)]
+        assert list(diagnostico.snapshots) == ids[1:]
+        with pytest.raises(KeyError):
+            diagnostico.top(ids[0])
+        diagnostico.parar()
+        assert diagnostico.snapshots == {}
+
+
+class TestSoak:
+
+    def test_avaliar_limites(self):
+        inicial = {"pid": 1, "rss_mb": 100.0, "retido_mb": 1.0}
+        assert avaliar(inicial, {"pid": 1, "rss_mb": 140.0, "retido_mb": 10.0}, 50, 20) == []
+        violacoes = avaliar(inicial, {"pid": 1, "rss_mb": 200.0, "retido_mb": 30.0}, 50, 20)
+        assert len(violacoes) == 2 and violacoes[0].startswith("RSS cresceu 100.0 MB")
+        assert "reiniciado" in avaliar(inicial, {**inicial, "pid": 2}, 50, 20)[0]
+
+    def test_soak_contra_a_api(self, client, seed_notas):
+        client.headers.update(ADMIN)
+
+        def rodar(cenario, segundos):
+            amostras = Amostras(duracao_s=segundos)
+            for semente in range(5):
+                status, esperados = cenario(client, random.Random(semente))
+                amostras.latencias_ms.append(1.0)
+                amostras.erros += status not in esperados
+            return amostras
+
+        relatorio = executar_soak(client, rodar, [listar_v1, obter_produto], duracao=2,
+                                  aquecimento=1, medicoes=2, max_rss_mb=500, max_retido_mb=50)
+        assert relatorio["violacoes"] == [] and relatorio["trafego"]["requests"] == 10
+        assert relatorio["trafego"]["taxa_erro"] == 0
+        assert len(relatorio["memoria"]["serie"]) == 3
+        assert relatorio["maiores_crescimentos"]
+        assert not tracemalloc.is_tracing()
+        assert set(medir_memoria(client)) == {"pid", "rss_mb", "retido_mb", "objetos_gc", "objetos_orm"}